@@ -1,18 +1,37 @@
 # -*- coding: UTF-8 -*-
 
+import os
+import threading
 from flask import Flask
-from flask_bootstrap import Bootstrap
 from flask_mail import Mail
-# flask_moment是一个集成moment.js到Jinja2模板的Flask扩展
-from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from .database import RoutingSQLAlchemy
+from .fragment_cache import FragmentCache
+from .page_cache import PageCache
+from .last_seen import LastSeenTracker
+from .user_cache import UserCache
+from .search import SearchIndex
+from .metrics import Metrics
+from .jobs import JobQueue
+from .passwords import PasswordHasher
+from .ratelimit import RateLimiter
+from .avatars import Avatars
+from .assets import Assets
 import config
 
-bootstrap = Bootstrap()
 mail = Mail()
-moment = Moment()
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
+fragment_cache = FragmentCache()
+page_cache = PageCache()
+last_seen_tracker = LastSeenTracker()
+user_cache = UserCache()
+search_index = SearchIndex()
+metrics = Metrics()
+job_queue = JobQueue()
+password_hasher = PasswordHasher()
+rate_limiter = RateLimiter()
+avatars = Avatars()
+assets = Assets()
 
 login_manager = LoginManager()
 # LoginManager 对象的session_protection 属性可以设为None、'basic' 或'strong'，以提
@@ -22,16 +41,90 @@ login_manager.session_protection = 'strong'
 login_manager.login_view = 'auth.login'
 
 
-def create_app(config_name):
-    app = Flask(__name__)
-    app.config.from_object(config.config[config_name])
-    config.config[config_name].init_app(app)
+class Flasky(Flask):
+    """FLASKY_LAZY_INIT为真时，扩展初始化与蓝本导入推迟到第一次创建应用上下文或处理请求时。
+
+    工作进程预先创建应用后再fork时，后台线程、连接池等在各子进程中才创建；
+    只需要配置的命令（如shell、--help）也不必付出完整初始化的代价。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(Flasky, self).__init__(*args, **kwargs)
+        self._setup = None
+        self._setup_running = False
+        self._setup_lock = threading.RLock()
+
+    def defer(self, setup):
+        self._setup = setup
+
+    def ensure_setup(self):
+        if self._setup is None:
+            return
+        with self._setup_lock:                  # 其他线程等待初始化完成
+            if self._setup is None or self._setup_running:
+                return                          # 初始化过程中本线程再次创建上下文
+            self._setup_running = True
+            try:
+                self._setup(self)
+                self._setup = None
+            finally:
+                self._setup_running = False
+
+    def app_context(self):
+        self.ensure_setup()
+        return super(Flasky, self).app_context()
+
+    def request_context(self, environ):
+        self.ensure_setup()
+        return super(Flasky, self).request_context(environ)
+
+
+def _template_cache(app):
+    # 模板编译结果缓存在磁盘上，新进程直接加载字节码，不必重新解析模板
+    cache_dir = app.config.get('FLASKY_TEMPLATE_CACHE_DIR')
+    if cache_dir:
+        from jinja2 import FileSystemBytecodeCache
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        app.jinja_options = dict(app.jinja_options,
+                                 bytecode_cache=FileSystemBytecodeCache(cache_dir))
+
+
+def compile_templates(app):
+    """编译全部模板写入字节码缓存，部署时执行一次，新进程首次渲染即可直接加载。返回模板数。"""
+    app.ensure_setup()                          # 蓝本的模板目录在初始化时才注册
+    env = app.jinja_env
+    names = env.list_templates(extensions=('html', 'txt'))
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+def _setup(app):
+    # flask_bootstrap、flask_moment只在渲染模板时用到，导入较慢，放到初始化时再导入
+    from flask_bootstrap import Bootstrap
+    # flask_moment是一个集成moment.js到Jinja2模板的Flask扩展
+    from flask_moment import Moment
 
     login_manager.init_app(app)
-    bootstrap.init_app(app)
+    Bootstrap(app)
     mail.init_app(app)
-    moment.init_app(app)
+    Moment(app)
     db.init_app(app)
+    fragment_cache.init_app(app)
+    page_cache.init_app(app)
+    last_seen_tracker.init_app(app)
+    user_cache.init_app(app)
+    search_index.init_app(app)
+    metrics.init_app(app)
+    job_queue.init_app(app)
+    password_hasher.init_app(app)
+    rate_limiter.init_app(app)
+    avatars.init_app(app)
+    assets.init_app(app)                        # 需要在Bootstrap之后，打包其静态文件
+
+    from . import timeline                      # 注册发文时写入粉丝时间线的事件
+    from . import email                         # 注册邮件发送任务
 
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
@@ -39,4 +132,33 @@ def create_app(config_name):
     from .auth import auth as auth_blueprint
     app.register_blueprint(auth_blueprint, url_prefix='/auth')
 
+    from .api import api as api_blueprint
+    app.register_blueprint(api_blueprint, url_prefix='/api/v1')
+
+
+def _proxy_fix(app):
+    # 部署在nginx等反向代理之后时，按受信任的代理层数从X-Forwarded-For还原客户端地址，
+    # 否则所有客户端共用代理的地址，按IP限流会把所有人一起拒绝；为0时不信任这些请求头
+    proxies = app.config.get('FLASKY_PROXY_COUNT', 0)
+    if not proxies:
+        return
+    try:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+    except ImportError:                         # Werkzeug 0.14
+        from werkzeug.contrib.fixers import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, num_proxies=proxies)
+
+
+def create_app(config_name):
+    app = Flasky(__name__)
+    app.config.from_object(config.config[config_name])
+    config.config[config_name].init_app(app)
+    _template_cache(app)
+    _proxy_fix(app)
+
+    if app.config.get('FLASKY_LAZY_INIT'):
+        app.defer(_setup)
+    else:
+        _setup(app)
     return app
@@ -0,0 +1,7 @@
+# -*- coding: UTF-8 -*-
+
+from flask import Blueprint
+
+api = Blueprint('api', __name__)
+
+from . import posts, users, errors
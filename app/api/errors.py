@@ -0,0 +1,18 @@
+# -*- coding: UTF-8 -*-
+# API出错时总是返回JSON，不依赖客户端的Accept头
+
+from .responses import json_response
+from . import api
+
+
+def bad_request(message):
+    response = json_response({'error': 'bad request', 'message': message})
+    response.status_code = 400
+    return response
+
+
+@api.errorhandler(404)
+def not_found(e):
+    response = json_response({'error': 'not found'})
+    response.status_code = 404
+    return response
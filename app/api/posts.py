@@ -0,0 +1,88 @@
+# -*- coding: UTF-8 -*-
+
+from flask import current_app, request, url_for
+from .. import db
+from ..decorators import read_only
+from ..models import Post, User
+from ..pagination import keyset_paginate
+from . import api
+from .errors import bad_request
+from .responses import conditional, isoformat, json_response, ndjson_response
+
+
+def post_query():                               # 只取序列化用到的列，不构造ORM对象
+    return db.session.query(Post.id, Post.timestamp, Post.body,
+                            Post.body_html, User.name.label('author')) \
+        .join(User, User.id == Post.author_id)
+
+
+def post_json(row):
+    return {
+        'id': row.id,
+        'author': row.author,
+        'timestamp': isoformat(row.timestamp),
+        'body': row.body,
+        'body_html': row.body_html,
+    }
+
+
+def per_page_arg():
+    try:
+        per_page = int(request.args.get(
+            'limit', current_app.config['FLASKY_POSTS_PER_PAGE']))
+    except ValueError:
+        return None
+    if not 0 < per_page <= current_app.config['FLASKY_API_MAX_PER_PAGE']:
+        return None
+    return per_page
+
+
+def paginated_posts(query, endpoint, **values):
+    """按游标分页输出文章，prev、next为相邻页的完整地址，没有时为null。"""
+    per_page = per_page_arg()
+    if per_page is None:
+        return bad_request('limit must be between 1 and %d' %
+                           current_app.config['FLASKY_API_MAX_PER_PAGE'])
+    pagination = keyset_paginate(query, Post.timestamp, Post.id, per_page,
+                                 before=request.args.get('before'),
+                                 after=request.args.get('after'))
+    prev = next = None
+    if pagination.prev_cursor:
+        prev = url_for(endpoint, after=pagination.prev_cursor,
+                       limit=per_page, _external=True, **values)
+    if pagination.next_cursor:
+        next = url_for(endpoint, before=pagination.next_cursor,
+                       limit=per_page, _external=True, **values)
+    return json_response({
+        'posts': [post_json(row) for row in pagination.items],
+        'prev': prev,
+        'next': next,
+    })
+
+
+@api.route('/posts/')
+@read_only
+@conditional
+def get_posts():
+    return paginated_posts(post_query(), 'api.get_posts')
+
+
+@api.route('/posts/<int:id>')
+@read_only
+@conditional
+def get_post(id):
+    return json_response(post_json(
+        post_query().filter(Post.id == id).first_or_404()))
+
+
+# 全部文章按id顺序逐行输出，since_id用于断点续传；服务端游标按批读取，内存占用与总数无关
+@api.route('/posts/stream')
+@conditional
+def stream_posts():
+    query = post_query().order_by(Post.id)
+    since_id = request.args.get('since_id', type=int)
+    if since_id is not None:
+        query = query.filter(Post.id > since_id)
+    rows = query.execution_options(stream_results=True).yield_per(
+        current_app.config['FLASKY_API_STREAM_BATCH'])
+    return ndjson_response(rows, post_json)
@@ -0,0 +1,52 @@
+# -*- coding: UTF-8 -*-
+# API响应：紧凑JSON、逐行输出的NDJSON流，以及基于内容版本号的条件GET
+
+import hashlib
+import json
+from functools import wraps
+from flask import current_app, request, stream_with_context
+from ..page_cache import PageCache
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+def isoformat(dt):                              # 时间均为UTC
+    return dt.isoformat() + 'Z' if dt else None
+
+
+def json_response(obj):
+    return current_app.response_class(_dumps(obj),
+                                      mimetype='application/json')
+
+
+def ndjson_response(rows, serialize):
+    """逐行序列化rows并流式输出，rows应为按批读取的查询，不一次性载入内存。"""
+    def generate():
+        for row in rows:
+            yield _dumps(serialize(row)) + '\n'
+    return current_app.response_class(stream_with_context(generate()),
+                                      mimetype=NDJSON_MIMETYPE)
+
+
+def conditional(f):
+    # ETag由数据库中的内容版本号（文章或公开资料变化时加1，见PageCache.content_version）与URL得出，
+    # 各进程一致；轮询客户端带If-None-Match且内容未变时只查询版本号，直接返回304
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        etag = hashlib.sha1(('%d:%s' % (PageCache.content_version(),
+                                        request.full_path))
+                            .encode('utf-8')).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.cache_control.no_cache = True  # 每次都需向服务器验证
+        return response
+    return decorated_function
@@ -0,0 +1,63 @@
+# -*- coding: UTF-8 -*-
+
+from flask import current_app, request, url_for
+from .. import avatars, db
+from ..decorators import read_only
+from ..models import Post, User
+from . import api
+from .posts import paginated_posts, post_query
+from .responses import conditional, isoformat, json_response, ndjson_response
+
+# 不输出last_seen：它不更换内容版本号，输出后条件GET会返回过期数据
+USER_COLUMNS = (User.id, User.name, User.location, User.about_me,
+                User.member_since, User.avatar_hash, User.followers_count,
+                User.post_count, User.last_post_at)
+
+
+def user_json(row):
+    avatar = request.host_url.rstrip('/') + avatars.url(row.avatar_hash, 256)
+    return {
+        'id': row.id,
+        'name': row.name,
+        'location': row.location,
+        'about_me': row.about_me,
+        'member_since': isoformat(row.member_since),
+        'avatar': avatar,
+        'followers': row.followers_count,
+        'posts': row.post_count,
+        'last_post_at': isoformat(row.last_post_at),
+    }
+
+
+@api.route('/users/<name>')
+@read_only
+@conditional
+def get_user(name):
+    row = db.session.query(*USER_COLUMNS).filter(User.name == name) \
+        .first_or_404()
+    result = user_json(row)
+    result['posts_url'] = url_for('api.get_user_posts', name=name,
+                                  _external=True)
+    return json_response(result)
+
+
+@api.route('/users/<name>/posts/')
+@read_only
+@conditional
+def get_user_posts(name):
+    user_id = db.session.query(User.id).filter(User.name == name) \
+        .first_or_404().id
+    return paginated_posts(post_query().filter(Post.author_id == user_id),
+                           'api.get_user_posts', name=name)
+
+
+@api.route('/users/stream')
+@conditional
+def stream_users():
+    query = db.session.query(*USER_COLUMNS).order_by(User.id)
+    since_id = request.args.get('since_id', type=int)
+    if since_id is not None:
+        query = query.filter(User.id > since_id)
+    rows = query.execution_options(stream_results=True).yield_per(
+        current_app.config['FLASKY_API_STREAM_BATCH'])
+    return ndjson_response(rows, user_json)
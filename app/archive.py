@@ -0,0 +1,75 @@
+# -*- coding: UTF-8 -*-
+# 文章冷热分离：早于FLASKY_ARCHIVE_AFTER_DAYS天的文章分批移入归档表（可在单独的归档库中），
+# posts表及其索引只保留近期文章；主页与用户页翻过热数据的末尾时才查询归档
+
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.orm import joinedload
+from . import db, search_index
+from .models import ArchivedPost, Post, TimelineEntry, User
+from .page_cache import PageCache
+from .pagination import keyset_paginate
+
+COLUMNS = ('id', 'body', 'body_html', 'timestamp', 'author_id')
+
+
+def enabled():
+    return current_app.config.get('FLASKY_ARCHIVE_AFTER_DAYS') is not None
+
+
+def cutoff():                                   # 归档中的文章都早于该时间，分页据此判断是否需要查询归档
+    return datetime.utcnow() - timedelta(
+        days=current_app.config['FLASKY_ARCHIVE_AFTER_DAYS'])
+
+
+def archive_posts(batch_size=1000):
+    """按(时间戳, id)顺序把早于截止时间的文章分批移入归档，每批一个事务。
+
+    每批先写归档再从posts删除（连同时间线条目）：中途失败时重跑会跳过已归档的文章，
+    不会丢失也不会重复。文章计数不变，归档文章仍计入作者的文章数。
+    每批提交后清空整页缓存并从检索索引删除已归档的文章。
+    每批完成后产生(已归档条数, 本批最后一篇的时间戳)，供调用方输出进度。
+    """
+    before = cutoff()
+    posts, timeline = Post.__table__, TimelineEntry.__table__
+    done = 0
+    while True:
+        rows = db.session.query(*[getattr(Post, name) for name in COLUMNS]) \
+            .filter(Post.timestamp < before) \
+            .order_by(Post.timestamp, Post.id).limit(batch_size).all()
+        if not rows:
+            break
+        ids = [row.id for row in rows]
+        existing = set(id for id, in db.session.query(ArchivedPost.id)
+                       .filter(ArchivedPost.id.in_(ids)))
+        db.session.bulk_insert_mappings(ArchivedPost, [
+            dict(zip(COLUMNS, row)) for row in rows if row.id not in existing])
+        db.session.commit()
+        db.session.execute(timeline.delete().where(timeline.c.post_id.in_(ids)))
+        db.session.execute(posts.delete().where(posts.c.id.in_(ids)))
+        db.session.commit()
+        PageCache.purge()                       # 分页结果变化，API的ETag随之更换
+        search_index.remove_posts(ids)          # 检索结果只从posts表读取文章
+        done += len(rows)
+        yield done, rows[-1].timestamp
+
+
+def paginate_posts(query, per_page, before=None, after=None, author_id=None):
+    """按(时间戳, id)游标分页文章，启用归档且游标越过热数据时从归档继续。
+
+    归档库可能与users不在同一个数据库，不能JOIN，页面上归档文章的作者用一次查询载入会话。
+    """
+    archive = None
+    if enabled():
+        archived = ArchivedPost.query
+        if author_id is not None:
+            archived = archived.filter(ArchivedPost.author_id == author_id)
+        archive = (archived, ArchivedPost.timestamp, ArchivedPost.id, cutoff())
+    pagination = keyset_paginate(query, Post.timestamp, Post.id, per_page,
+                                 before=before, after=after, archive=archive)
+    author_ids = set(post.author_id for post in pagination.items
+                     if isinstance(post, ArchivedPost))
+    if author_ids and author_id is None:        # 用户页的作者已在会话中
+        User.query.options(joinedload(User.role)) \
+            .filter(User.id.in_(author_ids)).all()
+    return pagination
@@ -0,0 +1,179 @@
+# -*- coding: UTF-8 -*-
+# 静态资源打包：把app/static与Flask-Bootstrap自带的CSS、JS、字体复制到输出目录，
+# 文件名带内容哈希，同时预先生成gzip（装有brotli时还有br）压缩版本，映射写入manifest.json。
+# 带哈希的文件内容不会变化，浏览器可永久缓存；模板通过asset_url()取得当前文件名
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import posixpath
+import re
+from flask import current_app, url_for
+from werkzeug.security import safe_join
+
+try:
+    import brotli                               # 可选依赖，未安装时只生成gzip版本
+except ImportError:
+    brotli = None
+
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.eot', '.ttf', '.ico', '.json',
+                '.txt')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))    # 按优先顺序协商
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")\s]+)\1\s*\)''')
+SOURCE_MAP = re.compile(r'(sourceMappingURL=)([^\s*]+)')
+
+
+def sources(app):
+    """返回[(逻辑名前缀, 目录)]：应用的static目录与Flask-Bootstrap的静态文件目录。"""
+    result = [('', app.static_folder)]
+    bootstrap = app.blueprints.get('bootstrap')
+    if bootstrap is not None:
+        result.append(('bootstrap/', bootstrap.static_folder))
+    return result
+
+
+def _walk(prefix, folder):
+    for root, dirs, files in os.walk(folder):
+        for filename in files:
+            path = os.path.join(root, filename)
+            yield prefix + os.path.relpath(path, folder).replace(os.sep, '/'), path
+
+
+def _hashed_name(name, data):
+    root, ext = posixpath.splitext(name)
+    return '%s.%s%s' % (root, hashlib.md5(data).hexdigest()[:10], ext)
+
+
+def _rewrite(name, data, manifest):
+    """把CSS中的url(...)与sourceMappingURL改写为已打包文件带哈希的文件名。"""
+    base = posixpath.dirname(name)
+
+    def replace(ref):
+        if ref.startswith(('data:', '/', '#')) or '://' in ref:
+            return ref
+        path, suffix = re.match(r'([^?#]*)(.*)', ref).groups()
+        hashed = manifest.get(posixpath.normpath(posixpath.join(base, path)))
+        if hashed is None:                      # 引用的文件不存在（如未随包发布的source map）
+            return ref
+        return path[:len(path) - len(posixpath.basename(path))] + \
+            posixpath.basename(hashed) + suffix
+    text = data.decode('utf-8')
+    if name.endswith('.css'):
+        text = CSS_URL.sub(lambda m: 'url(%s%s%s)' % (
+            m.group(1), replace(m.group(2)), m.group(1)), text)
+    text = SOURCE_MAP.sub(lambda m: m.group(1) + replace(m.group(2)), text)
+    return text.encode('utf-8')
+
+
+def _gzip(data):
+    buf = io.BytesIO()                          # mtime=0使相同内容的压缩结果相同
+    with gzip.GzipFile(filename='', mode='wb', fileobj=buf, compresslevel=9,
+                       mtime=0) as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+def _write(path, data):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build(app, directory):
+    """打包全部静态资源到directory并写出manifest，返回{逻辑名: 带哈希的文件名}。
+
+    旧版本的文件保留在目录中，部署切换期间仍引用旧文件名的页面不会失效。
+    """
+    files = {}
+    for prefix, folder in sources(app):
+        files.update(_walk(prefix, folder))
+    manifest = {}
+    # CSS、JS引用字体、source map等文件，先打包被引用的文件，改写引用后再计算哈希
+    for name in sorted(files, key=lambda name: (name.endswith(('.css', '.js')),
+                                                name)):
+        with open(files[name], 'rb') as f:
+            data = f.read()
+        if name.endswith(('.css', '.js')):
+            data = _rewrite(name, data, manifest)
+        hashed = _hashed_name(name, data)
+        path = os.path.join(directory, *hashed.split('/'))
+        _write(path, data)
+        if posixpath.splitext(name)[1] in COMPRESSIBLE:
+            variants = [('.gz', _gzip(data))]
+            if brotli is not None:
+                variants.append(('.br', brotli.compress(data)))
+            for suffix, compressed in variants:
+                if len(compressed) < len(data):
+                    _write(path + suffix, compressed)
+        manifest[name] = hashed
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class _Assets(object):
+    def __init__(self, sources, directory):
+        self.sources = sources
+        self.directory = directory
+        self.manifest = None                    # 为None时未打包，直接提供源文件
+        if directory and os.path.isfile(os.path.join(directory, MANIFEST)):
+            with open(os.path.join(directory, MANIFEST)) as f:
+                self.manifest = json.load(f)
+        self.urls = {}
+
+    def _source(self, name):
+        for prefix, folder in self.sources:
+            if name.startswith(prefix):
+                path = safe_join(folder, name[len(prefix):])
+                if path is not None and os.path.isfile(path):
+                    return path
+        return None
+
+    def url(self, name):                        # 资源不存在时返回None
+        url = self.urls.get(name)
+        if url is None:
+            if self.manifest is not None:
+                filename = self.manifest.get(name)
+            else:
+                filename = name if self._source(name) else None
+            if filename is None:
+                return None
+            url = self.urls[name] = url_for('main.asset', filename=filename)
+        return url
+
+    def find(self, filename, accept_encodings):
+        """返回(文件路径, 内容编码, 是否为带哈希的文件)，找不到时返回None。"""
+        if self.manifest is None:
+            path = self._source(filename)
+            return (path, None, False) if path else None
+        path = safe_join(self.directory, filename)
+        if path is None or not os.path.isfile(path):
+            return None
+        for encoding, suffix in ENCODINGS:
+            if accept_encodings[encoding] and os.path.isfile(path + suffix):
+                return path + suffix, encoding, True
+        return path, None, True
+
+
+class Assets(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['assets'] = _Assets(
+            sources(app), app.config.get('FLASKY_ASSETS_DIR'))
+        app.add_template_global(Assets.url, 'asset_url')
+
+    @staticmethod
+    def url(name):
+        return current_app.extensions['assets'].url(name)
+
+    @staticmethod
+    def find(filename, accept_encodings):
+        return current_app.extensions['assets'].find(filename, accept_encodings)
@@ -1,18 +1,21 @@
 # -*- coding: UTF-8 -*-
 
-from flask import render_template, redirect, url_for, flash
+from flask import render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user,  login_required, current_user
 from . import auth
 from .. models import User
 from .forms import LoginForm, RegistrationForm
-from .. import db
+from .. import db, last_seen_tracker, user_cache
+from ..decorators import rate_limit
+from ..ratelimit import remote_addr, form_field
 
 
 # 每次请求前运行
 @auth.before_app_request
 def before_request():
-    if current_user.is_authenticated():             # 如果通过验证的用户登录，更新最后登录时间
-        current_user.ping()
+    # 如果通过验证的用户登录，记录最后访问时间（静态文件除外），由last_seen_tracker批量写入
+    if current_user.is_authenticated() and request.endpoint != 'static':
+        last_seen_tracker.touch(current_user.id)
         # if not current_user.confirmed \
         #         and request.endpoint \
         #         and request.blueprint != 'auth' \
@@ -22,14 +25,19 @@ def before_request():
 
 # 登录路由
 @auth.route('/login', methods=['GET', 'POST'])
+@rate_limit('login-ip', remote_addr, methods=('POST',))
+@rate_limit('login-account', form_field('email'), methods=('POST',))
 def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         if user is not None and user.verify_password(form.password.data):
-            login_user(user, form.remember_me.data)
-            return redirect(url_for('main.index'))
-        flash('Invalid username or password.')
+            db.session.commit()                 # 保存重算后的密码哈希
+            if login_user(user, form.remember_me.data):     # 已停用的账号返回False
+                return redirect(url_for('main.index'))
+            flash('This account has been deactivated.')
+        else:
+            flash('Invalid username or password.')
     return render_template('auth/login.html', form=form)
 
 
@@ -37,6 +45,7 @@ def login():
 @auth.route('/logout')
 @login_required
 def logout():
+    user_cache.invalidate(current_user.id)
     logout_user()
     flash('You have been logged out.')
     return redirect(url_for('main.index'))
@@ -44,6 +53,7 @@ def logout():
 
 # 注册路由
 @auth.route('/register', methods=['GET', 'POST'])
+@rate_limit('register-ip', remote_addr, methods=('POST',))
 def register():
     form = RegistrationForm()
     if form.validate_on_submit():
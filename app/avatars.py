@@ -0,0 +1,162 @@
+# -*- coding: UTF-8 -*-
+# 头像代理：/avatar/<hash>/<size>从本地磁盘缓存返回头像，未命中时向Gravatar取一次，
+# 取不到或不能联网时生成确定的identicon（SVG），页面不再直接引用第三方地址。
+# 只有本站用户的哈希才会访问Gravatar并写入磁盘，其他哈希直接返回identicon
+
+import os
+import tempfile
+import time
+from flask import current_app, url_for
+from .cache import LRUCache
+
+try:
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+except ImportError:                             # Python 2
+    from urllib2 import urlopen, HTTPError
+
+GRAVATAR_URL = 'https://secure.gravatar.com/avatar'
+DEFAULT_HASH = '0' * 32                         # 没有邮箱的用户使用的占位哈希
+EXTENSIONS = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/gif': 'gif',
+              'image/svg+xml': 'svg'}
+MIMETYPES = dict((ext, mimetype) for mimetype, ext in EXTENSIONS.items())
+
+
+def valid_hash(hash):
+    return len(hash) == 32 and all(c in '0123456789abcdef' for c in hash)
+
+
+def _known(hash):
+    from . import db
+    from .models import User                    # 延迟导入，避免与models循环引用
+    return db.session.query(User.id).filter(User.avatar_hash == hash) \
+        .first() is not None
+
+
+def identicon(hash, size):
+    """由哈希生成5x5左右对称的图案，同一哈希结果相同。"""
+    color = '#%02x%02x%02x' % tuple(       # 颜色取哈希末尾三字节，压到中等亮度
+        48 + int(hash[i:i + 2], 16) * 3 // 5 for i in (26, 28, 30))
+    cells = []
+    for i in range(15):                         # 前15位十六进制数决定左侧三列，右侧镜像
+        if int(hash[i], 16) % 2 == 0:
+            row, col = i % 5, i // 5
+            cells.append((col, row))
+            if col < 2:
+                cells.append((4 - col, row))
+    rects = ''.join('<rect x="%d" y="%d" width="1" height="1"/>' % cell
+                    for cell in sorted(cells))
+    return ('<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" '
+            'viewBox="-0.5 -0.5 6 6" shape-rendering="crispEdges">'
+            '<rect x="-0.5" y="-0.5" width="6" height="6" fill="#f0f0f0"/>'
+            '<g fill="%s">%s</g></svg>' % (size, size, color, rects)) \
+        .encode('ascii')
+
+
+class _Avatars(object):
+    def __init__(self, cache_dir, fetch, timeout, cache_timeout):
+        self.cache_dir = cache_dir              # 为None时不写磁盘
+        self.fetch = fetch                      # 为False时不访问Gravatar，直接使用identicon
+        self.timeout = timeout
+        self.cache_timeout = cache_timeout      # 磁盘缓存有效期（秒），过期后重新向Gravatar获取
+        self.urls = LRUCache(maxsize=10000, default_timeout=0)
+
+    def _path(self, hash, size, ext):
+        return os.path.join(self.cache_dir, hash[:2],
+                            '%s-%d.%s' % (hash, size, ext))
+
+    def _read(self, hash, size):
+        for ext in MIMETYPES:
+            path = self._path(hash, size, ext)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_mtime + self.cache_timeout < time.time():
+                return None
+            with open(path, 'rb') as f:
+                return f.read(), MIMETYPES[ext]
+        return None
+
+    def _write(self, hash, size, data, mimetype):
+        path = self._path(hash, size, EXTENSIONS[mimetype])
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:                     # 其他进程已创建
+                pass
+        for ext in MIMETYPES:                   # 删除其他格式的旧文件
+            old = self._path(hash, size, ext)
+            if old != path and os.path.exists(old):
+                os.remove(old)
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as f:          # 先写临时文件再改名，读者不会看到半个文件
+            f.write(data)
+        os.rename(tmp, path)
+
+    def _fetch(self, hash, size):
+        """返回(数据, MIME类型)；用户没有Gravatar头像时返回None，网络错误时抛出异常。"""
+        try:
+            response = urlopen('%s/%s?s=%d&d=404&r=g' % (GRAVATAR_URL, hash, size),
+                               timeout=self.timeout)
+        except HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+        mimetype = response.headers.get('Content-Type', '').split(';')[0]
+        if mimetype not in EXTENSIONS:
+            raise ValueError('Unexpected avatar type %r' % mimetype)
+        return response.read(), mimetype
+
+    def get(self, hash, size):
+        """返回(数据, MIME类型, 是否可长期缓存)。"""
+        if self.cache_dir:
+            cached = self._read(hash, size)
+            if cached is not None:
+                return cached + (True,)
+        if not _known(hash):                    # 任意哈希都可请求，不能因此访问外网、占用磁盘
+            return identicon(hash, size), 'image/svg+xml', False
+        result, durable = None, True
+        if self.fetch:
+            try:
+                result = self._fetch(hash, size)
+            except Exception as e:              # 网络故障时临时返回identicon，不写入磁盘
+                current_app.logger.warning('Avatar fetch failed for %s: %s',
+                                           hash, e)
+                durable = False
+        if result is None:
+            result = identicon(hash, size), 'image/svg+xml'
+        if self.cache_dir and durable:
+            self._write(hash, size, *result)
+        return result + (durable,)
+
+    def url(self, hash, size):                  # 同一(哈希, 尺寸)的地址只生成一次
+        hash = hash or DEFAULT_HASH
+        key = '%s/%d' % (hash, size)
+        url = self.urls.get(key)
+        if url is None:
+            url = url_for('main.avatar', hash=hash, size=size)
+            self.urls.set(key, url)
+        return url
+
+
+class Avatars(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['avatars'] = _Avatars(
+            app.config.get('FLASKY_AVATAR_CACHE_DIR'),
+            app.config.get('FLASKY_AVATAR_FETCH', True),
+            app.config.get('FLASKY_AVATAR_FETCH_TIMEOUT', 2),
+            app.config.get('FLASKY_AVATAR_CACHE_TIMEOUT', 7 * 86400))
+
+    @staticmethod
+    def get(hash, size):
+        return current_app.extensions['avatars'].get(hash, size)
+
+    @staticmethod
+    def url(hash, size):
+        return current_app.extensions['avatars'].url(hash, size)
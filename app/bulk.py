@@ -0,0 +1,84 @@
+# -*- coding: UTF-8 -*-
+# 批量用户管理：按条件选出用户，分块执行集合式UPDATE，每块一个事务，不再逐个加载、保存。
+# 查询级UPDATE不触发ORM事件，块内用户的缓存、角色表缓存与整页缓存在这里显式失效
+
+from datetime import datetime, timedelta
+from . import db, user_cache
+from .page_cache import PageCache
+from .models import User, Role, role_permissions
+
+ACTIONS = ('role', 'deactivate', 'activate')
+
+
+def user_criteria(role_id=None, email_domain=None, inactive_days=None,
+                  ids=None, exclude=None):
+    """由筛选条件生成WHERE子句列表，条件之间为与关系；不传任何条件时匹配全部用户。"""
+    criteria = []
+    if role_id is not None:
+        criteria.append(User.role_id == role_id)
+    if email_domain:
+        criteria.append(User.email.like('%@' + email_domain.lstrip('@')))
+    if inactive_days is not None:               # 最后访问早于inactive_days天前
+        criteria.append(User.last_seen <
+                        datetime.utcnow() - timedelta(days=inactive_days))
+    if ids:
+        criteria.append(User.id.in_(ids))
+    if exclude:                                 # 如执行操作的管理员本人
+        criteria.append(~User.id.in_(exclude))
+    return criteria
+
+
+def count_users(criteria):
+    return db.session.query(db.func.count(User.id)).filter(*criteria).scalar()
+
+
+def update_users(criteria, values, chunk_size=1000):
+    """对满足criteria的用户执行UPDATE users SET values，按id每chunk_size个用户提交一次。
+
+    每块完成后产生(已更新条数, 最后一个id)，供调用方输出进度。
+    """
+    done, last_id = 0, 0
+    while True:
+        ids = [user_id for user_id, in db.session.query(User.id)
+               .filter(User.id > last_id, *criteria)
+               .order_by(User.id).limit(chunk_size)]
+        if not ids:
+            break
+        db.session.query(User).filter(User.id.in_(ids)) \
+            .update(values, synchronize_session=False)
+        db.session.commit()
+        for user_id in ids:
+            user_cache.invalidate(user_id)
+        PageCache.purge()
+        done += len(ids)
+        last_id = ids[-1]
+        yield done, last_id
+
+
+def apply(action, criteria, role_id=None, chunk_size=1000):
+    """执行ACTIONS中的一种批量操作，action为'role'时把用户改为role_id对应的角色。"""
+    if action == 'role':
+        if role_id is None:
+            raise ValueError('A role is required to reassign users')
+        values = {User.role_id: role_id}
+    elif action in ('deactivate', 'activate'):
+        values = {User.active: action == 'activate'}
+    else:
+        raise ValueError('Unknown bulk action %r' % action)
+    return update_users(criteria, values, chunk_size)
+
+
+def change_permissions(role_names=None, grant=0, revoke=0):
+    """在一条UPDATE中为角色加上grant、去掉revoke中的权限位，返回修改的角色数。
+
+    权限属于角色，修改后拥有这些角色的所有用户随之生效。role_names为空时修改全部角色。
+    """
+    query = Role.query
+    if role_names:
+        query = query.filter(Role.name.in_(role_names))
+    count = query.update(
+        {Role.permissions: Role.permissions.op('|')(grant).op('&')(~revoke)},
+        synchronize_session=False)
+    db.session.commit()
+    role_permissions.invalidate()
+    return count
@@ -0,0 +1,147 @@
+# -*- coding: UTF-8 -*-
+# 可插拔缓存存储：进程内LRU（带TTL）或Redis兼容存储，统一get/get_many/set/delete接口
+
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    text_type = unicode                         # Python 2
+except NameError:
+    text_type = str
+
+
+class LRUCache(object):
+    def __init__(self, maxsize=1024, default_timeout=300):
+        self.maxsize = maxsize
+        self.default_timeout = default_timeout
+        self._data = OrderedDict()              # key -> (过期时间, 值)，按最近使用排序
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires <= time.time():
+                return None
+            self._data[key] = entry              # 重新插入到末尾，标记为最近使用
+            return value
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        expires = time.time() + timeout if timeout else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.maxsize:   # 淘汰最久未使用的条目
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class LocalRedis(object):
+    # 本地Redis替身，实现redis-py客户端的常用子集，供开发和测试使用
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _alive(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires is not None and expires <= time.time():
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, name):
+        with self._lock:
+            return self._alive(name)
+
+    def mget(self, keys):
+        with self._lock:
+            return [self._alive(key) for key in keys]
+
+    def set(self, name, value, ex=None):
+        if not isinstance(value, bytes):
+            value = text_type(value).encode('utf-8')   # Python 2中str()无法转换中文
+        with self._lock:
+            self._data[name] = (time.time() + ex if ex else None, value)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return len([self._data.pop(name) for name in names
+                        if name in self._data])
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+        return True
+
+
+class RedisCache(object):
+    def __init__(self, client, prefix='', default_timeout=300):
+        self.client = client
+        self.prefix = prefix
+        self.default_timeout = default_timeout
+
+    @staticmethod
+    def _decode(value):
+        return value.decode('utf-8') if value is not None else None
+
+    def get(self, key):
+        return self._decode(self.client.get(self.prefix + key))
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        return [self._decode(value) for value in
+                self.client.mget([self.prefix + key for key in keys])]
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        self.client.set(self.prefix + key, value, ex=timeout or None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):                            # 仅供测试，会清空整个库
+        self.client.flushdb()
+
+
+_local_redis = LocalRedis()
+
+
+def make_store(app, namespace, maxsize=1024, default_timeout=300):
+    """按FLASKY_CACHE_TYPE创建存储，'lru'为进程内LRU，'redis'为Redis兼容存储。
+
+    FLASKY_CACHE_REDIS_URL为空时使用进程内的LocalRedis替身。
+    """
+    cache_type = app.config.get('FLASKY_CACHE_TYPE', 'lru')
+    if cache_type == 'lru':
+        return LRUCache(maxsize, default_timeout)
+    if cache_type == 'redis':
+        url = app.config.get('FLASKY_CACHE_REDIS_URL')
+        if url:
+            import redis                        # 可选依赖，仅在配置了Redis地址时需要
+            client = redis.StrictRedis.from_url(url)
+        else:
+            client = _local_redis
+        return RedisCache(client, prefix=namespace + ':',
+                          default_timeout=default_timeout)
+    raise ValueError('Unknown cache type %r' % cache_type)
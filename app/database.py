@@ -0,0 +1,86 @@
+# -*- coding: UTF-8 -*-
+# 数据库扩展：按环境配置连接池参数，只读视图的查询路由到只读副本，写入始终走主库
+
+import random
+from flask import g, has_app_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.sql.expression import Select
+
+try:                                            # gevent下每个协程一个会话，线程下每个线程一个
+    from greenlet import getcurrent as _session_scope
+except ImportError:
+    try:
+        from threading import get_ident as _session_scope
+    except ImportError:
+        from thread import get_ident as _session_scope  # Python 2
+
+REPLICA_BIND_PREFIX = 'replica_'
+ARCHIVE_BIND = 'archive'
+# SQLite使用SingletonThreadPool/StaticPool，不接受这些连接池参数（显式指定poolclass时除外）
+_QUEUE_POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+
+class RoutingSession(SignallingSession):
+    _replica_bind = None                        # 每个会话固定使用同一个副本
+
+    def _routable(self, mapper, clause):        # 只有未指定bind的SELECT才可发往副本
+        if self._flushing or (clause is not None and
+                              not isinstance(clause, Select)):
+            return False
+        if mapper is not None:
+            table = getattr(mapper, 'persist_selectable', None)
+            if table is None:
+                table = mapper.mapped_table     # SQLAlchemy 1.2
+            if table.info.get('bind_key') is not None:
+                return False
+        return has_app_context() and g.get('read_only', False)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._routable(mapper, clause):
+            db = self.app.extensions['sqlalchemy'].db
+            replicas = db.replica_binds(self.app)
+            if replicas:
+                if self._replica_bind is None:
+                    self._replica_bind = random.choice(replicas)
+                return db.get_engine(self.app, bind=self._replica_bind)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def init_app(self, app):
+        # FLASKY_DB_REPLICAS中的每个地址注册为一个名为replica_N的bind
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for i, uri in enumerate(app.config.get('FLASKY_DB_REPLICAS') or []):
+            binds[REPLICA_BIND_PREFIX + str(i)] = uri
+        # 启用归档时，归档表使用名为archive的bind，未指定归档库地址时与主库相同
+        if app.config.get('FLASKY_ARCHIVE_AFTER_DAYS') is not None:
+            binds[ARCHIVE_BIND] = app.config.get('FLASKY_ARCHIVE_DATABASE_URL') or \
+                app.config['SQLALCHEMY_DATABASE_URI']
+        app.config['SQLALCHEMY_BINDS'] = binds or None
+        super(RoutingSQLAlchemy, self).init_app(app)
+
+    @staticmethod
+    def replica_binds(app):
+        return sorted(key for key in (app.config.get('SQLALCHEMY_BINDS') or {})
+                      if key.startswith(REPLICA_BIND_PREFIX))
+
+    def create_scoped_session(self, options=None):
+        # 会话按协程/线程隔离，不依赖Flask-SQLAlchemy各版本默认的作用域函数
+        options = dict(options or {})
+        options.setdefault('scopefunc', _session_scope)
+        return super(RoutingSQLAlchemy, self).create_scoped_session(options)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, info, options):
+        rv = super(RoutingSQLAlchemy, self).apply_driver_hacks(
+            app, info, options)
+        engine_options = dict(app.config.get('FLASKY_DB_ENGINE_OPTIONS') or {})
+        if info.drivername.startswith('sqlite') and \
+                'poolclass' not in engine_options:
+            for key in _QUEUE_POOL_OPTIONS:
+                engine_options.pop(key, None)
+        options.update(engine_options)
+        return rv
@@ -2,9 +2,11 @@
 # 检查用户权限的装饰器，用法同flask_login提供login_required
 
 from functools import wraps
-from flask import abort
+from flask import abort, g, request
 from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
 from .models import Permission
+from .ratelimit import RateLimiter
 
 
 def permission_required(permission):
@@ -20,3 +22,34 @@ def permission_required(permission):
 
 def admin_required(f):
     return permission_required(Permission.ADMIN)(f)
+
+
+def read_only(f):
+    # 标记只读视图，GET/HEAD请求中的查询可路由到只读副本
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.read_only = request.method in ('GET', 'HEAD')
+        try:
+            return f(*args, **kwargs)
+        finally:
+            g.read_only = False
+    return decorated_function
+
+
+def rate_limit(scope, key_func, methods=None):
+    # 令牌桶限流，在视图执行前检查，被拒绝的请求不会访问数据库或计算密码哈希；
+    # 可叠加多个，如分别按IP与登录账号限流
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if methods is None or request.method in methods:
+                key = key_func()
+                retry_after = RateLimiter.hit(scope, key) \
+                    if key is not None else None
+                if retry_after is not None:
+                    e = TooManyRequests()
+                    e.retry_after = retry_after
+                    raise e
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
@@ -0,0 +1,35 @@
+# -*- coding: UTF-8 -*-
+# 邮件发送：请求中只把邮件入队，由后台任务通过Flask-Mail发送
+
+import logging
+from flask_mail import Message
+from . import job_queue, mail
+
+
+@job_queue.task('deliver_email')
+def deliver_email(to, subject, sender, body, html=None):
+    msg = Message(subject, sender=sender, recipients=to)
+    msg.body = body
+    msg.html = html
+    mail.send(msg)
+
+
+class QueuedMailHandler(logging.Handler):
+    """错误报告邮件处理器，替代同步发送的SMTPHandler，出错的请求不必等待邮件服务器。"""
+
+    def __init__(self, app, toaddrs, subject):
+        super(QueuedMailHandler, self).__init__()
+        self.app = app
+        self.toaddrs = toaddrs
+        self.subject = subject
+
+    def emit(self, record):
+        if hasattr(record, 'job'):             # 任务队列自身的日志不再发邮件，避免循环入队
+            return
+        try:
+            with self.app.app_context():
+                deliver_email.delay(self.toaddrs, self.subject,
+                                    self.app.config['FLASKY_MAIL_SENDER'],
+                                    self.format(record))
+        except Exception:
+            self.handleError(record)
@@ -0,0 +1,105 @@
+# -*- coding: UTF-8 -*-
+# 生成测试数据：批量插入用户与文章，不逐行提交；
+# bulk_insert_mappings不触发映射器事件，每批提交后显式清空整页缓存
+# 文章作者服从幂律分布（少数用户写大部分文章），时间分布在过去一年内，越近越密集
+
+import hashlib
+import random
+from datetime import datetime, timedelta
+import forgery_py
+from . import db, password_hasher
+from .models import User, Role, Post, recount_posts
+from .page_cache import PageCache
+from .rendering import render_body_html
+
+FAKE_PASSWORD = 'password'                      # 所有生成用户的密码，供登录压测使用
+
+
+def _batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _recent(days=365):                          # 近期时间戳出现的概率更高
+    return datetime.utcnow() - timedelta(
+        seconds=int(random.betavariate(1, 3) * days * 86400))
+
+
+def users(count=100, batch_size=1000):
+    role_id = Role.query.filter_by(default=True).first().id
+    password_hash = password_hasher.hash(FAKE_PASSWORD)     # 哈希计算代价高，所有用户共用
+    start = db.session.query(db.func.count(User.id)).scalar()
+
+    def rows():
+        for i in range(start, start + count):
+            # 名称与邮箱附加序号，保证唯一
+            email = '%d.%s' % (i, forgery_py.internet.email_address())
+            member_since = _recent()
+            yield {
+                'email': email[:64],
+                'name': '%s%d' % (forgery_py.internet.user_name(), i),
+                'password_hash': password_hash,
+                'role_id': role_id,
+                'location': forgery_py.address.city(),
+                'about_me': forgery_py.lorem_ipsum.sentence(),
+                'member_since': member_since,
+                'last_seen': member_since + timedelta(seconds=(
+                    datetime.utcnow() - member_since).total_seconds() *
+                    random.random()),           # Python 2不支持timedelta乘以浮点数
+                'avatar_hash': hashlib.md5(email[:64].encode('utf-8'))
+                .hexdigest(),
+            }
+    inserted = 0
+    for batch in _batches(rows(), batch_size):
+        db.session.bulk_insert_mappings(User, batch)
+        db.session.commit()
+        PageCache.purge()
+        inserted += len(batch)
+        yield inserted
+
+
+def posts(count=100, batch_size=1000):
+    user_ids = [id for id, in db.session.query(User.id).order_by(User.id)]
+    if not user_ids:
+        return
+    # 每个用户的写作活跃度服从帕累托分布
+    weights = [random.paretovariate(1.2) for _ in user_ids]
+    cumulative, total = [], 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+
+    def author():
+        r = random.random() * total
+        lo, hi = 0, len(cumulative) - 1
+        while lo < hi:                          # 按累积权重二分查找作者
+            mid = (lo + hi) // 2
+            if cumulative[mid] < r:
+                lo = mid + 1
+            else:
+                hi = mid
+        return user_ids[lo]
+
+    def rows():
+        for i in range(count):
+            body = forgery_py.lorem_ipsum.sentences(random.randint(1, 5))
+            yield {
+                'body': body,
+                'body_html': render_body_html(body),
+                'timestamp': _recent(),
+                'author_id': author(),
+            }
+    inserted = 0
+    for batch in _batches(rows(), batch_size):
+        db.session.bulk_insert_mappings(Post, batch)
+        db.session.commit()
+        PageCache.purge()
+        inserted += len(batch)
+        yield inserted
+    recount_posts()                             # 批量插入不触发映射器事件，最后统一重算作者计数
@@ -0,0 +1,56 @@
+# -*- coding: UTF-8 -*-
+# 文章列表片段缓存：每篇文章渲染后的HTML按(文章id, 内容版本)缓存。
+# 版本由片段用到的文章与作者字段算出，数据提交后读到新值即换用新键，
+# 旧条目不再命中、按LRU或TTL淘汰，多个进程各自使用进程内存储也不会读到过期片段
+
+import hashlib
+from flask import current_app, render_template
+from jinja2 import Markup
+from .cache import make_store
+
+RENDERED_POST_FIELDS = ('body', 'body_html', 'timestamp')   # 片段中用到的文章字段
+RENDERED_USER_FIELDS = ('name', 'avatar_hash')                # 片段中用到的作者字段
+
+
+def _version(post):
+    author = post.author
+    values = [getattr(post, field) for field in RENDERED_POST_FIELDS] + \
+        [getattr(author, field) if author is not None else None
+         for field in RENDERED_USER_FIELDS]
+    return hashlib.sha1(u'\x1f'.join(u'%s' % value for value in values)
+                        .encode('utf-8')).hexdigest()
+
+
+def _post_key(post):
+    return 'post:%d:%s' % (post.id, _version(post))
+
+
+class FragmentCache(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        store = None
+        if app.config.get('FLASKY_FRAGMENT_CACHE', True):
+            store = make_store(
+                app, 'fragment',
+                maxsize=app.config.get('FLASKY_FRAGMENT_CACHE_SIZE', 10000),
+                default_timeout=app.config.get(
+                    'FLASKY_FRAGMENT_CACHE_TIMEOUT', 3600))
+        app.extensions['fragment_cache'] = store
+        app.add_template_global(self.render_posts, 'render_posts')
+
+    def render_posts(self, posts):
+        store = current_app.extensions.get('fragment_cache')
+        if store is None:
+            return Markup(u''.join(render_template('_post.html', post=post)
+                                   for post in posts))
+        posts = list(posts)
+        keys = [_post_key(post) for post in posts]
+        fragments = store.get_many(keys)
+        for i, post in enumerate(posts):
+            if fragments[i] is None:              # 未命中时渲染并写回缓存
+                fragments[i] = render_template('_post.html', post=post)
+                store.set(keys[i], fragments[i])
+        return Markup(u''.join(fragments))
@@ -0,0 +1,248 @@
+# -*- coding: UTF-8 -*-
+# 进程内后台任务队列：任务先写入SQLite待办箱（进程重启后继续执行），由工作线程取出执行，
+# 失败后按指数退避重试，超过最大次数标记为failed。发邮件等慢操作不再阻塞请求
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from flask import current_app
+
+_tasks = {}                                     # 任务名 -> 函数，所有应用共用
+STOP_TIMEOUT = 10                               # 进程退出时等待正在执行的任务的最长时间（秒）
+
+
+class _Outbox(object):
+    def __init__(self, path, lease=600):
+        # 一个连接供所有线程共用，语句由锁串行；BEGIN IMMEDIATE保证多进程共用文件时不重复领取
+        self._conn = sqlite3.connect(path or ':memory:', isolation_level=None,
+                                     check_same_thread=False)
+        self._lock = threading.Lock()
+        # 领取超过lease秒仍未完成的任务视为领取者已退出，重新排队；应大于任务的最长执行时间
+        self.lease = lease
+        with self._lock:
+            if path:
+                self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'name TEXT NOT NULL, '
+                'payload TEXT NOT NULL, '
+                'attempts INTEGER NOT NULL DEFAULT 0, '
+                "status TEXT NOT NULL DEFAULT 'pending', "
+                'run_at REAL NOT NULL, '
+                'last_error TEXT, '
+                'claimed_at REAL, '
+                'owner INTEGER)')
+            columns = set(row[1] for row in
+                          self._conn.execute('PRAGMA table_info(jobs)'))
+            for column, type in (('claimed_at', 'REAL'), ('owner', 'INTEGER')):
+                if column not in columns:       # 旧版本创建的待办箱
+                    self._conn.execute('ALTER TABLE jobs ADD COLUMN %s %s' % (
+                        column, type))
+            self._conn.execute('CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at '
+                               'ON jobs (status, run_at)')
+
+    def put(self, name, payload, run_at):
+        with self._lock:
+            return self._conn.execute(
+                'INSERT INTO jobs (name, payload, run_at) VALUES (?, ?, ?)',
+                (name, payload, run_at)).lastrowid
+
+    def claim(self, now):                       # 领取一个到期任务，返回(id, name, payload, attempts)
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                # 其他进程仍在执行的任务不动，只收回租约过期的（领取者崩溃或被杀）
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'pending', claimed_at = NULL, "
+                    "owner = NULL WHERE status = 'running' AND "
+                    "(claimed_at IS NULL OR claimed_at <= ?)", (now - self.lease,))
+                row = self._conn.execute(
+                    "SELECT id, name, payload, attempts FROM jobs "
+                    "WHERE status = 'pending' AND run_at <= ? "
+                    "ORDER BY run_at, id LIMIT 1", (now,)).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', claimed_at = ?, "
+                        "owner = ? WHERE id = ?", (now, os.getpid(), row[0]))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            return row
+
+    def done(self, id):
+        with self._lock:
+            self._conn.execute('DELETE FROM jobs WHERE id = ?', (id,))
+
+    def retry(self, id, attempts, run_at, error):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = ?, run_at = ?, "
+                "last_error = ?, claimed_at = NULL, owner = NULL WHERE id = ?",
+                (attempts, run_at, error, id))
+
+    def fail(self, id, attempts, error):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', attempts = ?, "
+                "last_error = ? WHERE id = ?", (attempts, error, id))
+
+    def counts(self):                           # 各状态的任务数
+        with self._lock:
+            return dict(self._conn.execute(
+                'SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+
+class _Queue(object):
+    def __init__(self, app, outbox, workers, max_attempts, backoff,
+                 poll_interval):
+        self.app = app
+        self.outbox = outbox
+        self.workers = workers                  # 为0时不启动线程，由调用方执行work()（测试环境）
+        self.max_attempts = max_attempts
+        self.backoff = backoff                  # 第n次失败后等待backoff * 2 ** (n - 1)秒
+        self.poll_interval = poll_interval      # 空闲时检查重试任务是否到期的间隔（秒）
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    def enqueue(self, name, args, kwargs):
+        if name not in _tasks:
+            raise KeyError('Unknown job %r' % name)
+        id = self.outbox.put(name, json.dumps({'args': args, 'kwargs': kwargs}),
+                             time.time())
+        self.start()
+        self._wakeup.set()
+        return id
+
+    def run_one(self):                          # 执行一个到期任务，没有到期任务时返回False
+        row = self.outbox.claim(time.time())
+        if row is None:
+            return False
+        id, name, payload, attempts = row
+        payload = json.loads(payload)
+        attempts += 1
+        try:
+            with self.app.app_context():
+                _tasks[name](*payload['args'], **payload['kwargs'])
+        except Exception as e:
+            error = '%s: %s' % (type(e).__name__, e)
+            # extra标记任务日志，错误报告邮件处理器据此跳过，避免邮件发送失败时循环入队
+            if attempts >= self.max_attempts:
+                self.outbox.fail(id, attempts, error)
+                self.app.logger.error('Job %s #%d failed after %d attempts',
+                                      name, id, attempts, exc_info=True,
+                                      extra={'job': name})
+            else:
+                delay = self.backoff * 2 ** (attempts - 1)
+                self.outbox.retry(id, attempts, time.time() + delay, error)
+                self.app.logger.warning('Job %s #%d failed (%s), retrying in %ss',
+                                        name, id, error, delay,
+                                        extra={'job': name})
+        else:
+            self.outbox.done(id)
+        return True
+
+    def work(self):                             # 在当前线程执行全部到期任务，返回执行次数
+        count = 0
+        while self.run_one():
+            count += 1
+        return count
+
+    def run(self):                              # 工作线程主循环
+        while not self._stopped:
+            try:
+                if self.run_one():
+                    continue
+            except Exception:
+                self.app.logger.exception('Job worker error',
+                                          extra={'job': None})
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def start(self, workers=None):
+        """启动工作线程，已启动或已停止时不做任何事。
+
+        第一次入队时自动调用，只读取配置或执行命令的进程不会创建线程；
+        服务进程启动时调用，上次退出时未完成的任务不必等到下一次入队。
+        """
+        workers = self.workers if workers is None else workers
+        with self._start_lock:
+            if self._threads or self._stopped or not workers:
+                return
+            for i in range(workers):
+                thread = threading.Thread(target=self.run,
+                                          name='job-worker-%d' % i)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        atexit.register(_stop_at_exit, weakref.ref(self))
+
+    def stop(self, timeout=None):               # 通知工作线程退出，并等待当前任务完成
+        self._stopped = True
+        self._wakeup.set()
+        deadline = time.time() + timeout if timeout is not None else None
+        for thread in self._threads:
+            thread.join(None if deadline is None else
+                        max(deadline - time.time(), 0))
+        self._threads = []
+
+
+def _stop_at_exit(ref):
+    # 在解释器清理模块之前结束工作线程，否则守护线程可能在模块全局变量被清空后继续运行
+    queue = ref()
+    if queue is not None:
+        queue.stop(STOP_TIMEOUT)
+
+
+class JobQueue(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # 工作线程在第一次入队或调用start()时才启动
+        app.extensions['jobs'] = _Queue(
+            app,
+            _Outbox(app.config.get('FLASKY_JOBS_OUTBOX_PATH'),
+                    app.config.get('FLASKY_JOBS_LEASE', 600)),
+            app.config.get('FLASKY_JOBS_WORKERS', 2),
+            app.config.get('FLASKY_JOBS_MAX_ATTEMPTS', 5),
+            app.config.get('FLASKY_JOBS_BACKOFF', 2),
+            app.config.get('FLASKY_JOBS_POLL_INTERVAL', 1))
+
+    @staticmethod
+    def task(name=None):
+        """注册后台任务，被装饰函数获得delay(*args, **kwargs)方法用于入队。
+
+        参数会序列化为JSON写入待办箱，因此只能传递基本类型（如用户id而不是User对象）。
+        """
+        def decorator(f):
+            job_name = name or '%s.%s' % (f.__module__, f.__name__)
+            _tasks[job_name] = f
+            f.delay = lambda *args, **kwargs: JobQueue.enqueue(
+                job_name, *args, **kwargs)
+            return f
+        return decorator
+
+    @staticmethod
+    def enqueue(name, *args, **kwargs):
+        return current_app.extensions['jobs'].enqueue(name, list(args), kwargs)
+
+    @staticmethod
+    def start():
+        current_app.extensions['jobs'].start()
+
+    @staticmethod
+    def work():
+        return current_app.extensions['jobs'].work()
+
+    @staticmethod
+    def stats():
+        return current_app.extensions['jobs'].outbox.counts()
@@ -0,0 +1,128 @@
+# -*- coding: UTF-8 -*-
+# 最后访问时间批量写入：内存中暂存时间戳，分辨率窗口内不重复记录，按间隔批量UPDATE
+
+import atexit
+import threading
+import time
+import weakref
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import bindparam
+
+
+class _Tracker(object):
+    def __init__(self, app, resolution, interval):
+        self.app = app
+        self.resolution = resolution            # 同一用户两次记录的最小间隔（秒）
+        self.interval = interval                # 两次批量写入的最小间隔（秒）
+        self._pending = {}                      # user_id -> 待写入的last_seen
+        self._recorded = {}                     # user_id -> 最近一次记录时间（time.time）
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def touch(self, user_id):
+        now = time.time()
+        with self._lock:
+            if now - self._recorded.get(user_id, 0) < self.resolution:
+                return False
+            self._recorded[user_id] = now
+            self._pending[user_id] = datetime.utcnow()
+            return True
+
+    def flush_due(self):
+        return self._pending and \
+            time.time() - self._last_flush >= self.interval
+
+    def flush(self):                            # 一条executemany语句写入全部待更新用户
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = now = time.time()
+            for user_id, recorded in list(self._recorded.items()):
+                if now - recorded >= self.resolution:   # 清理过期记录，限制内存占用
+                    del self._recorded[user_id]
+        if not pending:
+            return 0
+        from . import db
+        from .models import User
+        stmt = User.__table__.update() \
+            .where(User.__table__.c.id == bindparam('user_id')) \
+            .values(last_seen=bindparam('seen'))
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    conn.execute(stmt, [{'user_id': user_id, 'seen': seen}
+                                        for user_id, seen in pending.items()])
+        except Exception:
+            self._restore(pending)
+            raise
+        return len(pending)
+
+    def _restore(self, pending):                # 写入失败时放回暂存，下次再写；同一用户保留较新的时间
+        with self._lock:
+            for user_id, seen in pending.items():
+                current = self._pending.get(user_id)
+                if current is None or current < seen:
+                    self._pending[user_id] = seen
+
+    def safe_flush(self):                       # 写入失败只记录日志，不影响请求
+        try:
+            self.flush()
+        except Exception:
+            self.app.logger.exception('Failed to flush last_seen')
+
+    def schedule(self):                         # 有暂存数据时间隔后写入，空闲进程不必等到下一个请求
+        with self._lock:
+            if not self._pending or self._timer is not None:
+                return
+            self._timer = threading.Timer(self.interval, self._timed_flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _timed_flush(self):
+        with self._lock:
+            self._timer = None
+        self.safe_flush()
+
+    def run(self):                              # 后台线程定时写入
+        while True:
+            time.sleep(self.interval)
+            self.safe_flush()
+
+
+def _flush_at_exit(ref):                        # 只持有弱引用，不延长已废弃应用的生命周期
+    tracker = ref()
+    if tracker is not None:
+        tracker.safe_flush()
+
+
+class LastSeenTracker(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        tracker = _Tracker(app,
+                           app.config.get('FLASKY_LAST_SEEN_RESOLUTION', 60),
+                           app.config.get('FLASKY_LAST_SEEN_FLUSH_INTERVAL', 10))
+        app.extensions['last_seen'] = tracker
+        if app.config.get('FLASKY_LAST_SEEN_FLUSH') == 'thread':
+            thread = threading.Thread(target=tracker.run,
+                                      name='last-seen-flush')
+            thread.daemon = True
+            thread.start()
+        else:                                   # 默认在请求结束时按间隔批量写入
+            @app.teardown_request
+            def flush_last_seen(exc):
+                if tracker.flush_due():
+                    tracker.safe_flush()
+                tracker.schedule()
+        atexit.register(_flush_at_exit, weakref.ref(tracker))   # 进程退出前写入暂存的时间戳
+
+    @staticmethod
+    def touch(user_id):
+        return current_app.extensions['last_seen'].touch(user_id)
+
+    @staticmethod
+    def flush():
+        return current_app.extensions['last_seen'].flush()
@@ -1,5 +1,5 @@
 
-from flask import render_template, request, jsonify
+from flask import render_template, request, jsonify, make_response
 from . import main
 
 
@@ -23,6 +23,19 @@ def page_not_found(e):
     return render_template('404.html'), 404
 
 
+@main.app_errorhandler(429)
+def too_many_requests(e):
+    if request.accept_mimetypes.accept_json and \
+            not request.accept_mimetypes.accept_html:
+        response = jsonify({'error': 'too many requests'})
+    else:
+        response = make_response(render_template('429.html'))
+    response.status_code = 429
+    if getattr(e, 'retry_after', None):
+        response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
 @main.app_errorhandler(500)
 def internal_server_error(e):
     if request.accept_mimetypes.accept_json and \
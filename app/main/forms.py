@@ -1,9 +1,10 @@
 # -*- coding: UTF-8 -*-
 
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, SubmitField, SelectField
-from wtforms.validators import Required, Length, DataRequired, Email, Regexp, ValidationError
-from app.models import User, Role
+from wtforms import StringField, TextAreaField, SubmitField, SelectField, IntegerField
+from wtforms.validators import Required, Length, DataRequired, Email, Regexp, ValidationError, \
+    Optional, NumberRange
+from app.models import User, role_permissions
 
 
 # 用户资料编辑表单
@@ -31,8 +32,7 @@ class EditProfileAdminForm(FlaskForm):
 
     def __init__(self, user, *args, **kwargs):
         super(EditProfileAdminForm, self).__init__(*args, **kwargs)
-        self.role.choices = [(role.id, role.name)            # 初始化下拉框各选项
-                             for role in Role.query.order_by(Role.name).all()]
+        self.role.choices = role_permissions.choices()      # 下拉框各选项，来自进程内缓存
         self.user = user
 
     def validate_email(self, field):
@@ -46,6 +46,25 @@ class EditProfileAdminForm(FlaskForm):
             raise ValidationError('Username already in use.')
 
 
+# 管理员批量操作表单：筛选条件之间为与关系
+class BulkUsersForm(FlaskForm):
+    action = SelectField('Action', choices=[('role', 'Change role to'),
+                                            ('deactivate', 'Deactivate'),
+                                            ('activate', 'Activate')])
+    new_role = SelectField('New role', coerce=int)
+    role = SelectField('Users with role', coerce=int)
+    email_domain = StringField('Email domain', validators=[Length(0, 64)])
+    inactive_days = IntegerField('Not seen for days',
+                                 validators=[Optional(), NumberRange(min=0)])
+    submit = SubmitField('Apply')
+
+    def __init__(self, *args, **kwargs):
+        super(BulkUsersForm, self).__init__(*args, **kwargs)
+        choices = role_permissions.choices()
+        self.new_role.choices = choices
+        self.role.choices = [(0, 'Any')] + choices
+
+
 # 博客撰写表单
 class PostForm(FlaskForm):
     body = TextAreaField("What's on your mind?", validators=[Required()])
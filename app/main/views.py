@@ -1,16 +1,37 @@
 # -*- coding: UTF-8 -*-
-import hashlib
+import mimetypes
+from datetime import datetime
 
-from flask import render_template, redirect, url_for, flash
+from flask import render_template, redirect, url_for, flash, request, current_app, \
+    make_response, abort, send_file
 from flask_login import login_required, current_user
-from ..decorators import admin_required
-from app.main.forms import EditProfileForm, EditProfileAdminForm, PostForm
+from flask_sqlalchemy import Pagination
+from sqlalchemy.orm import joinedload
+from ..decorators import admin_required, permission_required, read_only
+from app.main.forms import EditProfileForm, EditProfileAdminForm, PostForm, BulkUsersForm
 from . import main
-from ..models import User, db, Role, Permission, Post
+from ..models import User, db, Role, Permission, Post, refresh_avatar_hash
+from .. import page_cache, search_index, metrics, avatars, assets, bulk, archive
+from ..avatars import valid_hash
+
+
+def index_last_modified():                      # 主页内容随最新文章变化
+    return db.session.query(db.func.max(Post.timestamp)).scalar() or \
+        datetime(1970, 1, 1)
+
+
+def user_last_modified(name):                   # 用户页取最后访问时间与最新文章时间的较大者
+    row = db.session.query(User.last_seen, User.last_post_at) \
+        .filter(User.name == name).first()
+    if row is None:
+        return None
+    return max([t for t in row if t is not None] or [datetime(1970, 1, 1)])
 
 
 # 主页路由
 @main.route('/', methods=['GET', 'POST'])
+@read_only
+@page_cache.cached(last_modified=index_last_modified)
 def index():
     form = PostForm()
     if current_user.can(Permission.WRITE) and form.validate_on_submit():
@@ -20,29 +41,113 @@ def index():
         db.session.commit()
         flash("Submission of success !")
         return redirect(url_for('.index'))
-    posts = Post.query.order_by(Post.timestamp.desc()).all()
-    return render_template('index.html', form=form, posts=posts)
-    # show_followed = False
-    # if current_user.is_authenticated:
-    #     show_followed = bool(request.cookies.get('show_followed', ''))
-    # if show_followed:
-    #     query = current_user.followed_posts
-    # else:
-    #     query = Post.query
-    # pagination = query.order_by(Post.timestamp.desc()).paginate(
-    #     page, per_page=current_app.config['FLASKY_POSTS_PER_PAGE'],
-    #     error_out=False)
-    # posts = pagination.items
-    # return render_template('index.html', form=form, posts=posts,
-    #                        show_followed=show_followed, pagination=pagination)
+    per_page = current_app.config['FLASKY_POSTS_PER_PAGE']
+    before, after = request.args.get('before'), request.args.get('after')
+    show_followed = False
+    if current_user.is_authenticated():
+        show_followed = bool(request.cookies.get('show_followed', ''))
+    if show_followed:                                           # 关注时间线，读取预先写入的时间线
+        pagination = current_user.followed_posts(per_page, before=before,
+                                                 after=after)
+    else:
+        query = Post.query.options(                             # 作者及其角色随文章一次JOIN取出，避免N+1查询
+            joinedload(Post.author).joinedload(User.role))
+        pagination = archive.paginate_posts(                    # 按(时间戳, id)游标分页，越过热数据时读归档
+            query, per_page, before=before, after=after)
+    posts = pagination.items
+    return render_template('index.html', form=form, posts=posts,
+                           show_followed=show_followed, pagination=pagination)
 
 
 # 用户页路由
 @main.route('/user/<name>')
+@read_only
+@page_cache.cached(last_modified=user_last_modified)
 def user(name):
-    user = User.query.filter_by(name=name).first_or_404()
-    posts = user.posts.order_by(Post.timestamp.desc()).all()
-    return render_template('user.html', user=user, posts=posts)
+    user = User.query.options(joinedload(User.role)) \
+        .filter_by(name=name).first_or_404()
+    # 按(作者, 时间)索引游标分页，页面代价与用户文章总数无关；
+    # 文章作者即该用户，post.author按主键直接命中会话标识映射，不再逐条查询
+    pagination = archive.paginate_posts(
+        user.posts, current_app.config['FLASKY_POSTS_PER_PAGE'],
+        before=request.args.get('before'), after=request.args.get('after'),
+        author_id=user.id)
+    return render_template('user.html', user=user, posts=pagination.items,
+                           pagination=pagination)
+
+
+# 关注路由
+@main.route('/follow/<name>')
+@login_required
+@permission_required(Permission.FOLLOW)
+def follow(name):
+    user = User.query.filter_by(name=name).first()
+    if user is None:
+        flash('Invalid user.')
+        return redirect(url_for('.index'))
+    if current_user.is_following(user):
+        flash('You are already following this user.')
+        return redirect(url_for('.user', name=name))
+    current_user.follow(user)
+    db.session.commit()
+    flash('You are now following %s.' % name)
+    return redirect(url_for('.user', name=name))
+
+
+# 取消关注路由
+@main.route('/unfollow/<name>')
+@login_required
+@permission_required(Permission.FOLLOW)
+def unfollow(name):
+    user = User.query.filter_by(name=name).first()
+    if user is None:
+        flash('Invalid user.')
+        return redirect(url_for('.index'))
+    if not current_user.is_following(user):
+        flash('You are not following this user.')
+        return redirect(url_for('.user', name=name))
+    current_user.unfollow(user)
+    db.session.commit()
+    flash('You are not following %s anymore.' % name)
+    return redirect(url_for('.user', name=name))
+
+
+# 主页显示全部文章
+@main.route('/all')
+@login_required
+def show_all():
+    resp = make_response(redirect(url_for('.index')))
+    resp.set_cookie('show_followed', '', max_age=30*24*60*60)
+    return resp
+
+
+# 主页只显示关注用户的文章
+@main.route('/followed')
+@login_required
+def show_followed():
+    resp = make_response(redirect(url_for('.index')))
+    resp.set_cookie('show_followed', '1', max_age=30*24*60*60)
+    return resp
+
+
+# 搜索路由，按相关度排序分页
+@main.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config['FLASKY_SEARCH_RESULTS_PER_PAGE']
+    results = search_index.search_posts(query) if query else []
+    ids = [id for id, score in results[(page - 1) * per_page:page * per_page]]
+    rank = dict((id, i) for i, id in enumerate(ids))
+    posts = sorted(Post.query.options(joinedload(Post.author))
+                   .filter(Post.id.in_(ids)).all(),
+                   key=lambda post: rank[post.id]) if ids else []
+    user_ids = [id for id, score in search_index.search_users(query)[:5]] \
+        if query else []
+    users = User.query.filter(User.id.in_(user_ids)).all() if user_ids else []
+    pagination = Pagination(None, page, per_page, len(results), posts)
+    return render_template('search.html', query=query, users=users,
+                           posts=posts, pagination=pagination)
 
 
 # 用户资料编辑路由
@@ -72,8 +177,7 @@ def edit_profile_admin(id):
     user = User.query.get_or_404(id)
     form = EditProfileAdminForm(user=user)
     if form.validate_on_submit():
-        if user.email != form.email.data:                                 # 若邮箱更改，重新计算用户头像URL地址
-            user.avatar_hash = hashlib.md5(form.email.data.encode('utf-8')).hexdigest()
+        email_changed = user.email != form.email.data
         user.email = form.email.data
         # user.username = form.username.data
         # user.confirmed = form.confirmed.data
@@ -83,6 +187,8 @@ def edit_profile_admin(id):
         user.about_me = form.about_me.data
         db.session.add(user)
         db.session.commit()
+        if email_changed:                                                 # 若邮箱更改，由后台任务重新计算用户头像URL地址
+            refresh_avatar_hash.delay(user.id)
         flash('The profile has been updated.')
         return redirect(url_for('.user', name=user.name))
     form.email.data = user.email
@@ -93,3 +199,69 @@ def edit_profile_admin(id):
     form.location.data = user.location
     form.about_me.data = user.about_me
     return render_template('edit_profile.html', form=form, user=user)
+
+
+# 管理员批量操作路由，集合式UPDATE分块提交，不逐个加载用户
+@main.route('/admin/users', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def bulk_users():
+    form = BulkUsersForm()
+    if form.validate_on_submit():
+        criteria = bulk.user_criteria(role_id=form.role.data or None,
+                                      email_domain=form.email_domain.data.strip(),
+                                      inactive_days=form.inactive_days.data,
+                                      exclude=[current_user.id])    # 不修改管理员自己
+        done = 0
+        for done, last_id in bulk.apply(form.action.data, criteria,
+                                        form.new_role.data,
+                                        current_app.config['FLASKY_BULK_CHUNK_SIZE']):
+            pass
+        flash('%d users updated.' % done)
+        return redirect(url_for('.bulk_users'))
+    return render_template('bulk_users.html', form=form)
+
+
+# 性能统计路由，Prometheus文本格式，仅管理员可访问
+@main.route('/metrics')
+@login_required
+@admin_required
+def metrics_view():
+    return metrics.render(), 200, {
+        'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+# 头像代理路由，内容只由哈希和尺寸决定，允许浏览器和代理长期缓存
+@main.route('/avatar/<hash>/<int:size>')
+def avatar(hash, size):
+    if not valid_hash(hash) or \
+            size not in current_app.config['FLASKY_AVATAR_SIZES']:
+        abort(404)
+    data, mimetype, durable = avatars.get(hash, size)
+    response = make_response(data)
+    response.mimetype = mimetype
+    response.cache_control.public = True
+    response.cache_control.max_age = \
+        current_app.config['FLASKY_AVATAR_MAX_AGE'] if durable else 300
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+# 静态资源路由，带哈希的文件内容不会变化，浏览器可永久缓存，不必再验证
+@main.route('/assets/<path:filename>')
+def asset(filename):
+    found = assets.find(filename, request.accept_encodings)
+    if found is None:
+        abort(404)
+    path, encoding, fingerprinted = found
+    response = send_file(path, mimetype=mimetypes.guess_type(filename)[0] or
+                         'application/octet-stream', conditional=True)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    if fingerprinted:
+        response.headers['Cache-Control'] = 'public, max-age=%d, immutable' % \
+            current_app.config['FLASKY_ASSETS_MAX_AGE']
+    else:                                       # 未打包时文件可能被修改，每次重新验证
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
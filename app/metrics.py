@@ -0,0 +1,154 @@
+# -*- coding: UTF-8 -*-
+# 请求性能统计：按端点记录请求耗时直方图、数据库查询次数与耗时、模板渲染耗时，
+# 记录超过阈值的慢查询，并以Prometheus文本格式输出
+
+import threading
+import time
+from flask import current_app, g, has_request_context, request, \
+    before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _EndpointStats(object):
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)      # 各桶内计数，输出时再累加
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+        self.render_time = 0.0
+
+
+class Registry(object):
+    def __init__(self):
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, duration, queries, query_time, render_time):
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = _EndpointStats()
+            for i, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    stats.buckets[i] += 1
+                    break
+            stats.count += 1
+            stats.duration += duration
+            stats.queries += queries
+            stats.query_time += query_time
+            stats.render_time += render_time
+
+    def render(self):
+        """以Prometheus文本格式（0.0.4）输出全部统计。"""
+        with self._lock:
+            items = sorted(self.endpoints.items())
+            lines = [
+                '# HELP flasky_request_duration_seconds Request latency by endpoint.',
+                '# TYPE flasky_request_duration_seconds histogram']
+            for endpoint, stats in items:
+                cumulative = 0
+                for bound, count in zip(BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append('flasky_request_duration_seconds_bucket'
+                                 '{endpoint="%s",le="%s"} %d'
+                                 % (endpoint, bound, cumulative))
+                lines.append('flasky_request_duration_seconds_bucket'
+                             '{endpoint="%s",le="+Inf"} %d'
+                             % (endpoint, stats.count))
+                lines.append('flasky_request_duration_seconds_sum'
+                             '{endpoint="%s"} %.6f' % (endpoint, stats.duration))
+                lines.append('flasky_request_duration_seconds_count'
+                             '{endpoint="%s"} %d' % (endpoint, stats.count))
+            for name, help, attr, fmt in (
+                    ('flasky_db_queries_total',
+                     'Database queries issued by endpoint.', 'queries', '%d'),
+                    ('flasky_db_query_seconds_total',
+                     'Time spent in database queries by endpoint.',
+                     'query_time', '%.6f'),
+                    ('flasky_template_render_seconds_total',
+                     'Time spent rendering templates by endpoint.',
+                     'render_time', '%.6f')):
+                lines.append('# HELP %s %s' % (name, help))
+                lines.append('# TYPE %s counter' % name)
+                for endpoint, stats in items:
+                    lines.append(('%s{endpoint="%s"} ' + fmt)
+                                 % (name, endpoint, getattr(stats, attr)))
+        return '\n'.join(lines) + '\n'
+
+
+def _endpoint():
+    return request.endpoint or 'none'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('query_start_time', []).append(time.time())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    duration = time.time() - conn.info['query_start_time'].pop()
+    if not has_request_context() or 'metrics_start' not in g:
+        return
+    g.metrics_queries += 1
+    g.metrics_query_time += duration
+    if duration >= current_app.config.get('FLASKY_SLOW_DB_QUERY_TIME', 0.5):
+        current_app.logger.warning('Slow query (%.3fs) in %s: %s',
+                                   duration, _endpoint(), statement)
+
+
+def _before_render(app, template, context):
+    if 'metrics_start' in g:
+        if g.metrics_render_depth == 0:         # 嵌套渲染（如文章片段）只计最外层
+            g.metrics_render_start = time.time()
+        g.metrics_render_depth += 1
+
+
+def _after_render(app, template, context):
+    if 'metrics_start' in g:
+        g.metrics_render_depth -= 1
+        if g.metrics_render_depth == 0:
+            g.metrics_render_time += time.time() - g.metrics_render_start
+
+
+class Metrics(object):
+    _events_registered = False
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['metrics'] = registry = Registry()
+        if not app.config.get('FLASKY_METRICS', True):
+            return
+        if not Metrics._events_registered:
+            event.listen(Engine, 'before_cursor_execute',
+                         _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            Metrics._events_registered = True
+        before_render_template.connect(_before_render, app)
+        template_rendered.connect(_after_render, app)
+
+        @app.before_request
+        def start_metrics():
+            g.metrics_start = time.time()
+            g.metrics_queries = 0
+            g.metrics_query_time = 0.0
+            g.metrics_render_time = 0.0
+            g.metrics_render_depth = 0
+
+        @app.teardown_request
+        def record_metrics(exc):
+            if 'metrics_start' in g:
+                registry.observe(_endpoint(), time.time() - g.metrics_start,
+                                 g.metrics_queries, g.metrics_query_time,
+                                 g.metrics_render_time)
+
+    @staticmethod
+    def render():
+        return current_app.extensions['metrics'].render()
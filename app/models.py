@@ -1,11 +1,21 @@
 # -*- coding: UTF-8 -*-
 
 import hashlib
-from werkzeug.security import generate_password_hash, check_password_hash
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
 from flask_login import UserMixin, AnonymousUserMixin
 from flask import current_app
+from sqlalchemy.exc import IntegrityError
 from . import login_manager
 from . import db
+from . import user_cache
+from . import job_queue
+from . import password_hasher
+from . import avatars
+from .rendering import render_body_html
+from .page_cache import PageCache
 from datetime import datetime
 
 
@@ -17,6 +27,15 @@ class Permission:
     ADMIN = 16            # 管理网站
 
 
+class Follow(db.Model):                         # 关注关系，follower关注followed
+    __tablename__ = 'follows'
+    follower_id = db.Column(db.Integer, db.ForeignKey('users.id'),
+                            primary_key=True)
+    followed_id = db.Column(db.Integer, db.ForeignKey('users.id'),
+                            primary_key=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -28,8 +47,23 @@ class User(UserMixin, db.Model):
     about_me = db.Column(db.Text())
     member_since = db.Column(db.DateTime(), default=datetime.utcnow)
     last_seen = db.Column(db.DateTime(), default=datetime.utcnow)
-    avatar_hash = db.Column(db.String(32))
+    avatar_hash = db.Column(db.String(32), index=True)    # 头像代理按哈希查找用户
+    followers_count = db.Column(db.Integer, default=0, nullable=False)    # 粉丝数，决定发文时是否推送到粉丝时间线
+    timeline_pull = db.Column(db.Boolean, default=False, nullable=False)  # 有文章未推送到粉丝时间线，读取时按作者合并
+    post_count = db.Column(db.Integer, default=0, nullable=False)         # 文章数，发文、删文时在数据库中增减
+    last_post_at = db.Column(db.DateTime)                                 # 最新文章时间
+    active = db.Column(db.Boolean, default=True, nullable=False)          # 停用的账号不能登录，已登录的会话失效
     posts = db.relationship('Post', backref='author', lazy='dynamic')
+    followed = db.relationship('Follow',
+                               foreign_keys=[Follow.follower_id],
+                               backref=db.backref('follower', lazy='joined'),
+                               lazy='dynamic',
+                               cascade='all, delete-orphan')
+    followers = db.relationship('Follow',
+                                foreign_keys=[Follow.followed_id],
+                                backref=db.backref('followed', lazy='joined'),
+                                lazy='dynamic',
+                                cascade='all, delete-orphan')
 
     def __init__(self, **kwargs):
         super(User, self).__init__(**kwargs)
@@ -47,17 +81,28 @@ class User(UserMixin, db.Model):
 
     @password.setter
     def password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
-    def verify_password(self, password):
-        return check_password_hash(self.password_hash, password)
+    def verify_password(self, password):        # 校验成功时按当前配置重算过期的哈希，由调用方提交
+        if not password_hasher.check(self.password_hash, password):
+            return False
+        if password_hasher.needs_rehash(self.password_hash):
+            self.password = password
+        return True
 
-    @login_manager.user_loader                  # 是否登录验证
+    def is_active(self):                        # 尚未写入数据库的新用户视为启用
+        return self.active is not False
+
+    @login_manager.user_loader                  # 是否登录验证，优先从用户缓存加载
     def load_user(user_email):
-        return User.query.get(int(user_email))
+        user = user_cache.load(int(user_email))
+        return user if user is not None and user.is_active() else None
 
-    def can(self, perm):                        # 判断是否由指定权限
-        return self.role is not None and self.role.has_permission(perm)
+    def can(self, perm):                        # 判断是否由指定权限，查进程内角色权限表，不访问数据库
+        if self.role_id is None:                # 尚未写入数据库的新用户直接看内存中的角色
+            return self.role is not None and self.role.has_permission(perm)
+        permissions = role_permissions.get(self.role_id)
+        return permissions is not None and permissions & perm == perm
 
     def is_administrator(self):                 # 判断是否为管理员权限
         return self.can(Permission.ADMIN)
@@ -85,7 +130,40 @@ class User(UserMixin, db.Model):
     #     db.session.add(self)
     #     return True
 
+    def follow(self, user):                     # 关注用户，并把其近期文章写入自己的时间线
+        if user.id is None or self.is_following(user):
+            return
+        from .timeline import backfill
+        backfill(self, user)
+        db.session.add(Follow(follower=self, followed=user))
+        user.followers_count = User.followers_count + 1     # 在数据库中自增，避免并发覆盖
+
+    def unfollow(self, user):                   # 取消关注，并从时间线中删除其文章
+        f = self.followed.filter_by(followed_id=user.id).first()
+        if f is None:
+            return
+        from .timeline import remove
+        remove(self, user)
+        db.session.delete(f)
+        user.followers_count = User.followers_count - 1
+
+    def is_following(self, user):
+        if user.id is None:
+            return False
+        return self.followed.filter_by(followed_id=user.id).first() is not None
+
+    def is_followed_by(self, user):
+        if user.id is None:
+            return False
+        return self.followers.filter_by(follower_id=user.id).first() is not None
+
+    def followed_posts(self, per_page, before=None, after=None):    # 关注用户的文章，游标分页
+        from .timeline import followed_posts
+        return followed_posts(self, per_page, before=before, after=after)
+
     def gravatar(self, size=100, default='identicon', rating='g'):      # 头像url地址生成
+        if current_app.config.get('FLASKY_AVATAR_PROXY', True):     # 经本站头像代理，地址按(哈希, 尺寸)缓存
+            return avatars.url(self.avatar_hash, size)
         url = 'https://secure.gravatar.com/avatar'
         hash = self.avatar_hash                                 # or hashlib.md5(self.email.encode('utf-8')).hexdigest()
         return '{url}/{hash}?s={size}&d={default}&r={rating}'.format(
@@ -159,9 +237,229 @@ class Role(db.Model):
         return '<Role %r>' % self.name
 
 
+class RolePermissions(object):
+    # 进程内角色权限表 role_id -> 权限位，以及按名称排序的角色下拉框选项，
+    # 首次使用时加载，角色变化或超过ttl秒后重新加载
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._table = None
+        self._choices = None
+        self._missing = set()                   # 重新加载后仍不存在的role_id，下次加载前不再查询
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        rows = db.session.query(Role.id, Role.name, Role.permissions) \
+            .order_by(Role.name).all()
+        table = dict((id, permissions) for id, name, permissions in rows)
+        choices = [(id, name) for id, name, permissions in rows]
+        with self._lock:
+            self._table = table
+            self._choices = choices
+            self._missing = set()
+            self._loaded_at = time.time()
+        return table
+
+    def get(self, role_id):
+        table = self._table
+        if table is None or time.time() - self._loaded_at > self.ttl:
+            table = self.load()
+        elif role_id not in table and role_id not in self._missing:
+            table = self.load()                 # 未知角色可能由其他进程新建
+            if role_id not in table:
+                with self._lock:
+                    self._missing.add(role_id)
+        return table.get(role_id)
+
+    def choices(self):                          # [(id, 名称)]，管理员表单每次加载不再查询角色表
+        choices = self._choices
+        if choices is None or time.time() - self._loaded_at > self.ttl:
+            self.load()
+            choices = self._choices
+        return choices
+
+    def invalidate(self):
+        with self._lock:
+            self._table = None
+            self._choices = None
+
+
+role_permissions = RolePermissions()
+
+
+# insert_roles或管理员修改角色时，权限表在提交成功后失效，下次检查时重新加载；
+# flush时失效会让并发请求在提交前把旧权限重新加载进来
+@event.listens_for(Role, 'after_insert')
+@event.listens_for(Role, 'after_update')
+@event.listens_for(Role, 'after_delete')
+def _queue_role_invalidation(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['role_permissions_stale'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_role_permissions(session):
+    if session.info.pop('role_permissions_stale', False):
+        role_permissions.invalidate()
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_role_invalidation(session, previous_transaction):
+    session.info.pop('role_permissions_stale', None)
+
+
+@job_queue.task('refresh_avatar_hash')
+def refresh_avatar_hash(user_id):              # 后台重新计算头像哈希，修改邮箱的请求不必等待
+    user = User.query.get(user_id)
+    if user is None or user.email is None:
+        return
+    user.avatar_hash = hashlib.md5(user.email.encode('utf-8')).hexdigest()
+    db.session.commit()
+
+
 class Post(db.Model):
     __tablename__ = 'posts'
     id = db.Column(db.Integer, primary_key=True)
     body = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)    # 时间戳
     author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    body_html = db.Column(db.Text)                                             # 渲染并清理后的正文HTML
+    __table_args__ = (
+        db.Index('ix_posts_author_timestamp', 'author_id', 'timestamp', 'id'),    # 用户页按作者游标分页
+    )
+
+    @staticmethod
+    def on_changed_body(target, value, oldvalue, initiator):                  # 正文修改时重新渲染
+        target.body_html = render_body_html(value)
+
+
+db.event.listen(Post.body, 'set', Post.on_changed_body)
+
+
+class ArchivedPost(db.Model):                   # 超过FLASKY_ARCHIVE_AFTER_DAYS的文章，保存在归档库（bind 'archive'）
+    __tablename__ = 'posts_archive'
+    __bind_key__ = 'archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)       # 沿用原文章id
+    body = db.Column(db.Text)
+    timestamp = db.Column(db.DateTime, index=True)
+    author_id = db.Column(db.Integer)                                       # 可能在另一个数据库中，不设外键
+    body_html = db.Column(db.Text)
+    author = db.relationship('User', viewonly=True,
+                             primaryjoin='foreign(ArchivedPost.author_id) == User.id')
+    __table_args__ = (
+        db.Index('ix_posts_archive_author_timestamp', 'author_id', 'timestamp', 'id'),
+    )
+
+
+# 作者的文章数与最新文章时间随文章写入更新，用户页不再统计文章
+@event.listens_for(Post, 'after_insert')
+def _count_new_post(mapper, connection, target):
+    users = User.__table__
+    connection.execute(users.update().where(users.c.id == target.author_id).values(
+        post_count=users.c.post_count + 1,
+        last_post_at=db.case([(db.or_(users.c.last_post_at.is_(None),
+                                      users.c.last_post_at < target.timestamp),
+                               target.timestamp)],
+                             else_=users.c.last_post_at)))
+
+
+@event.listens_for(Post, 'after_delete')
+def _count_deleted_post(mapper, connection, target):
+    users, posts = User.__table__, Post.__table__
+    latest = db.select([db.func.max(posts.c.timestamp)]) \
+        .where(posts.c.author_id == target.author_id).as_scalar()
+    if current_app.config.get('FLASKY_ARCHIVE_AFTER_DAYS') is not None:
+        # 与recount_posts一致：热表中没有文章时取归档中的最新时间，归档库可能是另一个数据库，单独查询
+        archived = db.get_engine(bind='archive').execute(
+            db.select([db.func.max(ArchivedPost.timestamp)])
+            .where(ArchivedPost.author_id == target.author_id)).scalar()
+        latest = db.func.coalesce(latest, archived)
+    connection.execute(users.update().where(users.c.id == target.author_id).values(
+        post_count=users.c.post_count - 1, last_post_at=latest))
+
+
+@event.listens_for(db.session, 'after_flush')
+def _expire_post_counters(session, flush_context):
+    # 计数在数据库中更新，会话与用户缓存中的作者需重新加载
+    author_ids = set(obj.author_id for obj in
+                     list(session.new) + list(session.deleted)
+                     if isinstance(obj, Post))
+    if not author_ids:
+        return
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, User) and obj.id in author_ids:
+            session.expire(obj, ['post_count', 'last_post_at'])
+    for author_id in author_ids:
+        user_cache.invalidate(author_id)
+
+
+def recount_posts():
+    """按posts表重算所有用户的文章计数，用于批量导入等绕过映射器事件的写入之后。
+
+    启用归档时再加上归档库中的文章，归档库可能是另一个数据库，按作者汇总后逐个累加。
+    """
+    users, posts = User.__table__, Post.__table__
+    db.session.execute(users.update().values(
+        post_count=db.select([db.func.count(posts.c.id)])
+        .where(posts.c.author_id == users.c.id).as_scalar(),
+        last_post_at=db.select([db.func.max(posts.c.timestamp)])
+        .where(posts.c.author_id == users.c.id).as_scalar()))
+    if current_app.config.get('FLASKY_ARCHIVE_AFTER_DAYS') is not None:
+        archived = db.session.query(ArchivedPost.author_id,
+                                    db.func.count(ArchivedPost.id),
+                                    db.func.max(ArchivedPost.timestamp)) \
+            .group_by(ArchivedPost.author_id).all()
+        if archived:                            # 归档文章都早于热表中的文章，只在没有热文章时决定最新时间
+            db.session.execute(users.update().where(
+                users.c.id == db.bindparam('author_id')).values(
+                post_count=users.c.post_count + db.bindparam('count'),
+                last_post_at=db.func.coalesce(users.c.last_post_at,
+                                              db.bindparam('latest'))),
+                [{'author_id': author_id, 'count': count, 'latest': latest}
+                 for author_id, count, latest in archived])
+    db.session.commit()
+    PageCache.purge()                           # 用户页的计数与Last-Modified随之变化
+
+
+class TimelineEntry(db.Model):                  # 预先计算的关注时间线，发文时推送给粉丝
+    __tablename__ = 'timeline'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'),
+                        primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'),
+                        primary_key=True)
+    timestamp = db.Column(db.DateTime, nullable=False)                      # 冗余保存文章时间，按用户范围扫描
+    __table_args__ = (
+        db.Index('ix_timeline_user_timestamp', 'user_id', 'timestamp',
+                 'post_id'),
+    )
+
+
+class ContentVersion(db.Model):                 # 公开内容的版本号，每次清空整页缓存时加1，所有进程共享
+    __tablename__ = 'content_versions'
+    name = db.Column(db.String(32), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    PUBLIC = 'public'
+
+    @staticmethod
+    def current(name=PUBLIC):
+        version = db.session.query(ContentVersion.version) \
+            .filter_by(name=name).scalar()
+        return version or 0
+
+    @staticmethod
+    def bump(name=PUBLIC):
+        # 在独立事务中执行，可以在会话提交之后（after_commit）调用
+        table = ContentVersion.__table__
+        update = table.update().where(table.c.name == name) \
+            .values(version=table.c.version + 1)
+        with db.engine.begin() as conn:
+            if conn.execute(update).rowcount:
+                return
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.insert().values(name=name, version=1))
+        except IntegrityError:                  # 其他进程同时插入了这一行
+            with db.engine.begin() as conn:
+                conn.execute(update)
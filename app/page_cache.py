@@ -0,0 +1,145 @@
+# -*- coding: UTF-8 -*-
+# 整页响应缓存：匿名GET请求按URL缓存，带强ETag与Last-Modified，条件请求直接返回304。
+# 缓存条目记录生成时的内容版本号（保存在数据库中，各进程共享），版本变化后条目失效
+
+import hashlib
+import json
+from functools import wraps
+from flask import current_app, has_app_context, request, session
+from flask_login import current_user
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+from .cache import make_store
+
+
+def _timestamp(dt):                            # HTTP日期只精确到秒
+    return dt.replace(microsecond=0).isoformat() if dt else None
+
+
+class PageCache(object):
+    _events_registered = False
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['page_cache'] = make_store(
+            app, 'page',
+            maxsize=app.config.get('FLASKY_PAGE_CACHE_SIZE', 1000),
+            default_timeout=app.config.get('FLASKY_PAGE_CACHE_TIMEOUT', 300))
+        if not PageCache._events_registered:
+            self._register_events()
+            PageCache._events_registered = True
+
+    @staticmethod
+    def _register_events():
+        from . import db
+        from .models import User, Post              # 延迟导入，避免与models循环引用
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(Post, name, _purge_on_write)
+        event.listen(User, 'after_update', _purge_on_profile_change)
+        event.listen(User, 'after_delete', _purge_on_write)
+        event.listen(db.session, 'after_commit', _purge_queued)
+        event.listen(db.session, 'after_soft_rollback', _discard_queued)
+
+    @staticmethod
+    def purge():                                # 内容版本号加1，使所有进程中已缓存的页面失效
+        if not has_app_context():
+            return
+        from .models import ContentVersion
+        ContentVersion.bump()
+
+    @staticmethod
+    def content_version():
+        """数据库中的公开内容版本号，与缓存存储无关，各进程一致。
+
+        ORM写入提交后自动加1；绕过映射器事件的批量写入须调用purge()。
+        """
+        from .models import ContentVersion
+        return ContentVersion.current()
+
+    @staticmethod
+    def _cacheable():
+        # 仅缓存匿名读者的GET请求；带闪现消息的页面只显示一次，不能缓存
+        return current_app.config.get('FLASKY_PAGE_CACHE') and \
+            request.method == 'GET' and \
+            '_flashes' not in session and \
+            not current_user.is_authenticated()
+
+    def cached(self, last_modified):
+        """缓存视图响应，last_modified接收视图参数，返回页面内容的最后修改时间。
+
+        返回None表示资源不存在，直接交给视图处理（如返回404）。
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if not self._cacheable():
+                    return f(*args, **kwargs)
+                modified = last_modified(*args, **kwargs)
+                if modified is None:
+                    return f(*args, **kwargs)
+                store = current_app.extensions['page_cache']
+                key = 'anonymous:' + request.full_path
+                entry = store.get(key)
+                entry = json.loads(entry) if entry else None
+                if entry is None or \
+                        entry['version'] != self.content_version() or \
+                        entry['last_modified'] != _timestamp(modified):
+                    entry = self._render(store, key, f, args, kwargs,
+                                         modified)
+                    if not isinstance(entry, dict):    # 非200响应不缓存，原样返回
+                        return entry
+                response = current_app.response_class(
+                    entry['body'], mimetype=entry['mimetype'])
+                response.set_etag(entry['etag'])
+                response.last_modified = modified.replace(microsecond=0)
+                response.cache_control.no_cache = True      # 每次都需向服务器验证
+                response.vary.add('Cookie')
+                return response.make_conditional(request)
+            return decorated_function
+        return decorator
+
+    def _render(self, store, key, f, args, kwargs, modified):
+        response = current_app.make_response(f(*args, **kwargs))
+        if response.status_code != 200 or response.direct_passthrough:
+            return response
+        body = response.get_data(as_text=True)
+        entry = {
+            'version': self.content_version(),
+            'last_modified': _timestamp(modified),
+            'etag': hashlib.sha1(body.encode('utf-8')).hexdigest(),
+            'mimetype': response.mimetype,
+            'body': body,
+        }
+        store.set(key, json.dumps(entry))
+        return entry
+
+
+def _queue_purge(target):
+    # 提交成功后才清空，否则并发请求可能在提交前把旧内容缓存到新版本号下
+    session = object_session(target)
+    if session is not None:
+        session.info['page_cache_purge'] = True
+
+
+def _purge_on_write(mapper, connection, target):
+    _queue_purge(target)
+
+
+def _purge_on_profile_change(mapper, connection, target):
+    # last_seen已体现在用户页的Last-Modified中，单独变化时无需清空缓存
+    state = inspect(target)
+    if any(attr.history.has_changes() for attr in state.attrs
+           if attr.key not in ('last_seen', 'posts', 'role')):
+        _queue_purge(target)
+
+
+def _purge_queued(session):
+    if session.info.pop('page_cache_purge', False):
+        PageCache.purge()
+
+
+def _discard_queued(session, previous_transaction):
+    session.info.pop('page_cache_purge', None)
@@ -0,0 +1,100 @@
+# -*- coding: UTF-8 -*-
+# 键集（游标）分页：按(时间戳, id)定位下一页，不使用OFFSET，第N页与第1页代价相同
+
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+def encode_cursor(timestamp, id):              # 游标编码为URL安全的字符串
+    return '%s-%d' % (timestamp.strftime(CURSOR_FORMAT), id)
+
+
+def decode_cursor(cursor):                     # 非法游标返回None，视为第一页
+    try:
+        timestamp, id = cursor.split('-', 1)
+        return datetime.strptime(timestamp, CURSOR_FORMAT), int(id)
+    except (AttributeError, ValueError):
+        return None
+
+
+class KeysetPagination(object):
+    def __init__(self, items, has_prev, has_next, order_column, id_column):
+        self.items = items
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self._order_key = order_column.key
+        self._id_key = id_column.key
+
+    def _cursor(self, item):
+        return encode_cursor(getattr(item, self._order_key),
+                             getattr(item, self._id_key))
+
+    @property
+    def prev_cursor(self):                     # 上一页（更新的记录）游标
+        if not self.has_prev or not self.items:
+            return None
+        return self._cursor(self.items[0])
+
+    @property
+    def next_cursor(self):                     # 下一页（更早的记录）游标
+        if not self.has_next or not self.items:
+            return None
+        return self._cursor(self.items[-1])
+
+
+def _page(query, order_column, id_column, cursor, newer, limit):
+    """取游标之后（newer为真时更新，否则更早）的limit条记录，按离游标由近到远排序。"""
+    if cursor is not None:
+        timestamp, id = cursor
+        if newer:
+            query = query.filter(or_(order_column > timestamp,
+                                     and_(order_column == timestamp,
+                                          id_column > id)))
+        else:
+            query = query.filter(or_(order_column < timestamp,
+                                     and_(order_column == timestamp,
+                                          id_column < id)))
+    if newer:
+        query = query.order_by(order_column.asc(), id_column.asc())
+    else:
+        query = query.order_by(order_column.desc(), id_column.desc())
+    return query.limit(limit).all()
+
+
+def keyset_paginate(query, order_column, id_column, per_page,
+                    before=None, after=None, archive=None):
+    """按(order_column, id_column)倒序分页。
+
+    before 取游标之前（更早）的一页，after 取游标之后（更新）的一页，
+    两者都为空时返回第一页。多取一条记录判断是否还有下一页。
+
+    archive为(查询, 排序列, id列, 上界)时表示更早的记录在另一张表中，且都早于上界
+    与query中的记录：往更早翻页取完query后才查询archive，游标早于上界时往更新翻页先取archive。
+    """
+    before = decode_cursor(before) if before else None
+    after = decode_cursor(after) if after else None
+    if after is not None:
+        rows = []
+        if archive is not None and after[0] < archive[3]:
+            rows = _page(archive[0], archive[1], archive[2], after, True,
+                         per_page + 1)
+        if len(rows) <= per_page:
+            rows += _page(query, order_column, id_column, after, True,
+                          per_page + 1 - len(rows))
+        if len(rows) > per_page:
+            return KeysetPagination(list(reversed(rows[:per_page])), True,
+                                    True, order_column, id_column)
+        # 已回到最新的一页，按第一页重新取，保证页面条数完整
+        before = None
+    rows = _page(query, order_column, id_column, before, False, per_page + 1)
+    if archive is not None and len(rows) <= per_page:     # 游标越过了query的末尾
+        cursor = (getattr(rows[-1], order_column.key),
+                  getattr(rows[-1], id_column.key)) if rows else before
+        rows += _page(archive[0], archive[1], archive[2], cursor, False,
+                      per_page + 1 - len(rows))
+    has_next = len(rows) > per_page
+    has_prev = after is None and before is not None
+    return KeysetPagination(rows[:per_page], has_prev, has_next,
+                            order_column, id_column)
@@ -0,0 +1,82 @@
+# -*- coding: UTF-8 -*-
+# 密码哈希：算法、迭代次数与盐长度按环境配置，计算放在固定大小的线程池中，
+# 登录高峰时同时进行的哈希计算数受限，其余请求线程不会被抢占CPU。
+# gevent模式（serve.py）下线程池也被替换为协程，计算会阻塞整个进程，因此改用gevent hub的系统线程池
+
+import sys
+import threading
+from multiprocessing.pool import ThreadPool
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+def _gevent_threadpool():                       # 已执行gevent的monkey patch时返回hub的系统线程池
+    if 'gevent' not in sys.modules:
+        return None
+    from gevent import get_hub, monkey
+    if not monkey.is_module_patched('threading'):
+        return None
+    return get_hub().threadpool
+
+
+class _Hasher(object):
+    def __init__(self, method, salt_length, workers):
+        self.method = method                    # werkzeug格式，如'pbkdf2:sha256:50000'
+        self.salt_length = salt_length
+        self.workers = workers
+        self._pool = None
+        self._prefix = None
+        self._lock = threading.Lock()
+
+    def _run(self, f, *args):                   # 工作线程数为0时在当前线程计算
+        threadpool = _gevent_threadpool()
+        if threadpool is not None:
+            return threadpool.apply(f, args)
+        if not self.workers:
+            return f(*args)
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPool(self.workers)
+        return self._pool.apply(f, args)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method,
+                         self.salt_length)
+
+    def check(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):             # 哈希的算法、迭代次数或盐长度与当前配置不同
+        if self._prefix is None:                # werkzeug会补全省略的迭代次数，以实际生成的结果为准
+            self._prefix = generate_password_hash(
+                '', self.method, self.salt_length).split('$')[0]
+        parts = pwhash.split('$')
+        return len(parts) != 3 or parts[0] != self._prefix or \
+            len(parts[1]) != self.salt_length
+
+
+class PasswordHasher(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['password_hasher'] = _Hasher(
+            app.config.get('FLASKY_PASSWORD_HASH_METHOD', 'pbkdf2:sha256'),
+            app.config.get('FLASKY_PASSWORD_SALT_LENGTH', 8),
+            app.config.get('FLASKY_PASSWORD_HASH_WORKERS', 2))
+
+    @staticmethod
+    def hash(password):
+        return current_app.extensions['password_hasher'].hash(password)
+
+    @staticmethod
+    def check(pwhash, password):
+        return current_app.extensions['password_hasher'].check(pwhash, password)
+
+    @staticmethod
+    def needs_rehash(pwhash):
+        return current_app.extensions['password_hasher'].needs_rehash(pwhash)
@@ -0,0 +1,151 @@
+# -*- coding: UTF-8 -*-
+# 令牌桶限流：每个(范围, 键)一个桶，容量为突发上限，按固定速率补充令牌。
+# 桶状态保存在进程内或Redis兼容存储中（多进程共享），Redis中由Lua脚本原子更新
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, request
+from .cache import LocalRedis, _local_redis
+
+# 与_take相同的算法；状态为"剩余令牌 更新时间"，键在桶补满后过期
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens, updated = capacity, now
+local state = redis.call('GET', KEYS[1])
+if state then
+    local sep = string.find(state, ' ')
+    tokens = tonumber(string.sub(state, 1, sep - 1))
+    updated = tonumber(string.sub(state, sep + 1))
+end
+tokens = math.min(capacity, tokens + math.max(now - updated, 0) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('SET', KEYS[1], tostring(tokens) .. ' ' .. tostring(now),
+           'EX', math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+def _take(state, capacity, rate, now):
+    """取一个令牌，返回(是否允许, 剩余令牌, 新状态)。state为None表示满桶。"""
+    tokens, updated = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + max(now - updated, 0) * rate)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    return allowed, tokens, (tokens, now)
+
+
+class MemoryBuckets(object):
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize                  # 超出时淘汰最久未用的桶（相当于补满）
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        now = time.time()
+        with self._lock:
+            allowed, tokens, state = _take(self._buckets.pop(key, None),
+                                           capacity, rate, now)
+            self._buckets[key] = state
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class _LocalScript(object):
+    # LocalRedis不能执行Lua，在其锁内用_take完成同样的原子读改写
+    def __init__(self, client):
+        self.client = client
+
+    def __call__(self, keys, args):
+        capacity, rate, now = args
+        client = self.client
+        with client._lock:
+            value = client._alive(keys[0])
+            state = tuple(float(x) for x in value.decode('ascii').split(' ')) \
+                if value is not None else None
+            allowed, tokens, state = _take(state, capacity, rate, now)
+            client._data[keys[0]] = (now + math.ceil(capacity / rate) + 1,
+                                     ('%r %r' % state).encode('ascii'))
+        return [int(allowed), repr(tokens).encode('ascii')]
+
+
+class RedisBuckets(object):
+    def __init__(self, client, prefix='ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+        if isinstance(client, LocalRedis):
+            self._script = _LocalScript(client)
+        else:
+            self._script = client.register_script(TAKE_SCRIPT)
+
+    def take(self, key, capacity, rate):
+        allowed, tokens = self._script(keys=[self.prefix + key],
+                                       args=[capacity, rate, time.time()])
+        return bool(allowed), float(tokens)
+
+    def clear(self):                            # 仅供测试，会清空整个库
+        self.client.flushdb()
+
+
+def make_buckets(app):
+    storage = app.config.get('FLASKY_RATE_LIMIT_STORAGE', 'memory')
+    if storage == 'memory':
+        return MemoryBuckets(app.config.get('FLASKY_RATE_LIMIT_SIZE', 100000))
+    if storage == 'redis':
+        url = app.config.get('FLASKY_CACHE_REDIS_URL')
+        if url:
+            import redis                        # 可选依赖，仅在配置了Redis地址时需要
+            return RedisBuckets(redis.StrictRedis.from_url(url))
+        return RedisBuckets(_local_redis)
+    raise ValueError('Unknown rate limit storage %r' % storage)
+
+
+def remote_addr():                              # 按客户端IP限流
+    return request.remote_addr
+
+
+def form_field(name):                           # 按表单字段（如登录邮箱）限流，字段为空时不限
+    def key():
+        value = request.form.get(name)
+        return value.strip().lower() if value else None
+    key.__name__ = name
+    return key
+
+
+class RateLimiter(object):
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['rate_limiter'] = make_buckets(app)
+
+    @staticmethod
+    def hit(scope, key):
+        """消耗scope下key的一个令牌，允许时返回None，否则返回建议的重试等待秒数。
+
+        FLASKY_RATE_LIMITS[scope]为(容量, 周期秒数)，即周期内最多容量次，可一次性用完。
+        """
+        app = current_app
+        if not app.config.get('FLASKY_RATE_LIMIT', True):
+            return None
+        capacity, period = app.config['FLASKY_RATE_LIMITS'][scope]
+        rate = float(capacity) / period
+        allowed, tokens = app.extensions['rate_limiter'].take(
+            '%s:%s' % (scope, key), capacity, rate)
+        if allowed:
+            return None
+        return int(math.ceil((1 - tokens) / rate))
@@ -0,0 +1,60 @@
+# -*- coding: UTF-8 -*-
+# 文章正文渲染：Markdown转HTML后用bleach清理，只在写入时渲染一次并保存到body_html
+
+import bleach
+from markdown import markdown
+
+ALLOWED_TAGS = ['a', 'abbr', 'acronym', 'b', 'blockquote', 'code',
+                'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
+                'h1', 'h2', 'h3', 'p']
+
+
+def render_body_html(body):
+    if body is None:
+        return None
+    return bleach.linkify(bleach.clean(
+        markdown(body, output_format='html'),
+        tags=ALLOWED_TAGS, strip=True))
+
+
+def _render_row(row):                           # 进程池中执行，参数与返回值需可序列化
+    id, body = row
+    return {'post_id': id, 'html': render_body_html(body)}
+
+
+def backfill_body_html(batch_size=500, processes=None, only_missing=True):
+    """按id分批重新渲染已有文章，渲染分发到进程池，结果按批executemany写回。
+
+    每批完成后产生(已处理条数, 最后一个id)，供调用方输出进度。
+    executemany不触发映射器事件，每批提交后清空整页缓存；片段缓存的键包含body_html，无需清空。
+    """
+    from multiprocessing import Pool
+    from sqlalchemy import bindparam
+    from . import db
+    from .models import Post
+    from .page_cache import PageCache
+
+    posts = Post.__table__
+    stmt = posts.update().where(posts.c.id == bindparam('post_id')) \
+        .values(body_html=bindparam('html'))
+    pool = Pool(processes)                      # 在打开数据库连接前创建，子进程只做渲染
+    try:
+        done, last_id = 0, 0
+        while True:
+            query = db.session.query(Post.id, Post.body) \
+                .filter(Post.id > last_id)
+            if only_missing:
+                query = query.filter(Post.body_html.is_(None))
+            rows = query.order_by(Post.id).limit(batch_size).all()
+            if not rows:
+                break
+            db.session.execute(stmt, pool.map(_render_row,
+                                              [tuple(row) for row in rows]))
+            db.session.commit()
+            PageCache.purge()
+            done += len(rows)
+            last_id = rows[-1][0]
+            yield done, last_id
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,313 @@
+# -*- coding: UTF-8 -*-
+# 全文检索：文章正文与用户名的倒排索引，中文按二元组切分，英文按单词切分
+# 磁盘上保存为快照文件加追加写的日志文件，提交成功后增量写入日志，重建时生成新快照；
+# 多个进程共用同一路径时，各进程在检索和写入前读取其他进程追加的日志，发现新快照时重新加载；
+# 追加日志与重建快照由锁文件上的flock串行
+
+import io
+import json
+import math
+import os
+import re
+import threading
+from contextlib import contextmanager
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+
+try:
+    import fcntl
+except ImportError:                             # Windows没有flock，只能单进程使用同一索引
+    fcntl = None
+
+# 拉丁字母数字单词，或假名、汉字、谚文等CJK字符的连续串
+_TOKEN_RE = re.compile(u'[a-z0-9]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff'
+                       u'\uac00-\ud7af\uf900-\ufaff]+')
+_LATIN_RE = re.compile(u'^[a-z0-9]+$')
+
+
+def tokenize(text, for_query=False):
+    """切分文本为检索词。
+
+    CJK连续字符切为二元组，建索引时额外保留单字，便于检索单个汉字；
+    查询时只有长度为1的CJK串才使用单字。
+    """
+    terms = []
+    for run in _TOKEN_RE.findall((text or u'').lower()):
+        if _LATIN_RE.match(run) or len(run) == 1:
+            terms.append(run)
+            continue
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        if not for_query:
+            terms.extend(run)
+    return terms
+
+
+def _frequencies(terms):
+    tf = {}
+    for term in terms:
+        tf[term] = tf.get(term, 0) + 1
+    return tf
+
+
+class InvertedIndex(object):
+    def __init__(self, path=None):
+        self.path = path                        # 为None时只保存在内存中
+        self.docs = {}                          # 文档键 -> {检索词: 词频}
+        self.postings = {}                      # 检索词 -> {文档键: 词频}
+        self._lock = threading.Lock()           # 检索与写入都在锁内，避免读到修改到一半的字典
+        self._snapshot = None                   # 已加载快照的(inode, 修改时间)
+        self._offset = 0                        # 已读取的日志字节数
+        if path:
+            self.load()
+
+    @property
+    def _snapshot_path(self):
+        return self.path + '.json'
+
+    @property
+    def _journal_path(self):
+        return self.path + '.journal'
+
+    @contextmanager
+    def _file_lock(self):                       # 跨进程互斥，关闭文件时释放
+        with open(self.path + '.lock', 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def _apply(self, key, tf):                  # 替换文档的检索词，tf为空表示删除
+        old = self.docs.pop(key, None)
+        if old:
+            for term in old:
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(key, None)
+                    if not posting:
+                        del self.postings[term]
+        if tf:
+            self.docs[key] = tf
+            for term, count in tf.items():
+                self.postings.setdefault(term, {})[key] = count
+
+    def _snapshot_stamp(self):
+        try:
+            stat = os.stat(self._snapshot_path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime
+
+    def load(self):
+        self.docs, self.postings = {}, {}
+        self._snapshot, self._offset = self._snapshot_stamp(), 0
+        if self._snapshot is not None:
+            with io.open(self._snapshot_path, encoding='utf-8') as f:
+                for key, tf in json.load(f).items():
+                    self._apply(key, tf)
+        self._read_journal()                    # 重放快照之后的增量日志
+
+    def _read_journal(self):                    # 应用上次读取之后追加的完整行
+        try:
+            with open(self._journal_path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+        except IOError:
+            return
+        end = data.rfind(b'\n') + 1            # 其他进程可能正写到一半
+        for line in data[:end].splitlines():
+            if line.strip():
+                key, tf = json.loads(line.decode('utf-8'))
+                self._apply(key, tf)
+        self._offset += end
+
+    def _journal_size(self):
+        try:
+            return os.path.getsize(self._journal_path)
+        except OSError:
+            return 0
+
+    def _refresh(self):                         # 在锁内调用，读取其他进程的变更
+        if not self.path:
+            return
+        size = self._journal_size()
+        if self._snapshot_stamp() != self._snapshot or size < self._offset:
+            self.load()                         # 其他进程重建了索引
+        elif size > self._offset:
+            self._read_journal()
+
+    def update(self, entries):
+        """entries为(文档键, 文本)列表，文本为None表示删除该文档。"""
+        changes = [(key, _frequencies(tokenize(text)) if text else {})
+                   for key, text in entries]
+        with self._lock:
+            if not self.path:
+                for key, tf in changes:
+                    self._apply(key, tf)
+                return
+            # 先追加到日志再按日志顺序应用，与其他进程的写入保持相同顺序
+            with self._file_lock():
+                self._refresh()
+                with io.open(self._journal_path, 'a', encoding='utf-8') as f:
+                    f.write(u''.join(u'%s\n' % json.dumps([key, tf])
+                                     for key, tf in changes))
+                self._read_journal()
+
+    def rebuild(self, entries):
+        """以(文档键, 文本)迭代器重建索引，写入新快照并清空日志。
+
+        读取期间其他进程追加到日志的变更在写入快照前重放，不会随日志一起删除。
+        """
+        with self._lock:
+            start = 0
+            if self.path:
+                with self._file_lock():
+                    start = self._journal_size()
+            self.docs, self.postings = {}, {}
+            for key, text in entries:
+                self._apply(key, _frequencies(tokenize(text)))
+            if self.path:
+                with self._file_lock():
+                    # 日志变短说明其他进程也重建过，其日志中的变更都在本次读取开始之后
+                    self._offset = start if self._journal_size() >= start else 0
+                    self._read_journal()
+                    tmp = self._snapshot_path + '.tmp'
+                    with io.open(tmp, 'w', encoding='utf-8') as f:
+                        f.write(u'%s' % json.dumps(self.docs))
+                    os.rename(tmp, self._snapshot_path)
+                    if os.path.exists(self._journal_path):
+                        os.remove(self._journal_path)
+                    self._snapshot, self._offset = self._snapshot_stamp(), 0
+        return len(self.docs)
+
+    def search(self, text, prefix):
+        """返回前缀为prefix的文档中同时包含全部检索词的(文档键, 得分)列表，按得分降序。"""
+        terms = set(tokenize(text, for_query=True))
+        if not terms:
+            return []
+        with self._lock:
+            self._refresh()
+            return self._search(terms, prefix)
+
+    def _search(self, terms, prefix):
+        postings = [self.postings.get(term) for term in terms]
+        if not all(postings):
+            return []
+        postings.sort(key=len)                  # 从最短的倒排表开始求交集
+        candidates = [key for key in postings[0] if key.startswith(prefix)]
+        for posting in postings[1:]:
+            candidates = [key for key in candidates if key in posting]
+        total = float(len(self.docs)) or 1.0
+        idf = [math.log(1 + total / len(posting)) for posting in postings]
+        results = []
+        for key in candidates:
+            length = sum(self.docs[key].values())
+            score = sum(posting[key] * weight
+                        for posting, weight in zip(postings, idf))
+            results.append((key, score / math.sqrt(length)))
+        results.sort(key=lambda r: (-r[1], -int(r[0][1:])))  # 同分时新文档在前
+        return results
+
+
+def _current_index():
+    index = current_app.extensions.get('search')
+    if index is None:                           # 首次使用时从磁盘加载
+        index = current_app.extensions['search'] = InvertedIndex(
+            current_app.config.get('FLASKY_SEARCH_INDEX_PATH'))
+    return index
+
+
+def _post_key(id):
+    return 'p%d' % id
+
+
+def _user_key(id):
+    return 'u%d' % id
+
+
+class SearchIndex(object):
+    _events_registered = False
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['search'] = None
+        if not SearchIndex._events_registered:
+            self._register_events()
+            SearchIndex._events_registered = True
+
+    @staticmethod
+    def _register_events():
+        from . import db
+        from .models import User, Post              # 延迟导入，避免与models循环引用
+        event.listen(Post, 'after_insert', _queue_post)
+        event.listen(Post, 'after_update', _queue_post)
+        event.listen(Post, 'after_delete', _queue_post_delete)
+        event.listen(User, 'after_insert', _queue_user)
+        event.listen(User, 'after_update', _queue_user)
+        event.listen(User, 'after_delete', _queue_user_delete)
+        event.listen(db.session, 'after_commit', _apply_queued)
+        event.listen(db.session, 'after_soft_rollback', _discard_queued)
+
+    @property
+    def index(self):
+        return _current_index()
+
+    def search_posts(self, text):
+        return [(int(key[1:]), score)
+                for key, score in self.index.search(text, 'p')]
+
+    def search_users(self, text):
+        return [(int(key[1:]), score)
+                for key, score in self.index.search(text, 'u')]
+
+    def remove_posts(self, ids):                 # 批量删除不触发映射事件，由调用方在提交后调用
+        self.index.update([(_post_key(post_id), None) for post_id in ids])
+
+    def rebuild(self, batch_size=1000):          # 分批读取只含所需列的行，内存占用与表大小无关
+        from . import db
+        from .models import User, Post
+
+        def entries():
+            for id, name in db.session.query(User.id, User.name) \
+                    .yield_per(batch_size):
+                yield _user_key(id), name
+            for id, body in db.session.query(Post.id, Post.body) \
+                    .yield_per(batch_size):
+                yield _post_key(id), body
+        return self.index.rebuild(entries())
+
+
+def _queue(target, key, text):                  # 在会话中暂存变更，提交成功后才写入索引
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('search_queue', []).append((key, text))
+
+
+def _queue_post(mapper, connection, target):
+    if inspect(target).attrs.body.history.has_changes():
+        _queue(target, _post_key(target.id), target.body)
+
+
+def _queue_user(mapper, connection, target):
+    if inspect(target).attrs.name.history.has_changes():
+        _queue(target, _user_key(target.id), target.name)
+
+
+def _queue_post_delete(mapper, connection, target):
+    _queue(target, _post_key(target.id), None)
+
+
+def _queue_user_delete(mapper, connection, target):
+    _queue(target, _user_key(target.id), None)
+
+
+def _apply_queued(session):
+    queue = session.info.pop('search_queue', None)
+    if queue and has_app_context():
+        _current_index().update(queue)
+
+
+def _discard_queued(session, previous_transaction):
+    session.info.pop('search_queue', None)
@@ -0,0 +1,139 @@
+# -*- coding: UTF-8 -*-
+# 关注时间线：发文时把文章推送到每个粉丝的时间线（写扩散），
+# 粉丝数超过FLASKY_FANOUT_FOLLOWER_LIMIT的作者不推送并标记timeline_pull，读取时再合并其文章；
+# 标记不清除，粉丝数回落到上限以下后，未推送期间的文章仍按作者读取
+
+from flask import current_app
+from sqlalchemy import and_, event, literal, or_, select
+from sqlalchemy.orm import joinedload
+from . import db
+from .models import Follow, Post, TimelineEntry, User
+from .pagination import KeysetPagination, decode_cursor
+
+timeline = TimelineEntry.__table__
+users = User.__table__
+
+
+def _follower_limit():
+    return current_app.config['FLASKY_FANOUT_FOLLOWER_LIMIT']
+
+
+def _mark_pull(execute, author_id):
+    execute(users.update().where(and_(users.c.id == author_id,
+                                      ~users.c.timeline_pull))
+            .values(timeline_pull=True))
+
+
+def backfill(follower, followed):               # 关注后补入对方最近的文章，在粉丝数自增前调用
+    if (followed.followers_count or 0) >= _follower_limit():
+        _mark_pull(db.session.execute, followed.id)
+        return
+    recent = select([literal(follower.id), Post.id, Post.timestamp]) \
+        .where(Post.author_id == followed.id) \
+        .order_by(Post.timestamp.desc()) \
+        .limit(current_app.config['FLASKY_TIMELINE_BACKFILL'])
+    db.session.execute(timeline.insert().from_select(
+        ['user_id', 'post_id', 'timestamp'], recent))
+
+
+def remove(follower, followed):
+    db.session.execute(timeline.delete().where(and_(
+        timeline.c.user_id == follower.id,
+        timeline.c.post_id.in_(
+            select([Post.id]).where(Post.author_id == followed.id)))))
+
+
+def _fan_out(connection, post):
+    followers = connection.execute(
+        select([User.followers_count]).where(User.id == post.author_id)) \
+        .scalar()
+    if not followers:
+        return
+    if followers > _follower_limit():
+        _mark_pull(connection.execute, post.author_id)
+        return
+    connection.execute(timeline.insert().from_select(
+        ['user_id', 'post_id', 'timestamp'],
+        select([Follow.follower_id, literal(post.id),
+                literal(post.timestamp)])
+        .where(Follow.followed_id == post.author_id)))
+
+
+@event.listens_for(db.session, 'after_flush')
+def fan_out(session, flush_context):
+    # 与文章在同一事务中写入粉丝时间线；在整个flush之后执行，
+    # 同一次flush中新建的关注关系与粉丝数更新此时都已写入
+    posts = [obj for obj in session.new if isinstance(obj, Post)]
+    if posts:
+        connection = session.connection()
+        for post in posts:
+            _fan_out(connection, post)
+
+
+@event.listens_for(Post, 'before_delete')
+def _remove_post(mapper, connection, target):  # 先删除引用该文章的时间线条目
+    connection.execute(timeline.delete().where(
+        timeline.c.post_id == target.id))
+
+
+def _window(query, timestamp_column, id_column, limit, before, after):
+    # 单个数据源按游标取一段，after为向更新方向翻页
+    if after is not None:
+        cursor_timestamp, cursor_id = after
+        query = query.filter(or_(timestamp_column > cursor_timestamp,
+                                 and_(timestamp_column == cursor_timestamp,
+                                      id_column > cursor_id))) \
+            .order_by(timestamp_column.asc(), id_column.asc())
+    else:
+        if before is not None:
+            cursor_timestamp, cursor_id = before
+            query = query.filter(or_(timestamp_column < cursor_timestamp,
+                                     and_(timestamp_column == cursor_timestamp,
+                                          id_column < cursor_id)))
+        query = query.order_by(timestamp_column.desc(), id_column.desc())
+    return [(post_timestamp, post_id)
+            for post_id, post_timestamp in query.limit(limit)]
+
+
+def followed_posts(user, per_page, before=None, after=None):
+    """关注用户的文章，与keyset_paginate返回相同的分页对象。
+
+    物化时间线是一次(user_id, timestamp)索引范围扫描；标记了timeline_pull的作者的文章单独按作者取，
+    两路各取per_page + 1条后按(时间, id)合并去重。
+    """
+    before = decode_cursor(before) if before else None
+    after = decode_cursor(after) if after else None
+    limit = per_page + 1
+    celebrities = db.session.query(Follow.followed_id) \
+        .join(User, User.id == Follow.followed_id) \
+        .filter(Follow.follower_id == user.id,
+                User.timeline_pull)
+
+    def merged(before, after):
+        rows = _window(
+            db.session.query(TimelineEntry.post_id, TimelineEntry.timestamp)
+            .filter(TimelineEntry.user_id == user.id),
+            TimelineEntry.timestamp, TimelineEntry.post_id,
+            limit, before, after)
+        rows += _window(
+            db.session.query(Post.id, Post.timestamp)
+            .filter(Post.author_id.in_(celebrities)),
+            Post.timestamp, Post.id, limit, before, after)
+        rows = sorted(set(rows), reverse=after is None)
+        return [post_id for post_timestamp, post_id in rows[:limit]]
+
+    if after is not None:
+        ids = merged(None, after)
+        if len(ids) > per_page:
+            ids, has_prev, has_next = list(reversed(ids[:per_page])), True, True
+        else:                                   # 已回到最新的一页
+            after = before = None
+    if after is None:
+        ids = merged(before, None)
+        has_prev, has_next = before is not None, len(ids) > per_page
+        ids = ids[:per_page]
+    posts = Post.query.options(joinedload(Post.author).joinedload(User.role)) \
+        .filter(Post.id.in_(ids)).all() if ids else []
+    rank = dict((post_id, i) for i, post_id in enumerate(ids))
+    posts.sort(key=lambda post: rank[post.id])
+    return KeysetPagination(posts, has_prev, has_next, Post.timestamp, Post.id)
@@ -0,0 +1,206 @@
+# -*- coding: UTF-8 -*-
+# 数据导入导出：角色、用户、文章（含归档文章）及关注关系逐表以NDJSON或CSV流式读写，每表一个文件。
+# 导出使用服务端游标按批读取，导入按批bulk_insert_mappings，内存占用与表大小无关
+
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime
+from flask import current_app
+from . import db
+from .page_cache import PageCache
+from .models import Role, User, Post, ArchivedPost, Follow, TimelineEntry, \
+    recount_posts
+
+# 按外键依赖排序，导入时依次写入；关注关系与时间线随用户、文章一起迁移，保持粉丝数一致。
+# 归档文章在归档库（bind 'archive'）中，未启用归档时跳过
+MODELS = (Role, User, Post, ArchivedPost, Follow, TimelineEntry)
+CSV_NULL = '\\N'                                # CSV中的NULL，与PostgreSQL COPY一致
+PY2 = str is bytes
+
+
+def _bind_key(model):
+    return model.__table__.info.get('bind_key')
+
+
+def _configured(model):                         # 模型所在的库已配置
+    bind_key = _bind_key(model)
+    return bind_key is None or \
+        bind_key in (current_app.config.get('SQLALCHEMY_BINDS') or {})
+
+
+def _engine(model):
+    return db.get_engine(bind=_bind_key(model))
+
+
+def _columns(model):
+    return list(model.__table__.columns)
+
+
+def _path(directory, model, fmt):
+    return os.path.join(directory, '%s.%s' % (model.__tablename__, fmt))
+
+
+def _encode(value):                             # 导出为JSON兼容的值
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _decode(column, value):                     # 按列类型还原，CSV中的值均为字符串
+    if value is None or value == CSV_NULL:
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime:
+        fmt = '%Y-%m-%dT%H:%M:%S.%f' if '.' in value else '%Y-%m-%dT%H:%M:%S'
+        return datetime.strptime(value, fmt)
+    if python_type is bool:
+        return value in (True, 1, '1', 'True', 'true')
+    if python_type is int:
+        return int(value)
+    return value
+
+
+class _NDJSONWriter(object):
+    def __init__(self, f, names):
+        self.f = f
+        self.names = names
+
+    def write(self, row):                       # ensure_ascii保证Python 2/3下都输出ASCII字符串
+        self.f.write(json.dumps(dict(zip(self.names, map(_encode, row))),
+                                sort_keys=True))
+        self.f.write('\n')
+
+
+class _CSVWriter(object):
+    def __init__(self, f, names):
+        self.writer = csv.writer(f)
+        self.writer.writerow(names)
+
+    @staticmethod
+    def _cell(value):
+        if value is None:
+            return CSV_NULL
+        if isinstance(value, bool):
+            return '1' if value else '0'
+        value = _encode(value)
+        if PY2 and isinstance(value, unicode):  # noqa: F821 Python 2的csv模块只接受字节串
+            return value.encode('utf-8')
+        return value
+
+    def write(self, row):
+        self.writer.writerow([self._cell(value) for value in row])
+
+
+def _open(path, fmt, mode):
+    if fmt == 'csv' and not PY2:
+        return io.open(path, mode, encoding='utf-8', newline='')
+    return open(path, mode + ('b' if fmt == 'csv' else ''))
+
+
+def _read(f, fmt):                              # 逐行产生{列名: 字符串或JSON值}
+    if fmt == 'ndjson':
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+        return
+    reader = csv.reader(f)
+    names = next(reader)
+    for cells in reader:
+        if PY2:
+            cells = [cell.decode('utf-8') for cell in cells]
+        yield dict(zip(names, cells))
+
+
+def export_table(model, path, fmt='ndjson', batch_size=1000):
+    """导出一张表，每写完一批产生已导出的行数。"""
+    columns = _columns(model)
+    names = [column.name for column in columns]
+    query = db.select(columns).order_by(*model.__table__.primary_key.columns)
+    with _engine(model).connect() as conn, _open(path, fmt, 'w') as f:
+        writer = (_NDJSONWriter if fmt == 'ndjson' else _CSVWriter)(f, names)
+        result = conn.execution_options(stream_results=True).execute(query)
+        count = 0
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                writer.write(row)
+            count += len(rows)
+            yield count
+
+
+def import_table(model, path, fmt='ndjson', batch_size=1000):
+    """导入一张表，保留原主键，每提交一批产生已导入的行数。
+
+    bulk_insert_mappings不触发映射器事件，导入后需重建全文检索索引；目标表应为空。
+    """
+    columns = dict((column.name, column) for column in _columns(model))
+    count = 0
+    with _open(path, fmt, 'r') as f:
+        batch = []
+        for record in _read(f, fmt):
+            batch.append(dict((name, _decode(columns[name], value))
+                              for name, value in record.items()
+                              if name in columns))
+            if len(batch) >= batch_size:
+                db.session.bulk_insert_mappings(model, batch)
+                db.session.commit()
+                count += len(batch)
+                batch = []
+                yield count
+        if batch:
+            db.session.bulk_insert_mappings(model, batch)
+            db.session.commit()
+            count += len(batch)
+            yield count
+    _reset_sequence(model)
+    PageCache.purge()                           # bulk_insert_mappings不触发清空整页缓存的事件
+    if model in (Post, ArchivedPost):           # 文件中的用户计数可能与导入的文章不一致
+        recount_posts()
+
+
+def _reset_sequence(model):                     # PostgreSQL显式写入主键后，自增序列需跟上最大值
+    engine = _engine(model)
+    if engine.dialect.name != 'postgresql' or \
+            'id' not in model.__table__.columns or \
+            not model.__table__.columns['id'].autoincrement:
+        return
+    table = model.__tablename__
+    db.session.execute(
+        "SELECT setval(pg_get_serial_sequence('%s', 'id'), "
+        "COALESCE((SELECT MAX(id) FROM %s), 1))" % (table, table),
+        bind=engine)
+    db.session.commit()
+
+
+def _progress(tables, run):
+    for model in MODELS:
+        if tables and model.__tablename__ not in tables or \
+                not _configured(model):
+            continue
+        start = time.time()
+        for count in run(model):
+            elapsed = time.time() - start
+            yield model.__tablename__, count, count / elapsed if elapsed else 0.0
+
+
+def export_data(directory, fmt='ndjson', tables=None, batch_size=1000):
+    """逐表导出到directory，产生(表名, 已处理行数, 每秒行数)。"""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    return _progress(tables, lambda model: export_table(
+        model, _path(directory, model, fmt), fmt, batch_size))
+
+
+def import_data(directory, fmt='ndjson', tables=None, batch_size=1000):
+    """从directory逐表导入，缺少的文件跳过，产生(表名, 已处理行数, 每秒行数)。"""
+    def run(model):
+        path = _path(directory, model, fmt)
+        if os.path.exists(path):
+            return import_table(model, path, fmt, batch_size)
+        return iter(())
+    return _progress(tables, run)
@@ -0,0 +1,108 @@
+# -*- coding: UTF-8 -*-
+# 用户加载缓存：按主键缓存游离的User快照，每次请求merge(load=False)进会话，不再查询数据库
+
+import threading
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached, object_session
+from .cache import LRUCache
+
+
+def _current_cache():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('user_cache')
+
+
+class _Cache(object):
+    # ORM对象只能缓存在进程内，因此固定使用LRU存储
+    def __init__(self, maxsize, timeout):
+        self.store = LRUCache(maxsize, timeout)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @staticmethod
+    def _snapshot(user):                        # 复制列属性到新实例，与请求会话中的对象互不影响
+        mapper = type(user).__mapper__
+        copy = mapper.class_manager.new_instance()
+        for attr in mapper.column_attrs:
+            setattr(copy, attr.key, getattr(user, attr.key))
+        make_transient_to_detached(copy)
+        return copy
+
+    def load(self, user_id):
+        from . import db
+        from .models import User
+        snapshot = self.store.get(user_id)
+        self._count(snapshot is not None)
+        if snapshot is not None:
+            return db.session.merge(snapshot, load=False)
+        user = User.query.get(user_id)
+        if user is not None:
+            self.store.set(user_id, self._snapshot(user))
+        return user
+
+    def invalidate(self, user_id):
+        self.store.delete(user_id)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class UserCache(object):
+    _events_registered = False
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['user_cache'] = _Cache(
+            app.config.get('FLASKY_USER_CACHE_SIZE', 1000),
+            app.config.get('FLASKY_USER_CACHE_TIMEOUT', 30))
+        if not UserCache._events_registered:
+            from . import db
+            from .models import User                # 延迟导入，避免与models循环引用
+            event.listen(User, 'after_update', _queue_user)
+            event.listen(User, 'after_delete', _queue_user)
+            event.listen(db.session, 'after_commit', _invalidate_queued)
+            event.listen(db.session, 'after_soft_rollback', _discard_queued)
+            UserCache._events_registered = True
+
+    @staticmethod
+    def load(user_id):
+        return current_app.extensions['user_cache'].load(user_id)
+
+    @staticmethod
+    def invalidate(user_id):
+        cache = _current_cache()
+        if cache is not None:
+            cache.invalidate(user_id)
+
+    @staticmethod
+    def stats():
+        return current_app.extensions['user_cache'].stats()
+
+
+def _queue_user(mapper, connection, target):   # 资料、角色等任何修改都使缓存失效
+    # flush时失效会让并发请求在提交前把旧数据重新缓存，因此提交成功后才失效
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('user_cache_queue', set()).add(target.id)
+
+
+def _invalidate_queued(session):
+    for user_id in session.info.pop('user_cache_queue', ()):
+        UserCache.invalidate(user_id)
+
+
+def _discard_queued(session, previous_transaction):
+    session.info.pop('user_cache_queue', None)
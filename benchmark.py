@@ -0,0 +1,400 @@
+# -*- coding: UTF-8 -*-
+# 压测基准：生成固定随机种子的测试数据，通过Flask测试客户端驱动主要视图，
+# 统计各场景p50/p99耗时、每请求查询数与内存峰值，结果写入JSON便于版本间对比。
+# startup()在新进程中测量冷启动：导入、create_app与第一个响应的耗时；
+# serving()分别以serve.py的各模式启动服务进程，用并发HTTP客户端比较吞吐量与延迟
+
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+from datetime import datetime
+from sqlalchemy import event
+
+try:
+    import tracemalloc                          # Python 3.4+
+except ImportError:
+    tracemalloc = None
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection          # Python 2
+
+SCENARIOS = ('index', 'user', 'login', 'register')
+MEMORY_SAMPLES = 20
+# 启动模式 -> (FLASKY_LAZY_INIT, 是否使用预先生成的模板字节码缓存)
+STARTUP_MODES = {
+    'eager': (False, False),
+    'lazy': (True, False),
+    'eager-cached': (False, True),
+    'lazy-cached': (True, True),
+}
+# 在子进程中执行，输出各阶段耗时（毫秒）
+STARTUP_SCRIPT = '''
+import json, sys, timeit
+start = timeit.default_timer()
+import app
+imported = timeit.default_timer()
+application = app.create_app(sys.argv[1])
+created = timeit.default_timer()
+response = application.test_client().get(sys.argv[2])
+done = timeit.default_timer()
+if response.status_code != 200:
+    sys.exit('%s returned %d' % (sys.argv[2], response.status_code))
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_response_ms': (done - created) * 1000,
+}))
+'''
+
+
+SERVING_MODES = ('threaded', 'gevent')
+# 在子进程中生成测试数据，输出全部用户名
+SEED_SCRIPT = '''
+import json, random, sys
+from app import create_app, db, fake
+from app.models import Role, User
+random.seed(int(sys.argv[3]))
+application = create_app('testing')
+with application.app_context():
+    db.create_all()
+    Role.insert_roles()
+    for _ in fake.users(int(sys.argv[1])):
+        pass
+    for _ in fake.posts(int(sys.argv[2])):
+        pass
+    print(json.dumps([name for name, in db.session.query(User.name)]))
+'''
+# 在子进程中按serve.py的方式启动服务；每条SQL前等待db_latency秒，模拟数据库的网络往返
+SERVE_SCRIPT = '''
+import sys, time
+import serve
+mode, port, latency, pool = sys.argv[1], int(sys.argv[2]), float(sys.argv[3]), int(sys.argv[4])
+if mode == 'gevent':
+    serve.patch_gevent()
+from sqlalchemy import event
+from app import create_app, db
+application = create_app('testing')
+application.config['FLASKY_PAGE_CACHE'] = False
+application.config['FLASKY_DB_ENGINE_OPTIONS'] = {
+    'connect_args': {'check_same_thread': False}}   # 连接池中的SQLite连接会被不同线程使用
+serve.bound_pool(application, pool)
+with application.app_context():
+    if latency:
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda *args: time.sleep(latency))
+server = serve.make_server(application, mode, '127.0.0.1', port,
+                           int(sys.argv[5]))
+server.serve_forever()
+'''
+
+
+def percentile(values, p):                      # 最近秩法
+    ordered = sorted(values)
+    index = max(int(round(p / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class _QueryCounter(object):
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def _requests(app, scenario, names, emails, password):
+    """返回一个执行单次请求的函数。"""
+    client = app.test_client()
+    counter = [0]
+
+    def index():
+        return client.get('/')
+
+    def user():
+        return client.get('/user/%s' % random.choice(names))
+
+    def login():                                # 每次使用新客户端，避免复用已登录的会话
+        return app.test_client().post('/auth/login', data={
+            'email': random.choice(emails), 'password': password})
+
+    def register():
+        counter[0] += 1
+        name = 'bench%d' % counter[0]
+        return client.post('/auth/register', data={
+            'email': '%s@example.com' % name, 'name': name,
+            'password': 'cat', 'password2': 'cat'})
+    return {'index': index, 'user': user, 'login': login,
+            'register': register}[scenario]
+
+
+def run(config_name='testing', users=100, posts=1000, requests=200,
+        scenarios=SCENARIOS, seed=42, output=None):
+    from app import create_app, db
+    from app import fake
+    from app.models import Role, User
+
+    random.seed(seed)
+    app = create_app(config_name)
+    app.config['FLASKY_RATE_LIMIT'] = False     # 压测从同一地址反复登录、注册
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'config': config_name,
+            'users': users,
+            'posts': posts,
+            'requests': requests,
+            'seed': seed,
+        },
+        'scenarios': {},
+    }
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        for _ in fake.users(users):
+            pass
+        for _ in fake.posts(posts):
+            pass
+        names = [name for name, in db.session.query(User.name)]
+        emails = [email for email, in db.session.query(User.email)]
+        db.session.remove()
+        engine = db.engine
+
+        for scenario in scenarios:
+            send = _requests(app, scenario, names, emails, fake.FAKE_PASSWORD)
+            send()                              # 预热：模板编译、连接池等
+            counter = _QueryCounter()
+            timings = []
+            event.listen(engine, 'before_cursor_execute', counter)
+            try:
+                for _ in range(requests):
+                    start = timeit.default_timer()
+                    response = send()
+                    timings.append(timeit.default_timer() - start)
+                    if response.status_code >= 400:
+                        raise RuntimeError('%s returned %d' % (
+                            scenario, response.status_code))
+            finally:
+                event.remove(engine, 'before_cursor_execute', counter)
+            peak = None
+            if tracemalloc is not None:         # 内存跟踪会拖慢请求，单独跑几次测量峰值
+                tracemalloc.start()
+                for _ in range(min(requests, MEMORY_SAMPLES)):
+                    send()
+                peak = tracemalloc.get_traced_memory()[1] // 1024
+                tracemalloc.stop()
+            results['scenarios'][scenario] = {
+                'p50_ms': round(percentile(timings, 50) * 1000, 3),
+                'p99_ms': round(percentile(timings, 99) * 1000, 3),
+                'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+                'queries_per_request': round(
+                    counter.count / float(requests), 2),
+                'peak_traced_memory_kb': peak,
+            }
+    results['meta']['max_rss_kb'] = \
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return results
+
+
+def _start(config_name, path, lazy, cache_dir):
+    env = dict(os.environ, FLASKY_LAZY_INIT='1' if lazy else '0')
+    env.pop('FLASKY_TEMPLATE_CACHE_DIR', None)
+    if cache_dir:
+        env['FLASKY_TEMPLATE_CACHE_DIR'] = cache_dir
+    start = timeit.default_timer()
+    out = subprocess.check_output(
+        [sys.executable, '-W', 'ignore', '-c', STARTUP_SCRIPT, config_name, path], env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__)))
+    timings = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+    timings['process_ms'] = (timeit.default_timer() - start) * 1000  # 含解释器启动
+    return timings
+
+
+def startup(config_name='testing', runs=5, path='/auth/login',
+            modes=sorted(STARTUP_MODES), output=None, baseline=None):
+    """每种模式启动runs个新进程，记录各阶段耗时的中位数。
+
+    baseline为之前写出的结果文件时，附上process_ms相对基线的变化百分比。
+    """
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'config': config_name,
+            'runs': runs,
+            'path': path,
+        },
+        'startup': {},
+    }
+    cache_dir = tempfile.mkdtemp()
+    try:
+        _start(config_name, path, False, cache_dir)     # 生成模板字节码缓存
+        for mode in modes:
+            lazy, cached = STARTUP_MODES[mode]
+            samples = [_start(config_name, path, lazy, cached and cache_dir)
+                       for _ in range(runs)]
+            results['startup'][mode] = dict(
+                (key, round(percentile([t[key] for t in samples], 50), 3))
+                for key in samples[0])
+    finally:
+        shutil.rmtree(cache_dir)
+    if baseline:
+        with open(baseline) as f:
+            previous = json.load(f).get('startup', {})
+        for mode, stats in results['startup'].items():
+            if mode in previous:
+                stats['process_change_pct'] = round(
+                    (stats['process_ms'] / previous[mode]['process_ms'] - 1) * 100,
+                    1)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return results
+
+
+def _free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def _get(port, path):
+    connection = HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def _wait_ready(process, port, log, timeout=60):
+    deadline = timeit.default_timer() + timeout
+    while timeit.default_timer() < deadline:
+        if process.poll() is not None:
+            log.seek(0)
+            raise RuntimeError('Server exited:\n' + log.read().decode('utf-8', 'replace'))
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except socket.error:
+            time.sleep(0.1)
+    raise RuntimeError('Server did not start on port %d' % port)
+
+
+def _load(port, paths, requests, concurrency):
+    """concurrency个线程共同发出requests个请求，每个请求一个新连接，返回耗时与出错数。"""
+    timings, errors, lock = [], [0], threading.Lock()
+    remaining = [requests]
+
+    def worker():
+        while True:
+            with lock:
+                if not remaining[0]:
+                    return
+                remaining[0] -= 1
+            path = random.choice(paths)
+            start = timeit.default_timer()
+            try:
+                failed = _get(port, path) >= 400
+            except (socket.error, IOError):
+                failed = True
+            elapsed = timeit.default_timer() - start
+            with lock:
+                timings.append(elapsed)
+                if failed:
+                    errors[0] += 1
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = timeit.default_timer()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timeit.default_timer() - start, timings, errors[0]
+
+
+def serving(modes=SERVING_MODES, users=50, posts=500, requests=500,
+            concurrency=50, db_latency_ms=5, db_pool=10, seed=42, output=None):
+    """以各模式启动服务，用concurrency个并发客户端请求主页与用户页，比较吞吐量。
+
+    所有模式使用同一份数据、同样大小的连接池（不允许溢出）与同样的模拟数据库延迟，
+    gevent未安装时该模式记为skipped。
+    """
+    results = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'users': users,
+            'posts': posts,
+            'requests': requests,
+            'concurrency': concurrency,
+            'db_latency_ms': db_latency_ms,
+            'db_pool': db_pool,
+            'seed': seed,
+        },
+        'serving': {},
+    }
+    root = os.path.dirname(os.path.abspath(__file__))
+    directory = tempfile.mkdtemp()
+    env = dict(os.environ, TEST_DATABASE_URL='sqlite:///' +
+               os.path.join(directory, 'bench.sqlite'))
+    env.pop('FLASKY_ARCHIVE_AFTER_DAYS', None)
+    try:
+        out = subprocess.check_output(
+            [sys.executable, '-W', 'ignore', '-c', SEED_SCRIPT, str(users),
+             str(posts), str(seed)], env=env, cwd=root)
+        names = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+        paths = ['/'] + ['/user/%s' % name for name in names]
+        random.seed(seed)
+        for mode in modes:
+            if mode == 'gevent':
+                try:
+                    import gevent  # noqa    只检查是否安装，补丁在服务进程中进行
+                except ImportError:
+                    results['serving'][mode] = {'skipped': 'gevent is not installed'}
+                    continue
+            port = _free_port()
+            with tempfile.TemporaryFile() as log:
+                process = subprocess.Popen(
+                    [sys.executable, '-W', 'ignore', '-c', SERVE_SCRIPT, mode,
+                     str(port), str(db_latency_ms / 1000.0), str(db_pool),
+                     str(concurrency)],
+                    env=env, cwd=root, stdout=log, stderr=log)
+                try:
+                    _wait_ready(process, port, log)
+                    for path in paths[:10]:     # 预热：模板编译、连接池等
+                        _get(port, path)
+                    elapsed, timings, errors = _load(port, paths, requests,
+                                                     concurrency)
+                finally:
+                    process.terminate()
+                    process.wait()
+            results['serving'][mode] = {
+                'requests_per_s': round(len(timings) / elapsed, 2),
+                'p50_ms': round(percentile(timings, 50) * 1000, 3),
+                'p99_ms': round(percentile(timings, 99) * 1000, 3),
+                'errors': errors,
+            }
+    finally:
+        shutil.rmtree(directory)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return results
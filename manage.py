@@ -1,15 +1,19 @@
 # -*- coding: UTF-8 -*-
 
+import os
 import sys
 
-from app import create_app, db
+from app import create_app, db, search_index
 from app.models import User, Role
-from flask_script import Manager, Shell
+from flask import current_app
+from flask_script import Manager, Shell, Command, Option
 
 reload(sys)
 sys.setdefaultencoding('utf-8')
-app = create_app('default')
-manager = Manager(app)
+# 应用在执行命令前才创建，--help等不需要应用的操作不付出初始化代价
+manager = Manager(create_app)
+manager.add_option('-c', '--config', dest='config_name', required=False,
+                   default=os.environ.get('FLASK_CONFIG') or 'default')
 
 
 def make_shell_context():
@@ -19,5 +23,233 @@ def make_shell_context():
 # Test
 manager.add_command("shell", Shell(make_context=make_shell_context))
 
+
+@manager.command
+def rebuild_search_index():
+    """Rebuild the full-text search index from the database."""
+    count = search_index.rebuild()
+    print('Indexed %d documents.' % count)
+
+
+@manager.command
+def recount_posts():
+    """Recompute every user's post count and latest post time."""
+    from app.models import recount_posts
+    recount_posts()
+    print('Post counters updated.')
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=500)
+@manager.option('-p', '--processes', dest='processes', type=int, default=None)
+@manager.option('-a', '--all', dest='rerender', action='store_true',
+                default=False, help='Re-render posts that already have body_html')
+def backfill_body_html(batch_size, processes, rerender):
+    """Render body_html for existing posts in batches across a process pool."""
+    from app.rendering import backfill_body_html
+    for done, last_id in backfill_body_html(batch_size, processes,
+                                            only_missing=not rerender):
+        print('%d posts rendered (last id %d)' % (done, last_id))
+
+
+@manager.command
+def compile_templates():
+    """Compile every template into the FLASKY_TEMPLATE_CACHE_DIR bytecode cache."""
+    from app import compile_templates
+    if current_app.jinja_env.bytecode_cache is None:
+        print('FLASKY_TEMPLATE_CACHE_DIR is not set.')
+        return
+    print('%d templates compiled.' % compile_templates(current_app))
+
+
+@manager.option('-d', '--directory', dest='directory', default=None,
+                help='Output directory, default FLASKY_ASSETS_DIR')
+def build_assets(directory):
+    """Copy static files to content-hashed names with gzip/brotli variants."""
+    from app.assets import build
+    directory = directory or current_app.config['FLASKY_ASSETS_DIR']
+    manifest = build(current_app, directory)
+    print('%d assets written to %s; restart the app to pick up the manifest.' % (
+        len(manifest), directory))
+
+
+@manager.option('-a', '--action', dest='action', required=True,
+                choices=('role', 'deactivate', 'activate'))
+@manager.option('-t', '--to-role', dest='to_role', default=None,
+                help='New role name for --action role')
+@manager.option('-r', '--role', dest='role', default=None,
+                help='Only users with this role')
+@manager.option('-e', '--email-domain', dest='email_domain', default=None)
+@manager.option('-i', '--inactive-days', dest='inactive_days', type=int,
+                default=None, help='Only users not seen for this many days')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=1000)
+@manager.option('-n', '--dry-run', dest='dry_run', action='store_true',
+                default=False, help='Only count the matching users')
+def bulk_users(action, to_role, role, email_domain, inactive_days, batch_size,
+               dry_run):
+    """Reassign, deactivate or activate every user matching the filters."""
+    from app import bulk
+
+    def role_id(name):
+        found = Role.query.filter_by(name=name).first()
+        if found is None:
+            raise SystemExit('Unknown role %r' % name)
+        return found.id
+    criteria = bulk.user_criteria(role_id=role and role_id(role),
+                                  email_domain=email_domain,
+                                  inactive_days=inactive_days)
+    total = bulk.count_users(criteria)
+    if dry_run:
+        print('%d users match.' % total)
+        return
+    for done, last_id in bulk.apply(action, criteria,
+                                    to_role and role_id(to_role), batch_size):
+        print('%d/%d users updated (last id %d)' % (done, total, last_id))
+
+
+@manager.option('-r', '--roles', dest='roles', default=None,
+                help='Comma-separated role names, default all')
+@manager.option('-g', '--grant', dest='grant', default='',
+                help='Comma-separated permissions, e.g. MODERATE')
+@manager.option('-x', '--revoke', dest='revoke', default='')
+def permissions(roles, grant, revoke):
+    """Grant or revoke permissions on roles in one UPDATE."""
+    from app.bulk import change_permissions
+    from app.models import Permission
+
+    def bits(names):
+        try:
+            return sum(getattr(Permission, name.strip().upper())
+                       for name in names.split(',') if name.strip())
+        except AttributeError as e:
+            raise SystemExit('Unknown permission: %s' % e)
+    count = change_permissions(roles.split(',') if roles else None,
+                               bits(grant), bits(revoke))
+    print('%d roles updated.' % count)
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=None,
+                help='Posts per transaction, default FLASKY_ARCHIVE_BATCH_SIZE')
+def archive_posts(batch_size):
+    """Move posts older than FLASKY_ARCHIVE_AFTER_DAYS into the archive."""
+    from app import archive
+    if not archive.enabled():
+        print('FLASKY_ARCHIVE_AFTER_DAYS is not set.')
+        return
+    db.create_all(bind='archive')               # 首次归档时建立归档表
+    batch_size = batch_size or current_app.config['FLASKY_ARCHIVE_BATCH_SIZE']
+    for done, timestamp in archive.archive_posts(batch_size):
+        print('%d posts archived (up to %s)' % (done, timestamp))
+
+
+@manager.option('-u', '--users', dest='users', type=int, default=100)
+@manager.option('-p', '--posts', dest='posts', type=int, default=1000)
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=1000)
+def fake(users, posts, batch_size):
+    """Generate fake users and posts with batched inserts."""
+    from app import fake as fake_data
+    for count in fake_data.users(users, batch_size):
+        print('%d users inserted' % count)
+    for count in fake_data.posts(posts, batch_size):
+        print('%d posts inserted' % count)
+    print('Run rebuild_search_index to index the generated data.')
+
+
+@manager.option('-C', '--bench-config', dest='bench_config', default='testing')
+@manager.option('-u', '--users', dest='users', type=int, default=100)
+@manager.option('-p', '--posts', dest='posts', type=int, default=1000)
+@manager.option('-n', '--requests', dest='requests', type=int, default=200)
+@manager.option('-o', '--output', dest='output', default='benchmark.json')
+def benchmark(bench_config, users, posts, requests, output):
+    """Benchmark index, user, login and register and write JSON results."""
+    import benchmark
+    results = benchmark.run(bench_config, users, posts, requests, output=output)
+    for name, stats in sorted(results['scenarios'].items()):
+        print('%-10s p50 %8.2fms  p99 %8.2fms  %5.1f queries/request' % (
+            name, stats['p50_ms'], stats['p99_ms'],
+            stats['queries_per_request']))
+    print('Results written to %s' % output)
+
+
+@manager.option('-C', '--bench-config', dest='bench_config', default='testing')
+@manager.option('-n', '--runs', dest='runs', type=int, default=5)
+@manager.option('-o', '--output', dest='output', default='startup.json')
+@manager.option('-b', '--baseline', dest='baseline', default=None,
+                help='Earlier results file to compare against')
+def benchmark_startup(bench_config, runs, output, baseline):
+    """Measure cold start of fresh processes, eager and lazy, with and without
+    the template bytecode cache."""
+    import benchmark
+    results = benchmark.startup(bench_config, runs, output=output,
+                                baseline=baseline)
+    for mode, stats in sorted(results['startup'].items()):
+        change = stats.get('process_change_pct')
+        print('%-13s import %7.1fms  create_app %7.1fms  first response %7.1fms  '
+              'process %7.1fms%s' % (
+                  mode, stats['import_ms'], stats['create_app_ms'],
+                  stats['first_response_ms'], stats['process_ms'],
+                  '' if change is None else '  (%+.1f%%)' % change))
+    print('Results written to %s' % output)
+
+
+@manager.option('-n', '--requests', dest='requests', type=int, default=500)
+@manager.option('-k', '--concurrency', dest='concurrency', type=int, default=50)
+@manager.option('-l', '--db-latency', dest='db_latency', type=float, default=5,
+                help='Simulated database round trip in milliseconds')
+@manager.option('-p', '--db-pool', dest='db_pool', type=int, default=10)
+@manager.option('-o', '--output', dest='output', default='serving.json')
+def benchmark_serving(requests, concurrency, db_latency, db_pool, output):
+    """Compare concurrent-request throughput of the threaded and gevent servers."""
+    import benchmark
+    results = benchmark.serving(requests=requests, concurrency=concurrency,
+                                db_latency_ms=db_latency, db_pool=db_pool,
+                                output=output)
+    for mode, stats in sorted(results['serving'].items()):
+        if 'skipped' in stats:
+            print('%-9s skipped: %s' % (mode, stats['skipped']))
+            continue
+        print('%-9s %8.1f req/s  p50 %8.2fms  p99 %8.2fms  %d errors' % (
+            mode, stats['requests_per_s'], stats['p50_ms'], stats['p99_ms'],
+            stats['errors']))
+    print('Results written to %s' % output)
+
+
+@manager.option('-d', '--directory', dest='directory', default='export')
+@manager.option('-f', '--format', dest='fmt', default='ndjson',
+                choices=('ndjson', 'csv'))
+@manager.option('-t', '--tables', dest='tables', default=None,
+                help='Comma-separated table names, default all')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=1000)
+def export(directory, fmt, tables, batch_size):
+    """Stream roles, users, posts and follows to one NDJSON or CSV file per table."""
+    from app.transfer import export_data
+    tables = tables.split(',') if tables else None
+    for table, count, rate in export_data(directory, fmt, tables, batch_size):
+        print('%s: %d rows exported (%d rows/s)' % (table, count, rate))
+
+
+class Import(Command):
+    """Bulk load files written by export into an empty database."""
+
+    option_list = (
+        Option('-d', '--directory', dest='directory', default='export'),
+        Option('-f', '--format', dest='fmt', default='ndjson',
+               choices=('ndjson', 'csv')),
+        Option('-t', '--tables', dest='tables', default=None,
+               help='Comma-separated table names, default all'),
+        Option('-b', '--batch-size', dest='batch_size', type=int, default=1000),
+    )
+
+    def run(self, directory, fmt, tables, batch_size):
+        from app.transfer import import_data
+        tables = tables.split(',') if tables else None
+        for table, count, rate in import_data(directory, fmt, tables,
+                                              batch_size):
+            print('%s: %d rows imported (%d rows/s)' % (table, count, rate))
+        print('Run rebuild_search_index to index the imported data.')
+
+
+manager.add_command('import', Import())    # import是关键字，不能作函数名
+
+
 if __name__ == '__main__':
     manager.run()
@@ -0,0 +1,97 @@
+# -*- coding: UTF-8 -*-
+# 服务入口：--mode gevent时每个请求在一个协程中处理，等待数据库、SMTP等I/O时让出，
+# 一个进程可同时处理大量请求，并发访问数据库的协程数受连接池上限约束；
+# --mode threaded为原来的每请求一个线程的WSGI服务，用于对比。
+# gevent的monkey patch必须在导入应用及其依赖之前完成，因此本文件不在模块级导入app。
+# patch之后线程池也运行在协程上，CPU密集的密码哈希会阻塞所有请求，
+# app/passwords.py检测到patch后改在gevent hub的线程池（真实系统线程）中计算
+#
+#   python serve.py --mode gevent --config production --port 8000 --connections 1000
+
+import argparse
+import os
+import sys
+
+MODES = ('threaded', 'gevent')
+
+
+def patch_gevent():
+    """把socket、线程、锁等替换为协程版本，并让psycopg2在等待服务器时让出。"""
+    from gevent import monkey
+    monkey.patch_all()
+    try:
+        import psycopg2
+        from psycopg2 import extensions
+    except ImportError:
+        return
+    from gevent.socket import wait_read, wait_write
+
+    def wait_callback(conn, timeout=None):
+        while True:
+            state = conn.poll()
+            if state == extensions.POLL_OK:
+                break
+            elif state == extensions.POLL_READ:
+                wait_read(conn.fileno(), timeout=timeout)
+            elif state == extensions.POLL_WRITE:
+                wait_write(conn.fileno(), timeout=timeout)
+            else:
+                raise psycopg2.OperationalError('Bad result from poll: %r' % state)
+    extensions.set_wait_callback(wait_callback)
+
+
+def bound_pool(app, size):
+    """数据库连接池固定为size个连接、不允许溢出，超出的请求在池上等待（协程中不阻塞进程）。"""
+    from sqlalchemy.pool import QueuePool
+    options = dict(app.config.get('FLASKY_DB_ENGINE_OPTIONS') or {})
+    options.update(poolclass=QueuePool, pool_size=size, max_overflow=0)
+    app.config['FLASKY_DB_ENGINE_OPTIONS'] = options
+
+
+def make_server(app, mode, host, port, connections=None):
+    if mode == 'gevent':
+        from gevent.pool import Pool
+        from gevent.pywsgi import WSGIServer
+        return WSGIServer((host, port), app, log=None,
+                          spawn=Pool(connections or
+                                     app.config['FLASKY_SERVER_CONNECTIONS']))
+    if mode == 'threaded':
+        from werkzeug.serving import make_server as make_wsgi_server
+        return make_wsgi_server(host, port, app, threaded=True)
+    raise ValueError('Unknown server mode %r' % mode)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the Flasky app.')
+    parser.add_argument('-m', '--mode', choices=MODES, default='gevent')
+    parser.add_argument('-c', '--config',
+                        default=os.environ.get('FLASK_CONFIG') or 'default')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=5000)
+    parser.add_argument('--connections', type=int, default=None,
+                        help='Concurrent requests in gevent mode, '
+                             'default FLASKY_SERVER_CONNECTIONS')
+    parser.add_argument('--db-pool', type=int, default=None,
+                        help='Fixed database pool size, '
+                             'default FLASKY_DB_ENGINE_OPTIONS')
+    args = parser.parse_args(argv)
+    if args.mode == 'gevent':
+        patch_gevent()
+
+    from app import create_app, job_queue
+    app = create_app(args.config)
+    if args.db_pool:
+        bound_pool(app, args.db_pool)
+    with app.app_context():                     # 只在服务进程中启动后台任务线程，接着执行遗留的任务
+        job_queue.start()
+    server = make_server(app, args.mode, args.host, args.port, args.connections)
+    print('Serving %s on http://%s:%d' % (args.mode, args.host, args.port))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# 测试辅助：统计代码块内执行的SQL条数，防止视图退化为N+1查询；本地SMTP替身
+
+import threading
+from contextlib import contextmanager
+from sqlalchemy import event
+try:
+    import socketserver
+except ImportError:                             # Python 2
+    import SocketServer as socketserver
+from app import db
+
+
+class QueryCounter(object):
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _on_execute(self, conn, cursor, statement, parameters, context,
+                    executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+class QueryCountMixin(object):
+    @contextmanager
+    def assertMaxQueries(self, num):            # 块内SQL条数超过num时测试失败
+        db.session.remove()                     # 清空标识映射，避免命中已加载对象掩盖问题
+        with QueryCounter(db.engine) as counter:
+            yield counter
+        if counter.count > num:
+            self.fail('%d queries executed, %d expected at most:\n%s' % (
+                counter.count, num, '\n'.join(counter.statements)))
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode('ascii'))
+
+    def handle(self):
+        self.reply('220 localhost SMTP stand-in')
+        mail_from, rcpt_to = None, []
+        while True:
+            line = self.rfile.readline().decode('utf-8').rstrip('\r\n')
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif command == 'MAIL':
+                mail_from, rcpt_to = line[10:].strip(), []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                rcpt_to.append(line[8:].strip())
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    line = self.rfile.readline().decode('utf-8')
+                    if line in ('.\r\n', ''):
+                        break
+                    data.append(line)
+                self.server.messages.append((mail_from, rcpt_to, ''.join(data)))
+                self.reply('250 OK')
+            else:                               # RSET、NOOP等
+                self.reply('250 OK')
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """本地SMTP替身，在随机端口接收邮件并保存在messages中。"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0),
+                                                 _SMTPHandler)
+        self.messages = []
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import json
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db, bulk
+from app.models import User, Role, Post
+from .helpers import QueryCountMixin
+
+
+class APITestCase(QueryCountMixin, unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.john = User(email='john@example.com', name='john',
+                         password='cat')
+        susan = User(email='susan@example.com', name='susan', password='cat')
+        now = datetime.utcnow()
+        db.session.add_all([self.john, susan] + [
+            Post(body='post %d' % i, author=self.john if i % 2 else susan,
+                 timestamp=now - timedelta(minutes=i)) for i in range(5)])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_json(self, url, **kwargs):
+        response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.get_data(as_text=True))
+
+    def test_posts_pages(self):
+        page = self.get_json('/api/v1/posts/?limit=2')
+        self.assertEqual([p['body'] for p in page['posts']],
+                         ['post 0', 'post 1'])
+        self.assertEqual(page['posts'][0]['author'], 'susan')
+        self.assertEqual(page['posts'][0]['body_html'], '<p>post 0</p>')
+        self.assertIsNone(page['prev'])
+        bodies = []
+        while page['next']:
+            page = self.get_json(page['next'])
+            bodies += [p['body'] for p in page['posts']]
+        self.assertEqual(bodies, ['post 2', 'post 3', 'post 4'])
+        back = self.get_json(page['prev'])
+        self.assertEqual([p['body'] for p in back['posts']],
+                         ['post 2', 'post 3'])
+
+    def test_post_and_user(self):
+        id = Post.query.filter_by(body='post 1').first().id
+        self.assertEqual(self.get_json('/api/v1/posts/%d' % id)['author'],
+                         'john')
+        user = self.get_json('/api/v1/users/john')
+        self.assertEqual(user['posts'], 2)
+        self.assertNotIn('last_seen', user)
+        self.assertTrue(user['avatar'].startswith('http://localhost/avatar/'))
+        posts = self.get_json(user['posts_url'])['posts']
+        self.assertEqual([p['body'] for p in posts], ['post 1', 'post 3'])
+
+    def test_errors(self):
+        response = self.client.get('/api/v1/users/nobody')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.get_json(), {'error': 'not found'})
+        response = self.client.get('/api/v1/posts/?limit=1000')
+        self.assertEqual(response.status_code, 400)
+
+    def test_stream(self):
+        response = self.client.get('/api/v1/posts/stream')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = response.get_data(as_text=True).splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual([r['id'] for r in rows], sorted(r['id'] for r in rows))
+        rest = self.client.get('/api/v1/posts/stream?since_id=%d' %
+                               rows[2]['id']).get_data(as_text=True)
+        self.assertEqual(len(rest.splitlines()), 2)
+        users = self.client.get('/api/v1/users/stream').get_data(as_text=True)
+        self.assertEqual([json.loads(line)['name'] for line in
+                          users.splitlines()], ['john', 'susan'])
+
+    def test_conditional_get(self):
+        response = self.client.get('/api/v1/posts/')
+        etag = response.headers['ETag']
+        with self.assertMaxQueries(1):          # 内容未变化时只查询版本号
+            response = self.client.get('/api/v1/posts/',
+                                       headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertNotEqual(self.client.get('/api/v1/posts/?limit=2')
+                            .headers['ETag'], etag)
+        db.session.add(Post(body='new', author=User.query.first()))
+        db.session.commit()
+        response = self.client.get('/api/v1/posts/',
+                                   headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.get_data(as_text=True))
+                         ['posts'][0]['body'], 'new')
+
+
+    def test_etag_independent_of_cache_store(self):
+        etag = self.client.get('/api/v1/users/john').headers['ETag']
+        self.app.extensions['page_cache'].clear()   # 其他进程的缓存存储是空的
+        self.assertEqual(self.client.get('/api/v1/users/john')
+                         .headers['ETag'], etag)
+
+    def test_etag_changes_after_bulk_update(self):
+        etag = self.client.get('/api/v1/users/john').headers['ETag']
+        list(bulk.apply('deactivate', bulk.user_criteria(ids=[self.john.id])))
+        response = self.client.get('/api/v1/users/john',
+                                   headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
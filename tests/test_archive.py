@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+import config
+from app import create_app, db, archive, search_index
+from app.models import User, Role, Post, ArchivedPost, TimelineEntry, \
+    recount_posts
+
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.testing = config.config['testing']
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        self.saved = (self.testing.FLASKY_ARCHIVE_AFTER_DAYS,
+                      self.testing.FLASKY_ARCHIVE_DATABASE_URL)
+        self.testing.FLASKY_ARCHIVE_AFTER_DAYS = 30
+        self.testing.FLASKY_ARCHIVE_DATABASE_URL = 'sqlite:///' + self.path
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()                         # 同时在归档库中建表
+        Role.insert_roles()
+        self.author = User(email='author@example.com', name='author',
+                           password='cat')
+        self.reader = User(email='reader@example.com', name='reader',
+                           password='cat')
+        db.session.add_all([self.author, self.reader])
+        db.session.commit()
+        self.reader.follow(self.author)
+        db.session.commit()
+        now = datetime.utcnow()
+        for i in range(50):                     # 第i篇发表于i天零1小时前
+            db.session.add(Post(body='post %d' % i, author=self.author,
+                                timestamp=now - timedelta(days=i, hours=1)))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        (self.testing.FLASKY_ARCHIVE_AFTER_DAYS,
+         self.testing.FLASKY_ARCHIVE_DATABASE_URL) = self.saved
+        os.remove(self.path)
+
+    def walk(self, **kwargs):                   # 从第一页一直翻到最后一页，再翻回第一页
+        pages, before = [], None
+        while True:
+            pagination = archive.paginate_posts(Post.query, 15, before=before,
+                                                **kwargs)
+            pages.append([post.body for post in pagination.items])
+            if not pagination.has_next:
+                break
+            before = pagination.next_cursor
+        back, after = [], pagination.prev_cursor
+        while after:
+            pagination = archive.paginate_posts(Post.query, 15, after=after,
+                                                **kwargs)
+            back.insert(0, [post.body for post in pagination.items])
+            after = pagination.prev_cursor
+        return pages, back
+
+    def test_archive_in_batches(self):
+        progress = list(archive.archive_posts(batch_size=7))
+        self.assertEqual([done for done, timestamp in progress],
+                         [7, 14, 20])
+        self.assertEqual(Post.query.count(), 30)
+        self.assertEqual(ArchivedPost.query.count(), 20)
+        self.assertEqual(
+            Post.query.order_by(Post.timestamp).first().body, 'post 29')
+        self.assertEqual(TimelineEntry.query.count(), 30)
+        author = User.query.filter_by(name='author').first()
+        self.assertEqual(author.post_count, 50)     # 归档文章仍计入
+        self.assertEqual(list(archive.archive_posts()), [])
+
+    def test_archived_removed_from_search(self):
+        self.assertEqual(len(search_index.search_posts('post')), 50)
+        list(archive.archive_posts(batch_size=7))
+        self.assertEqual(len(search_index.search_posts('post')), 30)
+
+    def test_rerun_after_partial_batch(self):
+        old = Post.query.order_by(Post.timestamp).first()
+        db.session.add(ArchivedPost(id=old.id, body=old.body,    # 上次在删除前中断
+                                    timestamp=old.timestamp,
+                                    author_id=old.author_id))
+        db.session.commit()
+        list(archive.archive_posts())
+        self.assertEqual(ArchivedPost.query.count(), 20)
+        self.assertEqual(Post.query.count(), 30)
+
+    def test_read_falls_through(self):
+        expected = ['post %d' % i for i in range(50)]
+        before_archive, _ = self.walk()
+        list(archive.archive_posts())
+        pages, back = self.walk()
+        self.assertEqual(pages, before_archive)
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(back[1:], pages[1:-1])  # 往回翻到最新的一页时按第一页重取
+        self.assertEqual(back[0], pages[0])
+        pages, _ = self.walk(author_id=self.author.id)
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_pages(self):
+        list(archive.archive_posts())
+        self.app.config['FLASKY_POSTS_PER_PAGE'] = 20
+        client = self.app.test_client()
+        data = client.get('/user/author').get_data(as_text=True)
+        self.assertIn('post 19<', data)
+        self.assertNotIn('post 20<', data)
+        pagination = archive.paginate_posts(Post.query, 20)
+        data = client.get('/user/author?before=%s' % pagination.next_cursor) \
+            .get_data(as_text=True)
+        self.assertIn('post 39<', data)         # 跨越热表与归档的一页
+        self.assertIn('post 20<', data)
+        data = client.get('/?before=%s' % archive.paginate_posts(
+            Post.query, 20, before=pagination.next_cursor).next_cursor) \
+            .get_data(as_text=True)
+        self.assertIn('post 49<', data)
+        self.assertIn('post 40<', data)
+
+    def test_recount_includes_archive(self):
+        list(archive.archive_posts())
+        db.session.execute(User.__table__.update().values(post_count=0,
+                                                          last_post_at=None))
+        db.session.execute(Post.__table__.delete().where(
+            Post.author_id == self.author.id))
+        db.session.commit()
+        recount_posts()
+        author = User.query.filter_by(name='author').first()
+        self.assertEqual(author.post_count, 20)
+        self.assertEqual(author.last_post_at,
+                         db.session.query(db.func.max(ArchivedPost.timestamp))
+                         .scalar())
+
+    def test_delete_keeps_archived_latest(self):
+        list(archive.archive_posts())
+        for post in Post.query.all():           # 删除全部热文章，最新时间取自归档
+            db.session.delete(post)
+        db.session.commit()
+        author = User.query.filter_by(name='author').first()
+        self.assertEqual(author.post_count, 20)
+        self.assertEqual(author.last_post_at,
+                         db.session.query(db.func.max(ArchivedPost.timestamp))
+                         .scalar())
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from app import create_app, db
+from app.assets import _Assets, build, sources
+from app.models import Role
+
+
+class AssetsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.client = self.app.test_client()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_unbuilt_sources(self):
+        html = self.client.get('/auth/login').get_data(as_text=True)
+        self.assertIn('/assets/bootstrap/css/bootstrap.min.css', html)
+        self.assertIn('/assets/favicon.ico', html)
+        self.assertNotIn('cdn.jsdelivr.net', html)
+        response = self.client.get('/assets/bootstrap/css/bootstrap.min.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/css')
+        self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+        self.assertEqual(self.client.get('/assets/missing.css').status_code, 404)
+        self.assertEqual(
+            self.client.get('/assets/../config.py').status_code, 404)
+
+    def test_build(self):
+        manifest = build(self.app, self.directory)
+        with open(os.path.join(self.directory, 'manifest.json')) as f:
+            self.assertEqual(json.load(f), manifest)
+        css = manifest['bootstrap/css/bootstrap.min.css']
+        self.assertTrue(re.match(
+            r'bootstrap/css/bootstrap\.min\.[0-9a-f]{10}\.css$', css))
+        with open(os.path.join(self.directory, css), 'rb') as f:
+            data = f.read()
+        font = manifest['bootstrap/fonts/glyphicons-halflings-regular.woff']
+        self.assertIn(('../fonts/%s' % os.path.basename(font)).encode(), data)
+        self.assertNotIn(b'regular.woff)', data)
+        self.assertIn(b'.eot?#iefix', data)     # 查询串与片段保留
+        with gzip.GzipFile(os.path.join(self.directory, css + '.gz')) as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(build(self.app, self.directory), manifest)   # 结果确定
+
+    def test_serve_built(self):
+        manifest = build(self.app, self.directory)
+        self.app.extensions['assets'] = _Assets(sources(self.app),
+                                                self.directory)
+        js = manifest['bootstrap/jquery.min.js']
+        html = self.client.get('/auth/login').get_data(as_text=True)
+        self.assertIn('/assets/%s' % js, html)
+        response = self.client.get('/assets/%s' % js,
+                                   headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertTrue(response.mimetype.endswith('/javascript'))
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        body = gzip.GzipFile(fileobj=io.BytesIO(response.get_data())).read()
+        response = self.client.get('/assets/%s' % js)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.get_data(), body)
+        self.assertEqual(self.client.get(
+            '/assets/bootstrap/jquery.min.js').status_code, 404)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db
+from app.avatars import identicon
+from app.models import User, Role
+
+HASH = hashlib.md5(b'john@example.com').hexdigest()
+
+
+class AvatarTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        db.session.add(User(email='john@example.com', name='john',
+                            password='cat'))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_identicon_is_deterministic(self):
+        self.assertEqual(identicon(HASH, 40), identicon(HASH, 40))
+        self.assertNotEqual(identicon(HASH, 40),
+                            identicon(hashlib.md5(b'x').hexdigest(), 40))
+        self.assertIn(b'width="40"', identicon(HASH, 40))
+
+    def test_endpoint(self):
+        response = self.client.get('/avatar/%s/40' % HASH)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/svg+xml')
+        self.assertEqual(response.get_data(), identicon(HASH, 40))
+        self.assertIn('max-age=604800', response.headers['Cache-Control'])
+        response = self.client.get('/avatar/%s/40' % HASH, headers={
+            'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/avatar/nothex/40').status_code, 404)
+        self.assertEqual(
+            self.client.get('/avatar/%s/4096' % HASH).status_code, 404)
+        self.assertEqual(       # 只提供模板中用到的尺寸
+            self.client.get('/avatar/%s/41' % HASH).status_code, 404)
+
+    def test_disk_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            avatars = self.app.extensions['avatars']
+            avatars.cache_dir = cache_dir
+            self.client.get('/avatar/%s/40' % HASH)
+            path = os.path.join(cache_dir, HASH[:2], '%s-40.svg' % HASH)
+            with open(path, 'wb') as f:         # 之后的请求从磁盘读取
+                f.write(b'<svg/>')
+            self.assertEqual(
+                self.client.get('/avatar/%s/40' % HASH).get_data(), b'<svg/>')
+            avatars.cache_timeout = -1          # 过期后重新生成
+            self.assertEqual(self.client.get('/avatar/%s/40' % HASH)
+                             .get_data(), identicon(HASH, 40))
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_unknown_hash_not_fetched(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            avatars = self.app.extensions['avatars']
+            avatars.cache_dir = cache_dir
+            avatars.fetch = True
+
+            def fetch(hash, size):
+                raise AssertionError('unexpected fetch for %s' % hash)
+            avatars._fetch = fetch
+            other = hashlib.md5(b'nobody@example.com').hexdigest()
+            response = self.client.get('/avatar/%s/40' % other)
+            self.assertEqual(response.get_data(), identicon(other, 40))
+            self.assertIn('max-age=300', response.headers['Cache-Control'])
+            self.assertEqual(os.listdir(cache_dir), [])
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_fetch_failure_not_cached(self):
+        avatars = self.app.extensions['avatars']
+        avatars.fetch = True
+
+        def fail(hash, size):
+            raise IOError('network is unreachable')
+        avatars._fetch = fail
+        response = self.client.get('/avatar/%s/40' % HASH)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age=300', response.headers['Cache-Control'])
+
+    def test_gravatar_url_memoized(self):
+        u = User(email='john@example.com', password='cat')
+        with self.app.test_request_context('/'):
+            self.assertEqual(u.gravatar(size=40), '/avatar/%s/40' % HASH)
+            self.assertIs(u.gravatar(size=40), u.gravatar(size=40))
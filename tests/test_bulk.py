@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db, bulk
+from app.main.forms import EditProfileAdminForm
+from app.models import User, Role, Permission, role_permissions
+from .helpers import QueryCountMixin
+
+
+class BulkUsersTestCase(QueryCountMixin, unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.admin = User(email='admin@other.org', name='admin', password='cat',
+                          role=Role.query.filter_by(name='Administrator').first())
+        db.session.add(self.admin)
+        for i in range(20):
+            db.session.add(User(email='user%d@example.com' % i,
+                                name='user%d' % i, password='cat'))
+        for i in range(5):
+            db.session.add(User(email='old%d@other.org' % i, name='old%d' % i,
+                                password='cat', last_seen=datetime.utcnow() -
+                                timedelta(days=400)))
+        db.session.commit()
+        self.admin_id = self.admin.id           # 请求结束时会话被移除，之后只用id
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def role(self, name):
+        return Role.query.filter_by(name=name).first()
+
+    def login(self, email):
+        return self.client.post('/auth/login', data={
+            'email': email, 'password': 'cat'}, follow_redirects=True)
+
+    def test_filters(self):
+        user_role = self.role('User')
+        self.assertEqual(bulk.count_users(
+            bulk.user_criteria(email_domain='example.com')), 20)
+        self.assertEqual(bulk.count_users(
+            bulk.user_criteria(email_domain='other.org',
+                               role_id=user_role.id)), 5)
+        self.assertEqual(bulk.count_users(
+            bulk.user_criteria(inactive_days=365)), 5)
+        self.assertEqual(bulk.count_users(
+            bulk.user_criteria(exclude=[self.admin_id])), 25)
+
+    def test_reassign_role_in_chunks(self):
+        moderator = self.role('Moderator')
+        progress = list(bulk.apply('role',
+                                   bulk.user_criteria(email_domain='example.com'),
+                                   moderator.id, chunk_size=8))
+        self.assertEqual([done for done, last_id in progress], [8, 16, 20])
+        self.assertEqual(moderator.users.count(), 20)
+        self.assertTrue(User.query.filter_by(name='user3').first()
+                        .can(Permission.MODERATE))
+        self.assertFalse(User.query.filter_by(name='old3').first()
+                         .can(Permission.MODERATE))
+        with self.assertRaises(ValueError):
+            list(bulk.apply('role', []))
+
+    def test_deactivate(self):
+        self.assertIn('Log Out', self.login('old1@other.org')
+                      .get_data(as_text=True))
+        criteria = bulk.user_criteria(email_domain='other.org',
+                                      exclude=[self.admin_id])
+        list(bulk.apply('deactivate', criteria))
+        # 已登录的会话失效，也不能再登录
+        self.assertIn('Log In', self.client.get('/').get_data(as_text=True))
+        self.assertIn('This account has been deactivated.',
+                      self.login('old1@other.org').get_data(as_text=True))
+        list(bulk.apply('activate', criteria))
+        self.assertIn('Log Out', self.login('old1@other.org')
+                      .get_data(as_text=True))
+
+    def test_change_permissions(self):
+        user = User.query.filter_by(name='user0').first()
+        self.assertFalse(user.can(Permission.MODERATE))
+        self.assertEqual(bulk.change_permissions(['User'],
+                                                 grant=Permission.MODERATE,
+                                                 revoke=Permission.COMMENT), 1)
+        self.assertTrue(user.can(Permission.MODERATE))
+        self.assertFalse(user.can(Permission.COMMENT))
+        self.assertTrue(user.can(Permission.WRITE))
+        self.assertTrue(self.admin.can(Permission.COMMENT))
+
+    def test_admin_endpoint(self):
+        self.login('admin@other.org')
+        response = self.client.post('/admin/users', data={
+            'action': 'deactivate', 'new_role': self.role('User').id,
+            'role': 0, 'email_domain': 'other.org', 'inactive_days': ''},
+            follow_redirects=True)
+        self.assertIn('5 users updated.', response.get_data(as_text=True))
+        self.assertEqual(User.query.filter_by(active=False).count(), 5)
+        self.assertTrue(User.query.get(self.admin_id).active)  # 不修改自己
+        self.login('user0@example.com')
+        self.assertEqual(self.client.get('/admin/users').status_code, 403)
+
+    def test_role_choices_cached(self):
+        user = User.query.filter_by(name='user0').first()
+        with self.app.test_request_context('/'):
+            choices = EditProfileAdminForm(user=user).role.choices
+            self.assertEqual([name for id, name in choices],
+                             ['Administrator', 'Moderator', 'User'])
+            with self.assertMaxQueries(0):
+                EditProfileAdminForm(user=user)
+        db.session.add(Role(name='Editor'))
+        db.session.commit()                     # 角色变化后重新加载
+        self.assertEqual(len(role_permissions.choices()), 4)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+import config
+from app import create_app, db
+from app.models import User, Role, Post
+
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        primary = 'sqlite:///' + os.path.join(self.dir, 'primary.sqlite')
+        replica = 'sqlite:///' + os.path.join(self.dir, 'replica.sqlite')
+
+        class ReplicaTestingConfig(config.TestingConfig):  # Config是旧式类，不能用type()创建
+            SQLALCHEMY_DATABASE_URI = primary
+            FLASKY_DB_REPLICAS = [replica]
+        config.config['testing-replica'] = ReplicaTestingConfig
+        self.app = create_app('testing-replica')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        user = User(email='john@example.com', name='john', password='cat')
+        db.session.add(Post(body='primary post', author=user))
+        db.session.commit()
+        # 副本库中写入不同的数据，以区分查询实际访问的库
+        replica_engine = db.get_engine(self.app, bind='replica_0')
+        db.Model.metadata.create_all(replica_engine)
+        replica_engine.execute(Role.__table__.insert(),
+                               [{'id': 1, 'name': 'User', 'default': True,
+                                 'permissions': 7}])
+        replica_engine.execute(User.__table__.insert(),
+                               [{'id': 1, 'name': 'john', 'role_id': 1}])
+        replica_engine.execute(Post.__table__.insert(),
+                               [{'id': 1, 'body': 'replica post',
+                                 'author_id': 1}])
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        del config.config['testing-replica']
+        shutil.rmtree(self.dir)
+
+    def test_read_only_views_use_replica(self):
+        client = self.app.test_client()
+        self.assertIn(b'replica post', client.get('/').data)
+        self.assertIn(b'replica post', client.get('/user/john').data)
+
+    def test_writes_and_other_reads_use_primary(self):
+        client = self.app.test_client()
+        client.post('/auth/login', data={'email': 'john@example.com',
+                                         'password': 'cat'})
+        client.post('/', data={'body': 'new post'})
+        db.session.remove()
+        self.assertEqual(Post.query.count(), 2)
+        self.assertEqual(Post.query.order_by(Post.id).first().body,
+                         'primary post')
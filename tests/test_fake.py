@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import benchmark
+from app import create_app, db, fake
+from app.models import User, Role, Post
+from app.page_cache import PageCache
+
+
+class FakeDataTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_batched_generation(self):
+        version = PageCache.content_version()
+        self.assertEqual(list(fake.users(5, batch_size=2)), [2, 4, 5])
+        self.assertEqual(list(fake.posts(30, batch_size=10)), [10, 20, 30])
+        self.assertEqual(PageCache.content_version(), version + 7)   # 每批一次，重算计数一次
+        self.assertEqual(User.query.count(), 5)
+        self.assertEqual(Post.query.count(), 30)
+        user = User.query.first()
+        self.assertTrue(user.verify_password(fake.FAKE_PASSWORD))
+        self.assertIsNotNone(Post.query.first().body_html)
+        list(fake.users(3))                     # 再次生成时名称不冲突
+        self.assertEqual(User.query.count(), 8)
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def test_run(self):
+        results = benchmark.run(users=5, posts=20, requests=2)
+        self.assertEqual(sorted(results['scenarios']),
+                         sorted(benchmark.SCENARIOS))
+        for stats in results['scenarios'].values():
+            self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+from app import create_app, db
+from app.cache import LRUCache, LocalRedis, RedisCache
+from app.fragment_cache import _post_key
+from app.models import User, Role, Post
+
+
+class CacheStoreTestCase(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.get('a')                          # a变为最近使用，b被淘汰
+        cache.set('c', '3')
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), ['1', None, '3'])
+
+    def test_lru_timeout(self):
+        cache = LRUCache()
+        cache.set('a', '1', timeout=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('a'))
+
+    def test_redis_store(self):
+        cache = RedisCache(LocalRedis(), prefix='t:')
+        cache.set('a', u'中文')
+        self.assertEqual(cache.get_many(['a', 'b']), [u'中文', None])
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+
+
+class FragmentCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(email='john@example.com', name='john',
+                         password='cat')
+        db.session.add(Post(body='hello', author=self.user))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_author_change_invalidates(self):
+        store = self.app.extensions['fragment_cache']
+        self.assertIn(b'/user/john', self.client.get('/').data)
+        key = _post_key(Post.query.first())
+        self.assertIsNotNone(store.get(key))
+        self.user.ping()                        # last_seen变化不影响片段
+        db.session.commit()
+        self.assertEqual(_post_key(Post.query.first()), key)
+        self.user.name = 'johnny'
+        db.session.commit()
+        self.assertIn(b'/user/johnny', self.client.get('/').data)
+
+    def test_post_change_invalidates(self):
+        self.client.get('/')
+        post = Post.query.first()
+        post.body = 'edited'
+        db.session.commit()
+        self.assertIn(b'edited', self.client.get('/').data)
+
+    def test_change_from_another_process(self):
+        self.client.get('/')
+        posts = Post.__table__
+        db.session.execute(posts.update().values(                 # 不经过本进程的映射器事件
+            body='edited', body_html='<p>edited</p>'))
+        db.session.commit()
+        self.assertIn(b'edited', self.client.get('/').data)
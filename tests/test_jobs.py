@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from app import create_app, db, job_queue
+from app.email import QueuedMailHandler, deliver_email
+from app.jobs import _Outbox
+from app.models import User, Role
+from tests.helpers import SMTPStandIn
+
+calls = []
+
+
+@job_queue.task('tests.flaky')
+def flaky(failures):                            # 前failures次调用失败
+    calls.append(failures)
+    if len(calls) <= failures:
+        raise IOError('temporary failure')
+
+
+class JobQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.mail = self.app.extensions['mail']
+        self.mail.suppress = False
+        self.mail.server = '127.0.0.1'
+        self.queue = self.app.extensions['jobs']
+        self.queue.backoff = 0
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        del calls[:]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_retry_with_backoff(self):
+        flaky.delay(2)
+        self.assertEqual(job_queue.work(), 3)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(job_queue.stats(), {})
+        self.queue.backoff = 60                 # 退避期内不会再次执行
+        flaky.delay(10)
+        self.assertEqual(job_queue.work(), 1)
+        self.assertEqual(job_queue.stats(), {'pending': 1})
+
+    def test_gives_up_after_max_attempts(self):
+        self.queue.max_attempts = 2
+        flaky.delay(5)
+        self.assertEqual(job_queue.work(), 2)
+        self.assertEqual(job_queue.stats(), {'failed': 1})
+
+    def test_unknown_job(self):
+        with self.assertRaises(KeyError):
+            job_queue.enqueue('no-such-job')
+
+    def test_outbox_is_durable(self):
+        path = os.path.join(tempfile.mkdtemp(), 'jobs.sqlite')
+        try:
+            outbox = _Outbox(path, lease=60)
+            outbox.put('tests.flaky', '{"args": [0], "kwargs": {}}', 0)
+            now = time.time()
+            self.assertIsNotNone(outbox.claim(now))
+            other = _Outbox(path, lease=60)     # 另一个进程启动，不收回正在执行的任务
+            self.assertEqual(other.counts(), {'running': 1})
+            self.assertIsNone(other.claim(now + 30))
+            row = other.claim(now + 61)         # 租约过期：领取者已退出
+            self.assertEqual(row[1], 'tests.flaky')
+            self.assertEqual(other.counts(), {'running': 1})
+        finally:
+            shutil.rmtree(os.path.dirname(path))
+
+    def test_mail_delivered_in_background(self):
+        with SMTPStandIn() as smtp:
+            self.mail.port = smtp.port
+            deliver_email.delay(['john@example.com'], '[Flasky] Hello',
+                                'admin@example.com', 'Hello, john.')
+            self.assertEqual(smtp.messages, [])             # 入队时不发送
+            self.assertEqual(job_queue.work(), 1)
+        self.assertEqual(len(smtp.messages), 1)
+        sender, recipients, data = smtp.messages[0]
+        self.assertEqual(recipients, ['<john@example.com>'])
+        self.assertIn('[Flasky] Hello', data)
+        self.assertIn('Hello, john.', data)
+
+    def test_delivery_retried_while_server_down(self):
+        with SMTPStandIn() as smtp:
+            port = smtp.port
+        self.mail.port = port                   # 替身已关闭，连接被拒绝
+        self.queue.backoff = 60
+        deliver_email.delay(['john@example.com'], '[Flasky] Hello',
+                            'admin@example.com', 'Hello, john.')
+        self.assertEqual(job_queue.work(), 1)
+        self.assertEqual(job_queue.stats(), {'pending': 1})
+
+    def test_error_reports_queued(self):
+        handler = QueuedMailHandler(self.app, ['admin@example.com'],
+                                    '[Flasky] Application Error')
+        handler.setLevel(logging.ERROR)
+        self.app.logger.addHandler(handler)
+        try:
+            self.app.logger.error('Something broke')
+            self.app.logger.error('Job failed', extra={'job': 'x'})
+        finally:
+            self.app.logger.removeHandler(handler)
+        self.assertEqual(job_queue.stats(), {'pending': 1})
+        with SMTPStandIn() as smtp:
+            self.mail.port = smtp.port
+            job_queue.work()
+        self.assertIn('Something broke', smtp.messages[0][2])
+
+    def test_worker_started_on_first_enqueue(self):
+        self.queue.workers = 1
+        self.assertEqual(self.queue._threads, [])   # 创建应用时不启动线程
+        try:
+            flaky.delay(0)
+            self.assertEqual(len(self.queue._threads), 1)
+            deadline = time.time() + 5
+            while not calls and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            self.queue.stop(5)
+        self.assertEqual(calls, [0])
+        self.assertEqual(self.queue._threads, [])
+
+    def test_refresh_avatar_hash(self):
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        id, old = u.id, u.avatar_hash
+        u.email = 'john2@example.com'
+        db.session.commit()
+        from app.models import refresh_avatar_hash
+        refresh_avatar_hash.delay(id)
+        job_queue.work()
+        self.assertNotEqual(User.query.get(id).avatar_hash, old)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db, last_seen_tracker
+from app.models import User, Role
+
+
+class LastSeenTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.past = datetime.utcnow() - timedelta(days=1)
+        self.users = [User(email='user%d@example.com' % i, name='user%d' % i,
+                           password='cat', last_seen=self.past)
+                      for i in range(3)]
+        db.session.add_all(self.users)
+        db.session.commit()
+
+    def tearDown(self):
+        last_seen_tracker.flush()               # 不留给退出时的写入
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_resolution_window(self):
+        self.assertTrue(last_seen_tracker.touch(self.users[0].id))
+        self.assertFalse(last_seen_tracker.touch(self.users[0].id))
+
+    def test_bulk_flush(self):
+        for u in self.users:
+            last_seen_tracker.touch(u.id)
+        self.assertEqual(last_seen_tracker.flush(), 3)
+        self.assertEqual(last_seen_tracker.flush(), 0)
+        db.session.expire_all()
+        for u in User.query.all():
+            self.assertGreater(u.last_seen, self.past)
+
+    def test_failed_flush_keeps_pending(self):
+        tracker = self.app.extensions['last_seen']
+        id = self.users[0].id
+        tracker.touch(id)
+        db.session.remove()
+        User.__table__.drop(db.engine)          # 写入失败，时间戳放回暂存
+        self.assertRaises(Exception, tracker.flush)
+        self.assertIn(id, tracker._pending)
+        newer = datetime.utcnow() + timedelta(seconds=1)
+        tracker._pending[id] = newer            # 写入期间又记录了更新的时间
+        tracker._restore({id: self.past})
+        self.assertEqual(tracker._pending[id], newer)
+        tracker._pending.clear()
+
+    def test_flushed_at_teardown(self):
+        client = self.app.test_client()
+        client.post('/auth/login', data={'email': 'user0@example.com',
+                                         'password': 'cat'})
+        client.get('/')
+        db.session.expire_all()
+        self.assertGreater(User.query.get(self.users[0].id).last_seen,
+                           self.past)
+
+    def test_idle_process_flushes_after_interval(self):
+        tracker = self.app.extensions['last_seen']
+        tracker.interval = 0.05
+        tracker.touch(self.users[1].id)
+        tracker.schedule()                      # 之后没有请求，到时由定时器写入
+        time.sleep(0.3)
+        db.session.expire_all()
+        self.assertGreater(User.query.get(self.users[1].id).last_seen,
+                           self.past)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import unittest
+from app import create_app, db
+from app.models import User, Role
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        admin = Role.query.filter_by(name='Administrator').first()
+        db.session.add_all([
+            User(email='admin@example.com', name='admin', password='cat',
+                 role=admin),
+            User(email='john@example.com', name='john', password='cat')])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self, email):
+        self.client.post('/auth/login', data={'email': email,
+                                              'password': 'cat'})
+
+    def test_metrics_requires_admin(self):
+        self.login('john@example.com')
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    def test_metrics_exposition(self):
+        self.client.get('/')
+        self.login('admin@example.com')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        text = response.get_data(as_text=True)
+        self.assertIn('flasky_request_duration_seconds_count'
+                      '{endpoint="main.index"} 1', text)
+        self.assertIn('flasky_request_duration_seconds_bucket'
+                      '{endpoint="main.index",le="+Inf"} 1', text)
+        self.assertIn('flasky_db_queries_total{endpoint="auth.login"}', text)
+        self.assertIn('flasky_template_render_seconds_total'
+                      '{endpoint="main.index"}', text)
+
+    def test_slow_query_logged(self):
+        self.app.config['FLASKY_SLOW_DB_QUERY_TIME'] = 0
+        records = []
+        handler = logging.Handler(logging.WARNING)  # Python 2没有assertLogs
+        handler.emit = records.append
+        self.app.logger.addHandler(handler)
+        try:
+            self.client.get('/')
+        finally:
+            self.app.logger.removeHandler(handler)
+        self.assertIn('in main.index', records[0].getMessage())
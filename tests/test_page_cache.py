@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from app import create_app, db
+from app.models import User, Role, Post
+from app.page_cache import PageCache
+from .helpers import QueryCountMixin
+
+
+class PageCacheTestCase(QueryCountMixin, unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_PAGE_CACHE'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(email='john@example.com', name='john',
+                         password='cat')
+        db.session.add(Post(body='first post', author=self.user))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_conditional_get(self):
+        response = self.client.get('/')
+        etag = response.headers['ETag']
+        last_modified = response.headers['Last-Modified']
+        with self.assertMaxQueries(2):          # 只查询最后修改时间与内容版本号，不渲染
+            response = self.client.get('/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/', headers={
+            'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+    def test_purged_on_new_post(self):
+        etag = self.client.get('/').headers['ETag']
+        db.session.add(Post(body='second post', author=self.user))
+        db.session.commit()
+        response = self.client.get('/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'second post', response.data)
+
+    def test_purged_after_commit(self):
+        version = PageCache.content_version()
+        db.session.add(Post(body='second post', author=self.user))
+        db.session.flush()
+        self.assertEqual(PageCache.content_version(), version)
+        db.session.commit()
+        self.assertEqual(PageCache.content_version(), version + 1)
+
+    def test_user_page(self):
+        response = self.client.get('/user/john')
+        self.assertEqual(response.status_code, 200)
+        db.session.add(User(email='susan@example.com', name='susan',
+                            password='cat'))
+        db.session.commit()
+        db.session.execute(User.__table__.update().values(last_seen=None))
+        db.session.commit()                     # 导入等批量写入的用户可能没有任何时间
+        self.assertEqual(self.client.get('/user/susan').status_code, 200)
+        self.assertEqual(self.client.get('/user/nobody').status_code, 404)
+        self.user.location = 'Beijing'          # 资料修改后页面缓存失效
+        db.session.commit()
+        self.assertIn(b'Beijing', self.client.get('/user/john').data)
+
+    def test_authenticated_not_cached(self):
+        self.client.post('/auth/login', data={'email': 'john@example.com',
+                                              'password': 'cat'})
+        response = self.client.get('/')
+        self.assertIsNone(response.headers.get('ETag'))
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db
+from app.models import User, Role, Post
+from app.pagination import keyset_paginate, decode_cursor
+
+
+class KeysetPaginationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        u = User(email='john@example.com', name='john', password='cat')
+        now = datetime.utcnow()
+        for i in range(25):                     # 每两篇文章时间戳相同，检验id作为次序键
+            db.session.add(Post(body='post %d' % i, author=u,
+                                timestamp=now - timedelta(minutes=i // 2)))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def paginate(self, **kwargs):
+        return keyset_paginate(Post.query, Post.timestamp, Post.id, 10,
+                               **kwargs)
+
+    def test_walk_forward_and_back(self):
+        expected = [p.id for p in Post.query.order_by(
+            Post.timestamp.desc(), Post.id.desc())]
+        first = self.paginate()
+        self.assertFalse(first.has_prev)
+        self.assertTrue(first.has_next)
+        second = self.paginate(before=first.next_cursor)
+        third = self.paginate(before=second.next_cursor)
+        self.assertFalse(third.has_next)
+        seen = [p.id for page in (first, second, third) for p in page.items]
+        self.assertEqual(seen, expected)
+        back = self.paginate(after=third.prev_cursor)
+        self.assertEqual([p.id for p in back.items],
+                         [p.id for p in second.items])
+        self.assertTrue(back.has_prev)
+
+    def test_invalid_cursor_is_first_page(self):
+        self.assertIsNone(decode_cursor('garbage'))
+        page = self.paginate(before='garbage')
+        self.assertFalse(page.has_prev)
+        self.assertEqual(len(page.items), 10)
+
+    def test_index_renders_pager(self):
+        client = self.app.test_client()
+        response = client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Older', response.data)
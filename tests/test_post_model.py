@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db
+from app.models import User, Role, Post, recount_posts
+from app.page_cache import PageCache
+from app.rendering import backfill_body_html
+
+
+class PostModelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(email='john@example.com', name='john',
+                         password='cat')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_body_html_rendered_on_write(self):
+        post = Post(body=u'**粗体** <script>alert(1)</script>',
+                    author=self.user)
+        self.assertEqual(post.body_html,
+                         u'<p><strong>粗体</strong> alert(1)</p>')
+        post.body = u'*new*'
+        self.assertEqual(post.body_html, u'<p><em>new</em></p>')
+
+    def test_backfill(self):
+        for i in range(5):
+            db.session.add(Post(body=u'post *%d*' % i, author=self.user))
+        db.session.commit()
+        db.session.execute(Post.__table__.update().values(body_html=None))
+        db.session.commit()
+        version = PageCache.content_version()
+        progress = list(backfill_body_html(batch_size=2, processes=2))
+        self.assertEqual(PageCache.content_version(), version + 3)   # 每批清空整页缓存
+        self.assertEqual(progress[-1][0], 5)
+        self.assertEqual(len(progress), 3)
+        db.session.expire_all()
+        self.assertEqual(Post.query.get(5).body_html,
+                         u'<p>post <em>4</em></p>')
+
+    def test_author_counters(self):
+        old = datetime.utcnow() - timedelta(days=1)
+        db.session.add(Post(body='new', author=self.user))
+        db.session.add(Post(body='old', author=self.user, timestamp=old))
+        db.session.commit()
+        self.assertEqual(self.user.post_count, 2)
+        newest = self.user.last_post_at
+        self.assertGreater(newest, old)
+        db.session.delete(Post.query.filter_by(body='new').first())
+        db.session.commit()
+        self.assertEqual(self.user.post_count, 1)
+        self.assertEqual(self.user.last_post_at, old)
+        db.session.execute(User.__table__.update().values(
+            post_count=0, last_post_at=None))
+        version = PageCache.content_version()
+        recount_posts()
+        self.assertEqual((self.user.post_count, self.user.last_post_at),
+                         (1, old))
+        self.assertEqual(PageCache.content_version(), version + 1)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from app import create_app, db
+from app.models import User, Role, Post
+from .helpers import QueryCountMixin
+
+
+class PostListQueryCountTestCase(QueryCountMixin, unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        for i in range(5):                      # 多个作者，N+1时查询数随作者数增长
+            u = User(email='user%d@example.com' % i, name='user%d' % i,
+                     password='cat')
+            for j in range(3):
+                db.session.add(Post(body='post %d' % j, author=u))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_index_loads_authors_in_one_query(self):
+        with self.assertMaxQueries(1):
+            response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_user_page_query_count(self):
+        with self.assertMaxQueries(2):
+            response = self.client.get('/user/user0')
+        self.assertEqual(response.status_code, 200)
+
+    def test_user_page_paginated(self):
+        u = User.query.filter_by(name='user0').first()
+        for j in range(3, 50):
+            db.session.add(Post(body='post %d' % j, author=u))
+        db.session.commit()
+        self.app.config['FLASKY_POSTS_PER_PAGE'] = 20
+        with self.assertMaxQueries(2):          # 查询数与用户文章总数无关
+            response = self.client.get('/user/user0')
+        data = response.get_data(as_text=True)
+        self.assertIn('50 blog posts.', data)
+        self.assertIn('post 49', data)
+        self.assertNotIn('post 29<', data)
+        self.assertIn('Older', data)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+import config
+from app import create_app, db
+from app.cache import LocalRedis
+from app.models import User, Role
+from app.ratelimit import MemoryBuckets, RedisBuckets
+from .helpers import QueryCountMixin
+
+
+class TokenBucketTestCase(unittest.TestCase):
+    def check_bucket(self, buckets):
+        for _ in range(3):
+            self.assertTrue(buckets.take('k', 3, 1.0)[0])
+        allowed, tokens = buckets.take('k', 3, 1.0)
+        self.assertFalse(allowed)
+        self.assertLess(tokens, 1)
+        self.assertTrue(buckets.take('other', 3, 1.0)[0])   # 各键独立计数
+        time.sleep(0.05)
+        self.assertFalse(buckets.take('k', 3, 1.0)[0])
+        self.assertTrue(buckets.take('fast', 1, 100.0)[0])
+        self.assertFalse(buckets.take('fast', 1, 100.0)[0])
+        time.sleep(0.02)                        # 以每秒100个的速率补充
+        self.assertTrue(buckets.take('fast', 1, 100.0)[0])
+
+    def test_memory(self):
+        self.check_bucket(MemoryBuckets())
+
+    def test_redis_stand_in(self):
+        client = LocalRedis()
+        self.check_bucket(RedisBuckets(client))
+        self.assertIsNotNone(client.get('ratelimit:k'))
+
+
+class RateLimitTestCase(QueryCountMixin, unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_RATE_LIMITS'] = {
+            'login-ip': (4, 60), 'login-account': (2, 60),
+            'register-ip': (1, 3600)}
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        db.session.add(User(email='john@example.com', name='john',
+                            password='cat'))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def login(self, email, password='dog'):
+        return self.client.post('/auth/login', data={
+            'email': email, 'password': password})
+
+    def test_login_limited_by_account_and_ip(self):
+        self.assertEqual(self.login('john@example.com').status_code, 200)
+        self.assertEqual(self.login('JOHN@example.com ').status_code, 200)
+        with self.assertMaxQueries(0):          # 被拒绝的请求不查询数据库
+            response = self.login('john@example.com', 'cat')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '30')
+        self.assertEqual(self.login('susan@example.com').status_code, 200)
+        self.assertEqual(self.login('david@example.com').status_code, 429)
+        self.assertEqual(self.client.get('/auth/login').status_code, 200)
+
+    def test_register_limited(self):
+        data = {'email': 'susan@example.com', 'name': 'susan',
+                'password': 'cat', 'password2': 'cat'}
+        self.assertEqual(self.client.post('/auth/register',
+                                          data=data).status_code, 302)
+        response = self.client.post('/auth/register', data=data,
+                                    headers={'Accept': 'application/json'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.get_json(), {'error': 'too many requests'})
+
+    def test_disabled(self):
+        self.app.config['FLASKY_RATE_LIMIT'] = False
+        for _ in range(5):
+            self.assertEqual(self.login('john@example.com').status_code, 200)
+
+    def login_from(self, client, address, i):   # 每次换一个账号，只触发按IP的限流
+        return client.post('/auth/login', data={
+            'email': 'user%d@example.com' % i, 'password': 'dog'},
+            headers={'X-Forwarded-For': address})
+
+    def test_forwarded_for_ignored_without_proxy(self):
+        for i in range(4):
+            self.assertEqual(self.login_from(self.client, '10.0.0.%d' % i, i)
+                             .status_code, 200)
+        self.assertEqual(self.login_from(self.client, '10.0.0.9', 9)
+                         .status_code, 429)
+
+    def test_behind_proxy(self):
+        class ProxyTestingConfig(config.TestingConfig):
+            FLASKY_PROXY_COUNT = 1
+        config.config['testing-proxy'] = ProxyTestingConfig
+        try:
+            app = create_app('testing-proxy')
+        finally:
+            del config.config['testing-proxy']
+        app.config['FLASKY_RATE_LIMITS'] = self.app.config['FLASKY_RATE_LIMITS']
+        with app.app_context():
+            db.create_all()
+            Role.insert_roles()
+            client = app.test_client()
+            try:
+                for i in range(4):
+                    self.assertEqual(self.login_from(client, '10.0.0.1', i)
+                                     .status_code, 200)
+                self.assertEqual(self.login_from(client, '10.0.0.1', 4)
+                                 .status_code, 429)
+                self.assertEqual(self.login_from(client, '10.0.0.2', 5)
+                                 .status_code, 200)     # 其他客户端不受影响
+            finally:
+                db.session.remove()
+                db.drop_all()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db, search_index
+from app.models import User, Role, Post
+from app.search import InvertedIndex, tokenize
+
+
+class TokenizeTestCase(unittest.TestCase):
+    def test_mixed_text(self):
+        self.assertEqual(tokenize(u'Flask 博客系统', for_query=True),
+                         [u'flask', u'博客', u'客系', u'系统'])
+        self.assertIn(u'博', tokenize(u'Flask 博客系统'))
+
+
+class SearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(email='john@example.com', name='john',
+                         password='cat')
+        db.session.add_all([
+            Post(body=u'今天学习Flask框架', author=self.user),
+            Post(body=u'Flask and SQLAlchemy', author=self.user),
+            Post(body=u'天气不错', author=self.user)])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_incremental_index(self):
+        self.assertEqual(len(search_index.search_posts(u'flask')), 2)
+        self.assertEqual([id for id, score in
+                          search_index.search_posts(u'学习')], [1])
+        self.assertEqual(sorted(id for id, score in
+                                search_index.search_posts(u'天')), [1, 3])
+        self.assertEqual([id for id, score in
+                          search_index.search_users(u'john')],
+                         [self.user.id])
+
+    def test_rollback_not_indexed(self):
+        db.session.add(Post(body=u'rolled back', author=self.user))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(search_index.search_posts(u'rolled'), [])
+
+    def test_search_view(self):
+        response = self.app.test_client().get(u'/search?q=学习')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(u'今天学习Flask框架', response.get_data(as_text=True))
+
+
+class PersistenceTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'index')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_snapshot_and_journal(self):
+        index = InvertedIndex(self.path)
+        index.rebuild([('p1', u'你好世界')])
+        index.update([('p2', u'世界和平'), ('p1', None)])
+        reloaded = InvertedIndex(self.path)
+        self.assertEqual([key for key, score in
+                          reloaded.search(u'世界', 'p')], ['p2'])
+
+    def test_shared_between_processes(self):
+        first = InvertedIndex(self.path)
+        first.rebuild([('p1', u'你好世界')])
+        second = InvertedIndex(self.path)       # 另一个进程中的索引
+        first.update([('p2', u'世界和平')])
+        self.assertEqual([key for key, score in
+                          second.search(u'世界', 'p')], ['p2', 'p1'])
+        second.update([('p1', None)])
+        self.assertEqual([key for key, score in
+                          first.search(u'世界', 'p')], ['p2'])
+        second.rebuild([('p3', u'和平')])
+        self.assertEqual(first.search(u'世界', 'p'), [])
+        self.assertEqual([key for key, score in
+                          first.search(u'和平', 'p')], ['p3'])
+
+    def test_rebuild_keeps_concurrent_updates(self):
+        first = InvertedIndex(self.path)
+        second = InvertedIndex(self.path)       # 另一个进程中的索引
+
+        def entries():                          # 重建读取数据库期间另一个进程写入
+            yield 'p1', u'你好世界'
+            second.update([('p2', u'世界和平')])
+        first.rebuild(entries())
+        reloaded = InvertedIndex(self.path)
+        self.assertEqual([key for key, score in
+                          reloaded.search(u'世界', 'p')], ['p2', 'p1'])
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import threading
+import types
+import unittest
+import benchmark
+import serve
+from sqlalchemy.pool import QueuePool
+from app import create_app, db, password_hasher
+
+
+class ServingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def test_session_per_thread(self):
+        sessions = []
+
+        def use():
+            with self.app.app_context():
+                sessions.append(db.session())
+                db.session.remove()
+        threads = [threading.Thread(target=use) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertIsNot(sessions[0], sessions[1])
+        self.assertNotIn(db.session(), sessions)
+
+    def test_bound_pool(self):
+        app = create_app('testing')
+        serve.bound_pool(app, 3)
+        with app.app_context():                 # 显式指定的连接池在SQLite上同样生效
+            pool = db.engine.pool
+            self.assertIsInstance(pool, QueuePool)
+            self.assertEqual(pool.size(), 3)
+            self.assertEqual(pool._max_overflow, 0)
+        with self.assertRaises(ValueError):
+            serve.make_server(app, 'tornado', '127.0.0.1', 0)
+
+    def test_gevent_hashes_on_hub_threadpool(self):
+        calls = []
+
+        class ThreadPool(object):
+            def apply(self, f, args):
+                calls.append(f.__name__)
+                return f(*args)
+        gevent = types.ModuleType('gevent')     # 模拟已执行monkey patch的gevent
+        gevent.monkey = types.ModuleType('gevent.monkey')
+        gevent.monkey.is_module_patched = lambda name: name == 'threading'
+
+        class Hub(object):
+            threadpool = ThreadPool()
+        gevent.get_hub = Hub
+        saved = dict((name, sys.modules.get(name))
+                     for name in ('gevent', 'gevent.monkey'))
+        sys.modules.update({'gevent': gevent, 'gevent.monkey': gevent.monkey})
+        try:
+            pwhash = password_hasher.hash('cat')
+            self.assertTrue(password_hasher.check(pwhash, 'cat'))
+        finally:
+            for name, module in saved.items():
+                if module is None:
+                    sys.modules.pop(name, None)
+                else:
+                    sys.modules[name] = module
+        self.assertEqual(calls, ['generate_password_hash',
+                                 'check_password_hash'])
+
+    def test_serving_benchmark(self):
+        results = benchmark.serving(modes=['threaded', 'gevent'], users=3,
+                                    posts=10, requests=20, concurrency=4,
+                                    db_latency_ms=0, db_pool=2)
+        threaded = results['serving']['threaded']
+        self.assertEqual(threaded['errors'], 0)
+        self.assertGreater(threaded['requests_per_s'], 0)
+        self.assertIn('gevent', results['serving'])
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import benchmark
+import config
+from app import create_app, compile_templates
+
+
+class StartupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.testing = config.config['testing']
+        self.saved = (self.testing.FLASKY_LAZY_INIT,
+                      self.testing.FLASKY_TEMPLATE_CACHE_DIR)
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        (self.testing.FLASKY_LAZY_INIT,
+         self.testing.FLASKY_TEMPLATE_CACHE_DIR) = self.saved
+        shutil.rmtree(self.cache_dir)
+
+    def test_lazy_init(self):
+        self.testing.FLASKY_LAZY_INIT = True
+        app = create_app('testing')
+        self.assertNotIn('jobs', app.extensions)
+        self.assertNotIn('main', app.blueprints)
+        response = app.test_client().get('/auth/login')    # 第一个请求时完成初始化
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('jobs', app.extensions)
+        self.assertIn('main', app.blueprints)
+
+    def test_lazy_init_runs_once(self):
+        self.testing.FLASKY_LAZY_INIT = True
+        app = create_app('testing')
+        calls = []
+        ready = []
+        setup = app._setup
+
+        def counted(app):
+            calls.append(1)
+            with app.app_context():             # 初始化过程中再次创建上下文不会死锁
+                pass
+            setup(app)
+        app.defer(counted)
+
+        def use():
+            with app.app_context():
+                ready.append('api' in app.blueprints)
+        threads = [threading.Thread(target=use) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with app.app_context():
+            pass
+        self.assertEqual(calls, [1])
+        self.assertEqual(ready, [True] * 4)
+
+    def test_eager_init(self):
+        self.testing.FLASKY_LAZY_INIT = False
+        app = create_app('testing')
+        self.assertIn('jobs', app.extensions)
+        self.assertIn('main', app.blueprints)
+
+    def test_template_bytecode_cache(self):
+        self.testing.FLASKY_TEMPLATE_CACHE_DIR = self.cache_dir
+        app = create_app('testing')
+        self.assertGreater(compile_templates(app), 10)
+        cached = os.listdir(self.cache_dir)
+        self.assertGreater(len(cached), 10)
+
+        app = create_app('testing')             # 新应用从缓存加载，不再写入
+        response = app.test_client().get('/auth/login')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), sorted(cached))
+
+    def test_startup_benchmark(self):
+        results = benchmark.startup(runs=1, modes=['eager', 'lazy-cached'])
+        self.assertEqual(sorted(results['startup']), ['eager', 'lazy-cached'])
+        lazy = results['startup']['lazy-cached']
+        self.assertLess(lazy['create_app_ms'],
+                        results['startup']['eager']['create_app_ms'])
+        self.assertGreater(lazy['process_ms'], lazy['import_ms'])
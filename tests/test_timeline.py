@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db
+from app.models import User, Role, Post, TimelineEntry
+
+
+class TimelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['FLASKY_FANOUT_FOLLOWER_LIMIT'] = 1
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.reader, self.author, self.star, self.fan = [
+            User(email='%s@example.com' % name, name=name, password='cat')
+            for name in ('reader', 'author', 'star', 'fan')]
+        db.session.add_all([self.reader, self.author, self.star, self.fan])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def post(self, author, body, minutes_ago):
+        post = Post(body=body, author=author,
+                    timestamp=datetime.utcnow() - timedelta(minutes=minutes_ago))
+        db.session.add(post)
+        db.session.commit()
+        return post
+
+    def bodies(self, pagination):
+        return [post.body for post in pagination.items]
+
+    def test_follow_and_fan_out(self):
+        self.post(self.author, 'old', 30)
+        self.reader.follow(self.author)
+        db.session.commit()
+        self.assertTrue(self.reader.is_following(self.author))
+        self.assertTrue(self.author.is_followed_by(self.reader))
+        self.assertEqual(self.author.followers_count, 1)
+        self.post(self.author, 'new', 10)       # 发文时写入粉丝时间线
+        self.post(self.fan, 'unfollowed', 5)
+        self.assertEqual(TimelineEntry.query.filter_by(
+            user_id=self.reader.id).count(), 2)
+        self.assertEqual(self.bodies(self.reader.followed_posts(10)),
+                         ['new', 'old'])
+        self.reader.unfollow(self.author)
+        db.session.commit()
+        self.assertEqual(self.author.followers_count, 0)
+        self.assertEqual(self.bodies(self.reader.followed_posts(10)), [])
+
+    def test_follow_and_post_in_one_flush(self):
+        self.reader.follow(self.author)         # 关注与发文在同一次提交中
+        db.session.add_all([Post(body='post %d' % i, author=self.author)
+                            for i in range(5)])
+        db.session.commit()
+        self.assertEqual(TimelineEntry.query.filter_by(
+            user_id=self.reader.id).count(), 5)
+        db.session.delete(Post.query.first())
+        db.session.commit()
+        self.assertEqual(TimelineEntry.query.count(), 4)
+
+    def test_celebrity_merged_at_read_time(self):
+        self.reader.follow(self.star)
+        self.fan.follow(self.star)              # 粉丝数超过上限，不再写扩散
+        self.reader.follow(self.author)
+        db.session.commit()
+        self.post(self.star, 'star 1', 40)
+        self.post(self.author, 'author 1', 30)
+        self.post(self.star, 'star 2', 20)
+        self.post(self.author, 'author 2', 10)
+        self.assertEqual(TimelineEntry.query.filter_by(
+            user_id=self.reader.id).count(), 2)
+        first = self.reader.followed_posts(3)
+        self.assertEqual(self.bodies(first), ['author 2', 'star 2', 'author 1'])
+        self.assertTrue(first.has_next)
+        second = self.reader.followed_posts(3, before=first.next_cursor)
+        self.assertEqual(self.bodies(second), ['star 1'])
+        self.assertFalse(second.has_next)
+        back = self.reader.followed_posts(1, after=second.prev_cursor)
+        self.assertEqual(self.bodies(back), ['author 1'])
+
+    def test_followed_tab(self):
+        self.post(self.author, 'followed post', 10)
+        self.post(self.fan, 'other post', 5)
+        client = self.app.test_client()
+        client.post('/auth/login', data={'email': 'reader@example.com',
+                                         'password': 'cat'})
+        client.get('/follow/author')
+        client.get('/followed')
+        data = client.get('/').get_data(as_text=True)
+        self.assertIn('followed post', data)
+        self.assertNotIn('other post', data)
+        client.get('/all')
+        self.assertIn('other post', client.get('/').get_data(as_text=True))
+
+    def test_pulled_posts_kept_below_limit(self):
+        self.reader.follow(self.star)
+        self.fan.follow(self.star)              # 粉丝数超过上限，不再写扩散
+        db.session.commit()
+        self.post(self.star, 'pulled', 20)
+        self.fan.unfollow(self.star)            # 粉丝数回落，之后的文章重新推送
+        db.session.commit()
+        self.post(self.star, 'pushed', 10)
+        self.assertEqual(self.bodies(self.reader.followed_posts(10)),
+                         ['pushed', 'pulled'])
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+import config
+from app import create_app, db, archive
+from app.models import User, Role, Post, ArchivedPost, Follow
+from app.transfer import export_data, import_data
+
+
+class TransferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def round_trip(self, fmt):
+        john = User(email='john@example.com', name=u'约翰', password='cat',
+                    about_me='')
+        susan = User(email='susan@example.com', name='susan', password='cat')
+        db.session.add_all([john, susan])
+        db.session.commit()
+        john.follow(susan)
+        db.session.add_all([Post(body='line one\nline "two", three',
+                                 author=susan) for _ in range(5)])
+        db.session.commit()
+        snapshot = [(u.id, u.name, u.about_me, u.location, u.member_since,
+                     u.password_hash, u.role_id, u.followers_count)
+                    for u in User.query.order_by(User.id)]
+        posts = [(p.id, p.body, p.body_html, p.timestamp, p.author_id)
+                 for p in Post.query.order_by(Post.id)]
+        progress = list(export_data(self.directory, fmt, batch_size=2))
+        self.assertIn(('posts', 4), [(t, c) for t, c, rate in progress])
+        self.assertIn(('posts', 5), [(t, c) for t, c, rate in progress])
+        self.assertTrue(os.path.exists(
+            os.path.join(self.directory, 'users.%s' % fmt)))
+
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        list(import_data(self.directory, fmt, batch_size=2))
+        self.assertEqual(snapshot, [
+            (u.id, u.name, u.about_me, u.location, u.member_since,
+             u.password_hash, u.role_id, u.followers_count)
+            for u in User.query.order_by(User.id)])
+        self.assertEqual(posts, [
+            (p.id, p.body, p.body_html, p.timestamp, p.author_id)
+            for p in Post.query.order_by(Post.id)])
+        self.assertEqual(Follow.query.count(), 1)
+        self.assertTrue(Role.query.filter_by(default=True).first().default)
+        user = User.query.filter_by(name=u'约翰').first()
+        self.assertTrue(user.verify_password('cat'))
+        self.assertEqual(len(user.followed_posts(10).items), 5)
+
+    def test_ndjson(self):
+        self.round_trip('ndjson')
+
+    def test_csv(self):
+        self.round_trip('csv')
+
+    def test_selected_tables(self):
+        list(export_data(self.directory, tables=['roles']))
+        self.assertEqual(os.listdir(self.directory), ['roles.ndjson'])
+
+
+class ArchiveTransferTestCase(unittest.TestCase):
+    def setUp(self):
+        class ArchiveTestingConfig(config.TestingConfig):
+            FLASKY_ARCHIVE_AFTER_DAYS = 30
+        config.config['testing-archive'] = ArchiveTestingConfig
+        self.app = create_app('testing-archive')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        del config.config['testing-archive']
+        shutil.rmtree(self.directory)
+
+    def test_archived_posts_round_trip(self):
+        susan = User(email='susan@example.com', name='susan', password='cat')
+        db.session.add(susan)
+        db.session.commit()
+        old = datetime.utcnow() - timedelta(days=60)
+        db.session.add_all([Post(body='old %d' % i, author=susan, timestamp=old)
+                            for i in range(3)])
+        db.session.add(Post(body='new', author=susan))
+        db.session.commit()
+        list(archive.archive_posts())
+        list(export_data(self.directory))
+        self.assertTrue(os.path.exists(
+            os.path.join(self.directory, 'posts_archive.ndjson')))
+
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+        list(import_data(self.directory))
+        self.assertEqual(sorted(p.body for p in ArchivedPost.query),
+                         ['old 0', 'old 1', 'old 2'])
+        self.assertEqual(Post.query.count(), 1)
+        self.assertEqual(User.query.filter_by(name='susan').first().post_count,
+                         4)
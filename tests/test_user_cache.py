@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from app import create_app, db, user_cache
+from app.models import User, Role
+
+
+class UserCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(email='john@example.com', name='john',
+                         password='cat')
+        db.session.add(self.user)
+        db.session.commit()
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'email': 'john@example.com',
+                                              'password': 'cat'})
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_hits_and_misses(self):
+        self.client.get('/')
+        self.client.get('/')
+        stats = user_cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+
+    def test_profile_edit_invalidates(self):
+        self.client.get('/')
+        self.client.post('/edit-profile', data={'name': 'johnny',
+                                                'location': 'Beijing',
+                                                'about_me': ''})
+        response = self.client.get('/')
+        self.assertIn(b'Hello,johnny', response.data)
+        self.assertEqual(user_cache.stats()['misses'], 2)
+
+    def test_logout_invalidates(self):
+        self.client.get('/')
+        self.client.get('/auth/logout')
+        self.assertIsNone(
+            self.app.extensions['user_cache'].store.get(self.user.id))
+
+    def test_invalidated_after_commit(self):
+        self.client.get('/')
+        store = self.app.extensions['user_cache'].store
+        user = User.query.get(self.user.id)
+        user.name = 'johnny'
+        db.session.flush()                      # 提交前其他请求仍读到旧数据，缓存不动
+        self.assertIsNotNone(store.get(self.user.id))
+        db.session.rollback()
+        self.assertIsNotNone(store.get(self.user.id))
+        user = User.query.get(self.user.id)
+        user.name = 'johnny'
+        db.session.commit()
+        self.assertIsNone(store.get(self.user.id))
@@ -3,10 +3,100 @@ __author__ = "WES"
 
 import unittest
 from app import create_app, db
-from app.models import User, AnonymousUser, Role, Permission
+from app.models import User, AnonymousUser, Role, Permission, role_permissions
+from app.passwords import _Hasher
+from .helpers import QueryCountMixin
 
 
-class UserModelTestCase(unittest.TestCase):
+class UserModelTestCase(QueryCountMixin, unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
     def test_anonymous_user(self):
         u = AnonymousUser()
         self.assertFalse(u.can(Permission.FOLLOW))
+
+    def test_user_role(self):
+        u = User(email='john@example.com', password='cat')
+        self.assertTrue(u.can(Permission.WRITE))
+        self.assertFalse(u.can(Permission.MODERATE))
+        db.session.add(u)
+        db.session.commit()
+        self.assertTrue(u.can(Permission.WRITE))
+        self.assertFalse(u.is_administrator())
+
+    def test_permission_check_without_queries(self):
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        u = User.query.get(u.id)
+        u.can(Permission.WRITE)                 # 首次检查加载权限表
+        with self.assertMaxQueries(0):
+            self.assertTrue(u.can(Permission.COMMENT))
+            self.assertFalse(u.can(Permission.ADMIN))
+
+    def test_role_change_refreshes_table(self):
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        self.assertFalse(u.can(Permission.MODERATE))
+        role = Role.query.filter_by(name='User').first()
+        role.add_permission(Permission.MODERATE)
+        db.session.commit()
+        self.assertTrue(u.can(Permission.MODERATE))
+
+    def test_table_invalidated_after_commit(self):
+        role_permissions.load()
+        role = Role.query.filter_by(name='User').first()
+        role.add_permission(Permission.MODERATE)
+        db.session.flush()                      # 提交前其他请求仍读到旧权限，权限表不动
+        self.assertIsNotNone(role_permissions._table)
+        db.session.rollback()
+        self.assertIsNotNone(role_permissions._table)
+        role = Role.query.filter_by(name='User').first()
+        role.add_permission(Permission.MODERATE)
+        db.session.commit()
+        self.assertIsNone(role_permissions._table)
+
+    def test_unknown_role_loaded_once(self):
+        role_permissions.get(None)              # 首次检查加载权限表
+        with self.assertMaxQueries(1):
+            self.assertIsNone(role_permissions.get(999))
+            self.assertIsNone(role_permissions.get(999))
+
+    def test_password_verification(self):
+        u = User(password='cat')
+        self.assertTrue(u.password_hash.startswith('pbkdf2:sha256:1$'))
+        self.assertTrue(u.verify_password('cat'))
+        self.assertFalse(u.verify_password('dog'))
+        with self.assertRaises(AttributeError):
+            u.password
+
+    def test_password_salts_are_random(self):
+        u = User(password='cat')
+        u2 = User(password='cat')
+        self.assertTrue(u.password_hash != u2.password_hash)
+
+    def test_rehash_on_login(self):
+        u = User(email='john@example.com', password='cat')
+        db.session.add(u)
+        db.session.commit()
+        self.app.extensions['password_hasher'] = hasher = _Hasher(
+            'pbkdf2:sha256:2', 8, 1)            # 提高代价，并在线程池中计算
+        self.assertFalse(u.verify_password('dog'))
+        self.assertTrue(u.password_hash.startswith('pbkdf2:sha256:1$'))
+        self.app.test_client().post('/auth/login', data={
+            'email': 'john@example.com', 'password': 'cat'})
+        u = User.query.filter_by(email='john@example.com').first()
+        self.assertTrue(u.password_hash.startswith('pbkdf2:sha256:2$'))
+        self.assertFalse(hasher.needs_rehash(u.password_hash))
+        self.assertTrue(u.verify_password('cat'))